@@ -0,0 +1,195 @@
+from atlasapi.specs import AtlasGranularities
+from typing import Dict, List, Optional, Iterable, Tuple
+import isodate
+import numpy as np
+import warnings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Reducers taking no argument. Percentiles are written as p<percentile> (p50, p95, p99 ...) and time above a
+# threshold as above_<threshold> (above_80 is the number of seconds the metric was above 80).
+REDUCERS = ['mean', 'min', 'max', 'stddev', 'trend']
+PERCENTILE_PREFIX = 'p'
+THRESHOLD_PREFIX = 'above_'
+
+
+def parse_reducer(reducer: str) -> Tuple[str, Optional[float]]:
+    """Splits a reducer name into its kind and argument, e.g. 'p95' into ('percentile', 95.0).
+
+    :raises ValueError: If the reducer is unknown.
+    """
+    if reducer in REDUCERS:
+        return reducer, None
+    try:
+        if reducer.startswith(THRESHOLD_PREFIX):
+            return 'above', float(reducer[len(THRESHOLD_PREFIX):])
+        if reducer.startswith(PERCENTILE_PREFIX):
+            percentile = float(reducer[len(PERCENTILE_PREFIX):])
+            if 0 <= percentile <= 100:
+                return 'percentile', percentile
+    except ValueError:
+        pass
+    raise ValueError(f'Unknown reducer {reducer}, use one of {REDUCERS}, p<percentile> or above_<threshold>')
+
+
+def stack_series(measurements: List) -> Tuple[np.ndarray, np.ndarray]:
+    """Stacks the series of several hosts into two (hosts, points) matrices.
+
+    :param measurements: CompactMeasurement objects, None for a host without the series, or a list of the series
+        of several hosts (e.g. the shard primaries of a cluster) whose points are pooled in a single row.
+    :return: The timestamps in seconds and the values, both padded with NaN.
+    """
+    rows = [[each for each in (entry if isinstance(entry, list) else [entry])
+             if each is not None and each.measurements_count] for entry in measurements]
+    width = max([sum(each.measurements_count for each in row) for row in rows] or [0])
+    seconds = np.full((len(measurements), width), np.nan)
+    values = np.full((len(measurements), width), np.nan)
+    for row, each_row in enumerate(rows):
+        position = 0
+        for each in each_row:
+            end = position + each.measurements_count
+            seconds[row, position:end] = each.timestamps.astype('int64')
+            values[row, position:end] = each.values
+            position = end
+    return seconds, values
+
+
+def trend(seconds: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Least squares slope of every row, in units per hour."""
+    valid = np.isfinite(values) & np.isfinite(seconds)
+    count = valid.sum(axis=1)
+    hours = np.where(valid, seconds / 3600.0, 0.0)
+    values = np.where(valid, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hours_mean = hours.sum(axis=1) / count
+        values_mean = values.sum(axis=1) / count
+        hours_delta = np.where(valid, hours - hours_mean[:, None], 0.0)
+        slope = (hours_delta * (values - values_mean[:, None])).sum(axis=1) / (hours_delta ** 2).sum(axis=1)
+    return np.where(count > 1, slope, np.nan)
+
+
+class Aggregator:
+    def __init__(self, reducers: Dict[str, List[str]]):
+        """Reduces the series of many hosts to report columns, one NumPy pass per metric.
+
+        Unlike the mean column of the report, which follows atlasapi in skipping zero values, reducers only skip
+        missing points. The points of several hosts, e.g. the shard primaries of a sharded cluster, can be reduced
+        together: above_<threshold> then adds up the seconds of every host.
+
+        :param reducers: The reducers to apply, by measurement name, e.g.
+            {AtlasMeasurementTypes.Disk.Util.util: ['p95', 'max', 'above_80']}
+        """
+        for each_reducer in [reducer for reducer_list in reducers.values() for reducer in reducer_list]:
+            parse_reducer(each_reducer)
+        self.reducers = reducers
+
+    @staticmethod
+    def column(metric: str, reducer: str) -> str:
+        return f'{metric}_{reducer}'
+
+    @property
+    def columns(self) -> List[str]:
+        return [self.column(metric, reducer) for metric, reducer_list in self.reducers.items()
+                for reducer in reducer_list]
+
+    @property
+    def metrics(self) -> List[str]:
+        return list(self.reducers)
+
+    def reduce(self, metric: str, measurements: List, granularity: AtlasGranularities) -> Dict[str, np.ndarray]:
+        """Applies the reducers of a single metric to its stacked series.
+
+        :param metric: The measurement name.
+        :param measurements: The series of each host, None for a host without it.
+        :param granularity: The granularity of the series, used to turn point counts into seconds.
+        :return: An array of results, one per host, by reducer.
+        """
+        seconds, values = stack_series(measurements)
+        reducer_list = self.reducers.get(metric, [])
+        has_data = np.isfinite(values).any(axis=1)
+        results = {}
+        percentiles = {reducer: argument for reducer, (kind, argument) in
+                       zip(reducer_list, map(parse_reducer, reducer_list)) if kind == 'percentile'}
+        with warnings.catch_warnings():
+            # All-NaN rows, i.e. hosts without the series, are reported as NaN.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            if percentiles and values.shape[1]:
+                computed = np.nanpercentile(values, list(percentiles.values()), axis=1)
+                results.update(zip(percentiles, computed))
+            for each_reducer in reducer_list:
+                kind, argument = parse_reducer(each_reducer)
+                if not values.shape[1]:
+                    results[each_reducer] = np.full(len(measurements), np.nan)
+                elif kind == 'mean':
+                    results[each_reducer] = np.nanmean(values, axis=1)
+                elif kind == 'min':
+                    results[each_reducer] = np.nanmin(values, axis=1)
+                elif kind == 'max':
+                    results[each_reducer] = np.nanmax(values, axis=1)
+                elif kind == 'stddev':
+                    results[each_reducer] = np.nanstd(values, axis=1)
+                elif kind == 'trend':
+                    results[each_reducer] = trend(seconds, values)
+                elif kind == 'above':
+                    point_seconds = isodate.parse_duration(granularity).total_seconds()
+                    above = (values > argument).sum(axis=1) * point_seconds
+                    results[each_reducer] = np.where(has_data, above, np.nan)
+        return results
+
+    def apply(self, host_data_list: List, granularity: AtlasGranularities) -> List[Dict[str, Optional[float]]]:
+        """Computes the aggregate columns for several hosts.
+
+        :param host_data_list: HostData objects holding the data points of the aggregated metrics, None for a
+            cluster without a primary, or a list of the HostData of every shard primary of a cluster, reduced
+            together.
+        :param granularity: The granularity of the series.
+        :return: The columns of each host, None where a host has no data points for the metric.
+        """
+        rows = [dict() for _ in host_data_list]
+        for each_metric, reducer_list in self.reducers.items():
+            measurements = [[host.metric(each_metric) for host in each] if isinstance(each, list) else
+                            each.metric(each_metric) if each is not None else None for each in host_data_list]
+            results = self.reduce(each_metric, measurements, granularity)
+            for each_reducer in reducer_list:
+                column = self.column(each_metric, each_reducer)
+                for row, each_value in zip(rows, results[each_reducer].tolist()):
+                    row[column] = None if each_value != each_value else each_value
+        return rows
+
+
+def aggregate_rows(results: Iterable[Tuple[dict, Optional[object]]], aggregator: Aggregator,
+                   granularity: AtlasGranularities, batch_size: int = 20) -> Iterable[dict]:
+    """Adds aggregate columns to report rows, reducing `batch_size` hosts at a time.
+
+    The data points of each batch are released once it is reduced. Every row gets every aggregate column, None
+    for a cluster without data points.
+
+    :param results: (report row, HostData, list of the HostData of every shard primary, or None) pairs.
+    :param aggregator: The Aggregator to apply.
+    :param granularity: The granularity of the series.
+    :param batch_size: Clusters whose series are held in memory and reduced together.
+    """
+    batch = []
+    for each in results:
+        batch.append(each)
+        if len(batch) >= batch_size:
+            yield from _aggregate_batch(batch, aggregator, granularity)
+            batch = []
+    if batch:
+        yield from _aggregate_batch(batch, aggregator, granularity)
+
+
+def _aggregate_batch(batch: List[Tuple[dict, Optional[object]]], aggregator: Aggregator,
+                     granularity: AtlasGranularities) -> Iterable[dict]:
+    host_data_list = [host_data for _, host_data in batch]
+    for (row, host_data), columns in zip(batch, aggregator.apply(host_data_list, granularity)):
+        for each_host in (host_data if isinstance(host_data, list) else [host_data]):
+            if each_host is None:
+                continue
+            for each_metric in aggregator.metrics:
+                measurement = each_host.metric(each_metric)
+                if measurement is not None:
+                    measurement.drop_points()
+        row.update(columns)
+        yield row
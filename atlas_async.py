@@ -0,0 +1,289 @@
+from atlasapi.settings import Settings
+from atlasapi.network import Network
+from atlasapi.specs import Host, AtlasPeriods, AtlasGranularities
+from atlas_lib import HostInventory, HostData, ClusterData, NamespaceStats, NamespaceCounter, CompactMeasurement, \
+    METRICS, SYSTEM_DATABASES, measurements_from_response, report_row
+from atlas_ratelimit import TOO_MANY_REQUESTS
+from typing import List, Optional, AsyncIterator, Dict
+from collections import OrderedDict
+import asyncio
+import random
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAtlasClient:
+    def __init__(self, user: str, password: str, group: str, base_url: str = Settings.BASE_URL,
+                 concurrency: int = 10, max_connections: int = 20, timeout: float = Settings.requests_timeout,
+                 max_retries: int = 5, backoff: float = 2.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """Async Atlas API client over a pooled keep-alive HTTP connection.
+
+        :param user: Atlas API public key
+        :param password: Atlas API private key
+        :param group: The Atlas group (project) id
+        :param base_url: The Atlas API base url
+        :param concurrency: Maximum requests in flight at the same time.
+        :param max_connections: Size of the HTTP connection pool.
+        :param timeout: Per-request timeout in seconds.
+        :param max_retries: Retries of a single request answered with 429.
+        :param backoff: Initial backoff in seconds after a 429, doubled for each retry.
+        :param transport: An httpx transport to send the requests through, e.g. an httpx.MockTransport in tests.
+        """
+        self.group = group
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client = httpx.AsyncClient(base_url=base_url, auth=httpx.DigestAuth(user, password),
+                                        timeout=httpx.Timeout(timeout), follow_redirects=True, transport=transport,
+                                        limits=httpx.Limits(max_connections=max_connections,
+                                                            max_keepalive_connections=max_connections))
+        # Maps HTTP errors to the same exceptions the blocking atlasapi client raises.
+        self._answer = Network(user, password).answer
+
+    async def get(self, uri: str, params: Optional[dict] = None) -> dict:
+        """GETs an Atlas API uri, retrying with backoff while Atlas answers 429."""
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                response = await self.client.get(uri, params=params)
+            if response.status_code != TOO_MANY_REQUESTS or attempt >= self.max_retries:
+                return self._answer(response.status_code, response.json())
+            try:
+                delay = float(response.headers['Retry-After'])
+            except (KeyError, ValueError):
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+            attempt += 1
+            logger.warning(f'Atlas answered 429, retry {attempt}/{self.max_retries} in {delay:.1f} seconds')
+            await asyncio.sleep(delay)
+
+    async def get_all(self, uri: str, params: Optional[dict] = None) -> AsyncIterator[dict]:
+        """Yields every result of a paginated Atlas API resource."""
+        page_num = 1
+        seen = 0
+        while True:
+            page_params = dict(params or {}, pageNum=page_num, itemsPerPage=Settings.itemsPerPage)
+            details = await self.get(uri, params=page_params)
+            results = details.get('results', [])
+            for each in results:
+                yield each
+            seen += len(results)
+            if not results or seen >= details.get('totalCount', 0):
+                return
+            page_num += 1
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> 'AsyncAtlasClient':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+
+class AsyncHostInventory(HostInventory):
+    def __init__(self, client: AsyncAtlasClient, ttl: Optional[float] = 300.0):
+        """HostInventory whose snapshot is fetched with an AsyncAtlasClient.
+
+        Lookups never block on the network, `ensure_fresh()` must be awaited before them.
+
+        :param client: The AsyncAtlasClient
+        :param ttl: Maximum age of the snapshot in seconds (default = 300)
+        """
+        super().__init__(None, ttl=ttl)
+        self.client = client
+        self._async_lock = asyncio.Lock()
+
+    async def refresh_async(self) -> None:
+        uri = f'{Settings.URI_STUB}/groups/{self.client.group}/processes'
+        self.load([Host(each) async for each in self.client.get_all(uri)])
+
+    async def ensure_fresh(self) -> None:
+        if self.is_stale:
+            async with self._async_lock:
+                if self.is_stale:
+                    await self.refresh_async()
+
+    def _index(self):
+        return self._by_cluster
+
+
+class AsyncHostData(HostData):
+    __slots__ = ()
+
+    async def store_measurements(self, client: AsyncAtlasClient,
+                                 granularity: AtlasGranularities = AtlasGranularities.FIVE_MINUTE,
+                                 period=AtlasPeriods.WEEKS_1) -> None:
+        """Stores measurements from the API to the HostData object.
+
+        The batched METRICS request and the data partition request run concurrently. Failures are recorded in
+        `errors` as in HostData.store_measurements.
+
+        :param client: The AsyncAtlasClient
+        :param granularity:
+        :param period:
+        """
+        self.errors = {}
+        granularity = granularity or AtlasGranularities.HOUR
+        period = period or AtlasPeriods.WEEKS_1
+        process = f'{Settings.URI_STUB}/groups/{self.host_obj.group_id}/processes/' \
+                  f'{self.host_obj.hostname}:{self.host_obj.port}'
+        host_params = [('granularity', granularity), ('period', period)] + [('m', each) for each in METRICS]
+        disk_params = {'granularity': granularity, 'period': period}
+        host_result, disk_result = await asyncio.gather(
+            client.get(f'{process}/measurements', params=host_params),
+            client.get(f'{process}/disks/data/measurements', params=disk_params),
+            return_exceptions=True)
+
+        if isinstance(host_result, Exception):
+            logger.warning(f'Could not get measurements for {self.host_obj.hostname}: {host_result}')
+            for each_measurement in METRICS:
+                self.errors[each_measurement] = host_result
+        else:
+            for each_result in measurements_from_response(host_result, granularity=granularity, period=period):
+                self.store_measurement(each_result)
+        if isinstance(disk_result, Exception):
+            logger.warning(f'Could not get disk measurements for {self.host_obj.hostname}: {disk_result}')
+            self.errors['disk'] = disk_result
+        else:
+            for each_result in measurements_from_response(disk_result, granularity=granularity, period=period):
+                self.store_measurement(each_result)
+
+
+class AsyncClusterData(ClusterData):
+    """ClusterData whose API methods are coroutines taking an AsyncAtlasClient instead of an Atlas object.
+
+    Must be created with an AsyncHostInventory.
+    """
+
+    async def hosts(self, client: AsyncAtlasClient) -> List[Host]:
+        await self._inventory.ensure_fresh()
+        return self._inventory.hosts(self.name)
+
+    async def primary(self, client: AsyncAtlasClient) -> Optional[Host]:
+        await self._inventory.ensure_fresh()
+        return self._inventory.primary(self.name)
+
+    async def _database_measurements(self, client: AsyncAtlasClient, primary: Host, database_name: str,
+                                     counter: NamespaceCounter) -> List[CompactMeasurement]:
+        uri = f'{Settings.URI_STUB}/groups/{primary.group_id}/processes/{primary.hostname}:{primary.port}/' \
+              f'databases/{database_name}/measurements'
+        params = dict(counter.params, itemsPerPage=Settings.itemsPerPage)
+        response = await client.get(uri, params=params)
+        return list(measurements_from_response(response, granularity=counter.granularity, period=counter.period))
+
+    async def _databases(self, client: AsyncAtlasClient, primary: Host) -> List[str]:
+        uri = f'{Settings.URI_STUB}/groups/{primary.group_id}/processes/{primary.hostname}:{primary.port}/databases'
+        response = await client.get(uri)
+        return [each.get('databaseName') for each in response.get('results', [])
+                if each.get('databaseName') not in SYSTEM_DATABASES]
+
+    async def namespace_stats(self, client: AsyncAtlasClient) -> Optional[NamespaceStats]:
+        """Returns namespace counts for all userland databases, fetching the databases concurrently.
+
+        Follows the namespace counter of the cluster, except for max_seconds: the databases are requested at once.
+        As in ClusterData.namespace_stats, a sharded cluster is counted on every shard primary.
+        """
+        await self._inventory.ensure_fresh()
+        primaries = self._inventory.shard_primaries(self.name)
+        if not primaries:
+            return None
+        counter = self._namespace_counter or NamespaceCounter()
+        listed = await asyncio.gather(*[self._databases(client, each) for each in primaries.values()])
+        shard_databases = OrderedDict(zip(primaries, listed))
+        databases = list(OrderedDict.fromkeys(each for names in listed for each in names))
+        if not counter.counters:
+            return counter.stats(len(databases), [{} for _ in databases])
+        ordered = counter.order(self.id, databases)
+        if counter.max_databases is not None:
+            ordered = ordered[:counter.max_databases]
+
+        async def measure(database_name: str) -> Dict[str, float]:
+            measured = await asyncio.gather(*[self._database_measurements(client, primaries[shard], database_name,
+                                                                          counter)
+                                              for shard, names in shard_databases.items() if database_name in names])
+            return counter.combine([counter.database_counts(each) for each in measured])
+
+        return counter.stats(len(databases), await asyncio.gather(*[measure(each) for each in ordered]))
+
+    async def primary_metrics(self, client: AsyncAtlasClient, granularity: AtlasGranularities = None,
+                              period: AtlasPeriods = None) -> Optional[AsyncHostData]:
+        primary = await self.primary(client)
+        if not primary:
+            return None
+        logger.info(f'The primary is {primary.hostname_alias}')
+        host_data = AsyncHostData(primary, keep_points=False)
+        await host_data.store_measurements(client, granularity=granularity, period=period)
+        return host_data
+
+    async def shard_metrics(self, client: AsyncAtlasClient, granularity: AtlasGranularities = None,
+                            period: AtlasPeriods = None) -> Dict[str, AsyncHostData]:
+        """Returns the metrics of the primary of every shard by replica set name, fetching the shards concurrently.
+
+        As in ClusterData.shard_metrics, a replica set cluster returns its primary only.
+        """
+        await self._inventory.ensure_fresh()
+        shard_data = OrderedDict((name, AsyncHostData(each, keep_points=False))
+                                 for name, each in self._inventory.shard_primaries(self.name).items())
+        await asyncio.gather(*[each.store_measurements(client, granularity=granularity, period=period)
+                               for each in shard_data.values()])
+        return shard_data
+
+
+class AsyncFleet:
+    def __init__(self, client: AsyncAtlasClient, host_ttl: Optional[float] = 300.0):
+        """asyncio counterpart of Fleet.
+
+        Clusters are fetched concurrently, bounded by the client's concurrency semaphore, and produce the same rows
+        as Fleet.get_full_report_primary_metrics.
+
+        :param client: The AsyncAtlasClient, holding the project (group) to report on.
+        :param host_ttl: Seconds before the shared host inventory is re-fetched, None to never expire it.
+        """
+        self.client = client
+        self.inventory = AsyncHostInventory(client, ttl=host_ttl)
+        self._project_name: Optional[str] = None
+
+    async def project_name(self) -> str:
+        if self._project_name is None:
+            project = await self.client.get(f'{Settings.URI_STUB}/groups/{self.client.group}')
+            self._project_name = project.get('name')
+        return self._project_name
+
+    async def clusters_list(self) -> AsyncIterator[AsyncClusterData]:
+        """Yields all clusters of the project."""
+        project_name = await self.project_name()
+        async for each in self.client.get_all(f'{Settings.URI_STUB}/groups/{self.client.group}/clusters'):
+            yield AsyncClusterData.from_dict(each, project_name, self.client.group, inventory=self.inventory)
+
+    async def _cluster_report(self, each_cluster: AsyncClusterData, granularity: AtlasGranularities,
+                              period: AtlasPeriods) -> OrderedDict:
+        shard_data, namespace_stats = await asyncio.gather(
+            each_cluster.shard_metrics(self.client, granularity=granularity, period=period),
+            each_cluster.namespace_stats(self.client))
+        host_data = next(iter(shard_data.values()), None)
+        return report_row(each_cluster, host_data, namespace_stats, granularity, period, shard_data=shard_data)
+
+    async def report(self, granularity: AtlasGranularities = None, period: AtlasPeriods = None,
+                     ordered: bool = True) -> AsyncIterator[Dict]:
+        """Yields a report row for every cluster, as Fleet.get_full_report_primary_metrics does.
+
+        :param granularity: The granularity for the metrics. (default = 10 seconds)
+        :param period : The period for metrics. (default = 24 hours)
+        :param ordered: Yield rows in cluster order (default), or as soon as each cluster completes if False.
+        """
+        granularity = granularity or AtlasGranularities.TEN_SECOND
+        period = period or AtlasPeriods.HOURS_24
+
+        await self.inventory.refresh_async()
+        tasks = [asyncio.ensure_future(self._cluster_report(each_cluster, granularity, period))
+                 async for each_cluster in self.clusters_list()]
+        try:
+            for each_task in (tasks if ordered else asyncio.as_completed(tasks)):
+                yield await each_task
+        finally:
+            for each_task in tasks:
+                each_task.cancel()
@@ -0,0 +1,388 @@
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from typing import Optional, Callable, Any, Dict, Collection, List, Tuple
+from collections import OrderedDict
+from datetime import datetime, timezone
+import isodate
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+ATLAS_TIMESTAMP = '%Y-%m-%dT%H:%M:%SZ'
+
+
+class MeasurementCacheMiss(LookupError):
+    """Raised in offline mode when a response was never cached."""
+
+
+class MeasurementCache:
+    def __init__(self, path: str = 'atlas_cache.sqlite', ttl: float = 3600.0, max_bytes: int = 512 * 1024 ** 2,
+                 offline: bool = False):
+        """Persistent SQLite cache of Atlas API responses.
+
+        Entries are keyed by (host, measurement, granularity, period, window), where the window is the current
+        time aligned to the ttl, or to the granularity if it is longer, so a series of a coarse granularity is only
+        re-downloaded once Atlas can have a new data point for it, while fine-grained series (e.g. TEN_SECOND) are
+        reused for up to `ttl` seconds. Entries older than `ttl` seconds are ignored, and the oldest entries are
+        evicted once the cache grows beyond `max_bytes`.
+
+        In offline mode nothing is fetched: the most recent entry of each key is replayed whatever its age, and
+        a missing entry raises MeasurementCacheMiss.
+
+        :param path: The SQLite file, ':memory:' for a process local cache.
+        :param ttl: Maximum age of an entry in seconds (default = 1 hour)
+        :param max_bytes: Maximum compressed size of all entries (default = 512MB)
+        :param offline: Replay from the cache only, never calling the API.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS entries (host TEXT, measurement TEXT, granularity TEXT, '
+                           'period TEXT, window INTEGER, stored_at REAL, size INTEGER, payload BLOB, '
+                           'PRIMARY KEY (host, measurement, granularity, period, window))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at)')
+        self._conn.commit()
+
+    def window(self, granularity: Optional[AtlasGranularities], now: Optional[float] = None) -> int:
+        """Returns the number of the time window `now` falls into, windows span the ttl or the granularity."""
+        seconds = max(isodate.parse_duration(granularity or AtlasGranularities.HOUR).total_seconds(), self.ttl)
+        return int((now or time.time()) // seconds)
+
+    def get(self, host: str, measurement: str, granularity: Optional[AtlasGranularities] = None,
+            period: Optional[AtlasPeriods] = None) -> Optional[Any]:
+        """Returns the cached payload, or None if there is no fresh entry.
+
+        :raises MeasurementCacheMiss: In offline mode, if the key was never cached.
+        """
+        with self._lock:
+            if self.offline:
+                row = self._conn.execute('SELECT payload FROM entries WHERE host=? AND measurement=? AND '
+                                         'granularity=? AND period=? ORDER BY stored_at DESC LIMIT 1',
+                                         (host, measurement, granularity or '', period or '')).fetchone()
+            else:
+                row = self._conn.execute('SELECT payload FROM entries WHERE host=? AND measurement=? AND '
+                                         'granularity=? AND period=? AND window=? AND stored_at>=?',
+                                         (host, measurement, granularity or '', period or '',
+                                          self.window(granularity), time.time() - self.ttl)).fetchone()
+        if row is None:
+            if self.offline:
+                raise MeasurementCacheMiss(f'{measurement} for {host} ({granularity}, {period}) is not cached')
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, host: str, measurement: str, granularity: Optional[AtlasGranularities],
+            period: Optional[AtlasPeriods], payload: Any) -> None:
+        """Stores a JSON-able payload, evicting the oldest entries if the cache grows beyond max_bytes."""
+        blob = zlib.compress(json.dumps(payload).encode())
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (host, measurement, granularity or '', period or '', self.window(granularity, now),
+                                now, len(blob), blob))
+            self._evict(now)
+            self._conn.commit()
+
+    def cached(self, host: str, measurement: str, granularity: Optional[AtlasGranularities],
+               period: Optional[AtlasPeriods], fetch: Callable[[], Any], reuse: bool = True) -> Any:
+        """Returns the cached payload for the key, calling `fetch` and storing its result on a miss.
+
+        :param reuse: If False a fresh entry is not reused online, the result is only stored for offline replay.
+        """
+        payload = self.get(host, measurement, granularity, period) if reuse or self.offline else None
+        if payload is None:
+            payload = fetch()
+            self.put(host, measurement, granularity, period, payload)
+        return payload
+
+    def _evict(self, now: float) -> None:
+        if not self.offline:
+            self._conn.execute('DELETE FROM entries WHERE stored_at < ?', (now - self.ttl,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for stored_at, size in self._conn.execute('SELECT stored_at, size FROM entries ORDER BY stored_at').fetchall():
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._conn.execute('DELETE FROM entries WHERE stored_at <= ?', (stored_at,))
+        logger.info(f'Evicted cache entries stored before {stored_at}')
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SeriesStore:
+    def __init__(self, path: str = 'atlas_series.sqlite'):
+        """Persistent SQLite store of measurement series, used for incremental measurement sync.
+
+        Keeps one series per (host, measurement, granularity) together with the last timestamp seen and the start
+        of the time range it covers, so that later runs only need to request the points after it. The points are
+        kept for the longest period requested, so runs over a short period do not cut the series of a longer one.
+
+        :param path: The SQLite file, ':memory:' for a process local store.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS series (host TEXT, measurement TEXT, granularity TEXT, '
+                           'units TEXT, last_timestamp TEXT, points BLOB, '
+                           'PRIMARY KEY (host, measurement, granularity))')
+        # Stores of earlier versions lack the coverage, their series are fetched again in full once.
+        columns = {each[1] for each in self._conn.execute('PRAGMA table_info(series)')}
+        for each_column, each_type in (('covered_since', 'TEXT'), ('retention', 'REAL')):
+            if each_column not in columns:
+                self._conn.execute(f'ALTER TABLE series ADD COLUMN {each_column} {each_type}')
+        self._conn.commit()
+
+    def last_timestamp(self, host: str, measurement: str, granularity: AtlasGranularities) -> Optional[str]:
+        """Returns the timestamp of the newest stored point, or None if nothing is stored."""
+        return self.coverage(host, measurement, granularity)[1]
+
+    def coverage(self, host: str, measurement: str,
+                 granularity: AtlasGranularities) -> Tuple[Optional[str], Optional[str]]:
+        """Returns the start of the time range the stored series covers and its newest timestamp, or Nones."""
+        with self._lock:
+            row = self._conn.execute('SELECT covered_since, last_timestamp FROM series WHERE host=? AND '
+                                     'measurement=? AND granularity=?', (host, measurement, granularity)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def merge(self, host: str, measurement: dict, granularity: AtlasGranularities, since: str,
+              start: Optional[str] = None) -> dict:
+        """Merges the data points of a raw API measurement into the stored series.
+
+        New points replace stored points with the same timestamp, since Atlas may still update the latest
+        interval. Points older than the longest period merged so far are dropped.
+
+        :param host: The host key.
+        :param measurement: A raw measurement of an API response, with name, units and dataPoints.
+        :param granularity:
+        :param since: ISO 8601 timestamp of the start of the reported period.
+        :param start: ISO 8601 timestamp of the start of the request the points come from, None if it is `since`.
+        :return: The merged measurement from `since` on, in the same raw format.
+        """
+        name = measurement.get('name')
+        start = start or since
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT points, covered_since, last_timestamp, retention FROM series WHERE '
+                                     'host=? AND measurement=? AND granularity=?',
+                                     (host, name, granularity)).fetchone()
+            points, covered, last, retention = row if row else (None, None, None, None)
+            points = {each['timestamp']: each for each in json.loads(zlib.decompress(points))} if points else {}
+            for each in measurement.get('dataPoints', []):
+                points[each['timestamp']] = each
+            # The stored points only extend the new ones if nothing is missing between them.
+            covered = min(covered, start) if covered and last and last >= start else start
+            retention = max(retention or 0.0, now - isodate.parse_datetime(since).timestamp())
+            covered = max(covered, datetime.fromtimestamp(now - retention, timezone.utc).strftime(ATLAS_TIMESTAMP))
+            kept = [points[each] for each in sorted(points) if each >= covered]
+            last = kept[-1]['timestamp'] if kept else None
+            self._conn.execute('INSERT OR REPLACE INTO series (host, measurement, granularity, units, '
+                               'last_timestamp, points, covered_since, retention) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (host, name, granularity, measurement.get('units'), last,
+                                zlib.compress(json.dumps(kept).encode()), covered, retention))
+            self._conn.commit()
+        return dict(name=name, units=measurement.get('units'),
+                    dataPoints=[each for each in kept if each['timestamp'] >= since])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ReportJournal:
+    def __init__(self, path: str = 'atlas_journal.sqlite', run_id: str = 'default'):
+        """Checkpoint journal of a report run, in SQLite.
+
+        Records the row of every finished cluster and the error of every failed one, so that an interrupted or
+        partly failed run can be resumed without fetching the finished clusters again. The parameters the rows
+        were built with are stored with the run, a run resumed with other parameters is started over.
+
+        :param path: The SQLite file, ':memory:' for a process local journal.
+        :param run_id: Identifies the run, one journal file can hold several runs.
+        """
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS clusters (run_id TEXT, cluster_id TEXT, cluster_name TEXT, '
+                           'finished_at REAL, row BLOB, error TEXT, PRIMARY KEY (run_id, cluster_id))')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, params TEXT)')
+        self._conn.commit()
+
+    @staticmethod
+    def _params_key(params: Optional[dict]) -> str:
+        return json.dumps(params or {}, sort_keys=True, default=str)
+
+    def start(self, params: Optional[dict] = None, resume: bool = False) -> Dict[str, dict]:
+        """Starts the run over, or resumes it if it was started with the same parameters.
+
+        :param params: The parameters the rows are built with, e.g. the granularity, period and columns.
+        :param resume: Keep the finished clusters of the run instead of starting it over.
+        :return: The rows of the finished clusters that are kept, by cluster id.
+        """
+        key = self._params_key(params)
+        with self._lock:
+            stored = self._conn.execute('SELECT params FROM runs WHERE run_id=?', (self.run_id,)).fetchone()
+        if resume and stored is not None and stored[0] == key:
+            return self.completed()
+        if resume and stored is not None:
+            logger.warning(f'The journal run {self.run_id} was started with other parameters, starting it over')
+        self.reset()
+        with self._lock:
+            self._conn.execute('INSERT INTO runs VALUES (?, ?)', (self.run_id, key))
+            self._conn.commit()
+        return OrderedDict()
+
+    def reset(self) -> None:
+        """Forgets every cluster recorded for the run, and its parameters."""
+        with self._lock:
+            self._conn.execute('DELETE FROM clusters WHERE run_id=?', (self.run_id,))
+            self._conn.execute('DELETE FROM runs WHERE run_id=?', (self.run_id,))
+            self._conn.commit()
+
+    def record_row(self, cluster_id: str, cluster_name: str, row: dict) -> None:
+        """Records a finished cluster with its report row, replacing an earlier failure."""
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO clusters VALUES (?, ?, ?, ?, ?, NULL)',
+                               (self.run_id, cluster_id, cluster_name, time.time(),
+                                zlib.compress(pickle.dumps(row))))
+            self._conn.commit()
+
+    def record_failure(self, cluster_id: str, cluster_name: str, error: Exception) -> None:
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO clusters VALUES (?, ?, ?, ?, NULL, ?)',
+                               (self.run_id, cluster_id, cluster_name, time.time(),
+                                f'{type(error).__name__}: {error}'))
+            self._conn.commit()
+
+    def completed(self) -> Dict[str, dict]:
+        """Returns the rows of the finished clusters by cluster id, in the order they finished."""
+        with self._lock:
+            rows = self._conn.execute('SELECT cluster_id, row FROM clusters WHERE run_id=? AND row IS NOT NULL '
+                                      'ORDER BY finished_at', (self.run_id,)).fetchall()
+        return OrderedDict((cluster_id, pickle.loads(zlib.decompress(row))) for cluster_id, row in rows)
+
+    def failures(self) -> Dict[str, str]:
+        """Returns the error of every failed cluster by cluster name."""
+        with self._lock:
+            rows = self._conn.execute('SELECT cluster_name, error FROM clusters WHERE run_id=? AND error IS NOT NULL '
+                                      'ORDER BY finished_at', (self.run_id,)).fetchall()
+        return OrderedDict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LatestStateStore:
+    def __init__(self, path: str = 'atlas_latest.sqlite'):
+        """The materialized latest report of a Fleet, in SQLite.
+
+        Each cluster's row is stored as separately refreshed parts (e.g. cluster attributes, metrics and namespace
+        counts), each with the time it was last refreshed and the error of its last failed refresh. Readers get
+        the merged rows without calling the API.
+
+        :param path: The SQLite file, ':memory:' for a process local store.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS latest (cluster_id TEXT, part TEXT, cluster_name TEXT, '
+                           'position INTEGER, updated_at REAL, row BLOB, error TEXT, failed_at REAL, '
+                           'PRIMARY KEY (cluster_id, part))')
+        self._conn.commit()
+
+    def put(self, cluster_id: str, cluster_name: str, part: str, values: dict, position: int = 0) -> None:
+        """Replaces a part of a cluster's row, clearing its last error.
+
+        :param position: Orders the clusters in `rows()`, e.g. the position of the cluster in the Fleet.
+        """
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO latest VALUES (?, ?, ?, ?, ?, ?, NULL, NULL)',
+                               (cluster_id, part, cluster_name, position, time.time(),
+                                zlib.compress(pickle.dumps(values))))
+            self._conn.commit()
+
+    def put_error(self, cluster_id: str, cluster_name: str, part: str, error: Exception, position: int = 0) -> None:
+        """Records a failed refresh of a part, keeping its last values."""
+        message = f'{type(error).__name__}: {error}'
+        with self._lock:
+            self._conn.execute('INSERT INTO latest VALUES (?, ?, ?, ?, NULL, NULL, ?, ?) '
+                               'ON CONFLICT (cluster_id, part) DO UPDATE SET error=excluded.error, '
+                               'failed_at=excluded.failed_at',
+                               (cluster_id, part, cluster_name, position, message, time.time()))
+            self._conn.commit()
+
+    def updated_at(self) -> Dict[Tuple[str, str], float]:
+        """Returns when each (cluster id, part) was last refreshed."""
+        with self._lock:
+            rows = self._conn.execute('SELECT cluster_id, part, updated_at FROM latest '
+                                      'WHERE updated_at IS NOT NULL').fetchall()
+        return {(cluster_id, part): updated_at for cluster_id, part, updated_at in rows}
+
+    def retain(self, cluster_ids: Collection[str]) -> int:
+        """Removes the clusters not in `cluster_ids`, e.g. after they were deleted from the Fleet.
+
+        :return: The number of clusters removed.
+        """
+        with self._lock:
+            stored = {each for each, in self._conn.execute('SELECT DISTINCT cluster_id FROM latest')}
+            removed = stored - set(cluster_ids)
+            self._conn.executemany('DELETE FROM latest WHERE cluster_id=?', [(each,) for each in removed])
+            self._conn.commit()
+        return len(removed)
+
+    def rows(self, parts: Collection[str] = ('cluster', 'namespaces', 'metrics'),
+             cluster_name: Optional[str] = None) -> List[dict]:
+        """Returns the latest row of every cluster, merging its parts in the order of `parts`.
+
+        Every row also holds `<part>_updated_at` (a UTC datetime, None if never refreshed) and, after a failed
+        refresh, `<part>_error` columns.
+
+        :param parts: The parts to merge.
+        :param cluster_name: Only return the rows of this cluster.
+        """
+        query = 'SELECT cluster_id, part, updated_at, row, error FROM latest'
+        params = ()
+        if cluster_name is not None:
+            query += ' WHERE cluster_name=?'
+            params = (cluster_name,)
+        with self._lock:
+            records = self._conn.execute(query + ' ORDER BY position, cluster_id', params).fetchall()
+        by_cluster: Dict[str, Dict[str, tuple]] = OrderedDict()
+        for cluster_id, part, updated_at, row, error in records:
+            by_cluster.setdefault(cluster_id, {})[part] = (updated_at, row, error)
+        rows = []
+        for each_parts in by_cluster.values():
+            row = OrderedDict()
+            status = OrderedDict()
+            for each_part in parts:
+                updated_at, values, error = each_parts.get(each_part, (None, None, None))
+                if values is not None:
+                    row.update(pickle.loads(zlib.decompress(values)))
+                status[f'{each_part}_updated_at'] = datetime.fromtimestamp(updated_at, timezone.utc) \
+                    if updated_at else None
+                if error:
+                    status[f'{each_part}_error'] = error
+            row.update(status)
+            rows.append(row)
+        return rows
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,337 @@
+from atlasapi.atlas import Atlas
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from atlas_lib import Fleet, ClusterData, metric_columns, namespace_columns
+from atlas_cache import LatestStateStore, SeriesStore
+from atlas_instrument import Instrumentation, stage
+from atlas_sinks import normalize_value
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse, unquote
+import argparse
+import csv
+import heapq
+import io
+import json
+import os
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parts of a cluster's row in the LatestStateStore, in column order.
+PARTS = ('cluster', 'namespaces', 'metrics')
+DISCOVERY = 'discovery'
+
+
+class FleetDaemon:
+    def __init__(self, fleet: Fleet, store: LatestStateStore,
+                 granularity: AtlasGranularities = AtlasGranularities.MINUTE, period: AtlasPeriods = AtlasPeriods.HOURS_1,
+                 metrics_interval: float = 300.0, namespaces_interval: float = 6 * 3600.0,
+                 discovery_interval: float = 900.0, retry_interval: float = 60.0, max_workers: int = 4,
+                 jitter: float = 0.1):
+        """Keeps the latest report of a Fleet materialized in a LatestStateStore, refreshing each cluster on its
+        own schedule.
+
+        The metrics and the namespace counts of every cluster are refreshed separately, every `metrics_interval`
+        and `namespaces_interval` seconds after their previous refresh. A refresh that fails is retried after
+        `retry_interval` seconds and the store keeps the last values. The clusters are re-listed every
+        `discovery_interval` seconds, adding new clusters and dropping deleted ones. Refreshes already in the store
+        are resumed on their schedule after a restart, instead of all being fetched again at once.
+
+        All refreshes draw from the Fleet's rate limiter, a default one is installed if it has none. A Fleet with a
+        SeriesStore only fetches the points added since the previous refresh.
+
+        :param fleet: The Fleet to poll.
+        :param store: The LatestStateStore to keep the rows in.
+        :param granularity: The granularity of the metrics.
+        :param period: The period the metrics cover.
+        :param metrics_interval: Seconds between two metrics refreshes of a cluster.
+        :param namespaces_interval: Seconds between two namespace count refreshes of a cluster.
+        :param discovery_interval: Seconds between two cluster listings.
+        :param retry_interval: Seconds before a failed refresh is retried.
+        :param max_workers: Refreshes running at the same time.
+        :param jitter: Randomizes each interval by up to this fraction, so the clusters do not refresh in bursts.
+        """
+        self.fleet = fleet
+        self.store = store
+        self.granularity = granularity
+        self.period = period
+        self.intervals = OrderedDict([('namespaces', namespaces_interval), ('metrics', metrics_interval)])
+        self.discovery_interval = discovery_interval
+        self.retry_interval = retry_interval
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.fleet.ensure_rate_limiter()
+        self._clusters: Dict[str, ClusterData] = OrderedDict()
+        self._positions: Dict[str, int] = {}
+        # Heap of (due time, cluster id, part), and the (cluster id, part) keys that are queued or running.
+        self._queue: List[Tuple[float, str, str]] = []
+        self._active: Set[Tuple[str, str]] = set()
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._random = random.Random()
+
+    @property
+    def instrumentation(self) -> Optional[Instrumentation]:
+        return self.fleet.instrumentation
+
+    def _schedule(self, cluster_id: str, part: str, due: float) -> None:
+        with self._condition:
+            self._active.add((cluster_id, part))
+            heapq.heappush(self._queue, (due, cluster_id, part))
+            self._condition.notify()
+
+    def _interval(self, seconds: float) -> float:
+        return seconds * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def discover(self) -> None:
+        """Lists the clusters of the Fleet, stores their attributes and schedules the refreshes of new ones."""
+        self.fleet.refresh()
+        clusters = list(self.fleet.clusters_list)
+        refreshed = self.store.updated_at()
+        now = time.time()
+        with self._condition:
+            self._clusters = OrderedDict((each.id, each) for each in clusters)
+            self._positions = {each.id: position for position, each in enumerate(clusters)}
+        for position, each_cluster in enumerate(clusters):
+            self.store.put(each_cluster.id, each_cluster.name, 'cluster', each_cluster.as_dict(), position)
+            for each_part, each_interval in self.intervals.items():
+                if (each_cluster.id, each_part) not in self._active:
+                    last = refreshed.get((each_cluster.id, each_part))
+                    self._schedule(each_cluster.id, each_part, last + each_interval if last else now)
+        removed = self.store.retain(self._clusters)
+        logger.info(f'Discovered {len(clusters)} clusters, removed {removed}')
+
+    def refresh(self, cluster_id: str, part: str) -> Optional[bool]:
+        """Refreshes the metrics or the namespace counts of a cluster in the store.
+
+        :return: False if the refresh failed, the error is then recorded in the store. None if the cluster was
+            removed from the Fleet by a discovery.
+        """
+        with self._condition:
+            cluster = self._clusters.get(cluster_id)
+            position = self._positions.get(cluster_id)
+        if cluster is None:
+            return None
+        try:
+            if part == 'metrics':
+                with stage(self.instrumentation, 'metrics', cluster.name):
+                    shard_data = cluster.shard_metrics(self.fleet.atlas, granularity=self.granularity,
+                                                       period=self.period, keep_points=False)
+                host_data = next(iter(shard_data.values()), None)
+                values = metric_columns(host_data, self.granularity, self.period, shard_data=shard_data) \
+                    if host_data else OrderedDict()
+            else:
+                with stage(self.instrumentation, 'namespaces', cluster.name):
+                    namespace_stats = cluster.namespace_stats(self.fleet.atlas)
+                values = namespace_columns(namespace_stats) if namespace_stats else OrderedDict()
+        except Exception as e:
+            logger.warning(f'Could not refresh the {part} of {cluster.name}: {e}')
+            self.store.put_error(cluster_id, cluster.name, part, e, position)
+            return False
+        self.store.put(cluster_id, cluster.name, part, values, position)
+        return True
+
+    def _run(self, cluster_id: str, part: str) -> None:
+        if part == DISCOVERY:
+            try:
+                self.discover()
+                due = time.time() + self._interval(self.discovery_interval)
+            except Exception as e:
+                logger.warning(f'Could not list the clusters: {e}')
+                due = time.time() + self.retry_interval
+            self._schedule(cluster_id, part, due)
+            return
+        refreshed = self.refresh(cluster_id, part)
+        if refreshed is None:
+            # The cluster was removed from the Fleet, its schedule is dropped.
+            with self._condition:
+                self._active.discard((cluster_id, part))
+            return
+        interval = self._interval(self.intervals[part]) if refreshed else \
+            min(self.retry_interval, self.intervals[part])
+        self._schedule(cluster_id, part, time.time() + interval)
+
+    def _pop_due(self, now: float) -> List[Tuple[str, str]]:
+        due = []
+        with self._condition:
+            while self._queue and self._queue[0][0] <= now:
+                _, cluster_id, part = heapq.heappop(self._queue)
+                due.append((cluster_id, part))
+        return due
+
+    def run_pending(self) -> int:
+        """Runs every refresh that is due in the calling thread, discovering the clusters first if never done.
+
+        :return: The number of refreshes run.
+        """
+        if (DISCOVERY, DISCOVERY) not in self._active:
+            self._schedule(DISCOVERY, DISCOVERY, time.time())
+        count = 0
+        for _ in range(2):
+            # A discovery schedules the first refreshes of new clusters, which are due at once.
+            due = self._pop_due(time.time())
+            for each_cluster_id, each_part in due:
+                self._run(each_cluster_id, each_part)
+            count += len(due)
+        return count
+
+    def run(self) -> None:
+        """Refreshes the clusters on their schedules, `max_workers` at a time, until stop() is called."""
+        self._stopped.clear()
+        if (DISCOVERY, DISCOVERY) not in self._active:
+            self._schedule(DISCOVERY, DISCOVERY, time.time())
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fleet-daemon')
+        try:
+            while not self._stopped.is_set():
+                for each_cluster_id, each_part in self._pop_due(time.time()):
+                    pool.submit(self._run, each_cluster_id, each_part)
+                with self._condition:
+                    if self._stopped.is_set():
+                        break
+                    timeout = self._queue[0][0] - time.time() if self._queue else None
+                    if timeout is None or timeout > 0:
+                        self._condition.wait(timeout)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def start(self) -> threading.Thread:
+        """Runs the daemon in a background thread."""
+        self._thread = threading.Thread(target=self.run, name='fleet-daemon', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops scheduling refreshes and waits for the running ones."""
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+class LatestStateHandler(BaseHTTPRequestHandler):
+    """Serves the rows of a LatestStateStore, never calling the Atlas API.
+
+    GET /report and /report.csv return every row, /clusters/<name> the row of one cluster, /metrics the age of
+    every part and the counters of the Instrumentation in the Prometheus text format, and /healthz returns ok.
+    """
+    store: LatestStateStore = None
+    instrumentation: Optional[Instrumentation] = None
+
+    def do_GET(self) -> None:
+        path = unquote(urlparse(self.path).path).rstrip('/')
+        if path == '/report':
+            self._send(200, 'application/json', self._json(self.store.rows()))
+        elif path == '/report.csv':
+            self._send(200, 'text/csv', self._csv(self.store.rows()))
+        elif path.startswith('/clusters/'):
+            rows = self.store.rows(cluster_name=path[len('/clusters/'):])
+            if rows:
+                self._send(200, 'application/json', self._json(rows[0]))
+            else:
+                self._send(404, 'application/json', self._json({'error': 'Unknown cluster'}))
+        elif path == '/metrics':
+            self._send(200, 'text/plain; version=0.0.4; charset=utf-8', self._metrics())
+        elif path == '/healthz':
+            self._send(200, 'text/plain', 'ok\n')
+        else:
+            self._send(404, 'application/json', self._json({'error': 'Not found'}))
+
+    def _send(self, status: int, content_type: str, body: str) -> None:
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _json(value) -> str:
+        if isinstance(value, list):
+            value = [OrderedDict((key, normalize_value(each)) for key, each in row.items()) for row in value]
+        elif isinstance(value, dict):
+            value = OrderedDict((key, normalize_value(each)) for key, each in value.items())
+        return json.dumps(value, default=str)
+
+    @staticmethod
+    def _csv(rows: List[dict]) -> str:
+        columns = list(OrderedDict.fromkeys(key for row in rows for key in row))
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for each_row in rows:
+            writer.writerow([normalize_value(each_row.get(each)) for each in columns])
+        return output.getvalue()
+
+    def _metrics(self) -> str:
+        now = time.time()
+        lines = ['# HELP atlas_latest_age_seconds Seconds since each part of a cluster row was refreshed.',
+                 '# TYPE atlas_latest_age_seconds gauge']
+        for (cluster_id, part), updated_at in sorted(self.store.updated_at().items()):
+            lines.append(f'atlas_latest_age_seconds{{cluster_id="{cluster_id}",part="{part}"}} {now - updated_at}')
+        text = '\n'.join(lines) + '\n'
+        if self.instrumentation:
+            return text + self.instrumentation.openmetrics(openmetrics=False)
+        return text
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+def serve(store: LatestStateStore, host: str = '127.0.0.1', port: int = 8000,
+          instrumentation: Optional[Instrumentation] = None) -> ThreadingHTTPServer:
+    """Returns a ThreadingHTTPServer answering with the rows of the store, see LatestStateHandler.
+
+    Call serve_forever() on it, in a thread of its own to keep the caller running.
+    """
+    handler = type('BoundLatestStateHandler', (LatestStateHandler,),
+                   {'store': store, 'instrumentation': instrumentation})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Polls an Atlas Fleet continuously and serves its latest report.')
+    parser.add_argument('--store', default='atlas_latest.sqlite', help='The LatestStateStore file')
+    parser.add_argument('--series-store', help='A SeriesStore file, to only fetch the new points of each metric')
+    parser.add_argument('--host', default='127.0.0.1', help='Address of the HTTP endpoint')
+    parser.add_argument('--port', type=int, default=8000, help='Port of the HTTP endpoint')
+    parser.add_argument('--granularity', default=AtlasGranularities.MINUTE, help='ISO 8601 metrics granularity')
+    parser.add_argument('--period', default=AtlasPeriods.HOURS_1, help='ISO 8601 metrics period')
+    parser.add_argument('--metrics-interval', type=float, default=300.0, help='Seconds between metrics refreshes')
+    parser.add_argument('--namespaces-interval', type=float, default=6 * 3600.0,
+                        help='Seconds between namespace count refreshes')
+    parser.add_argument('--discovery-interval', type=float, default=900.0, help='Seconds between cluster listings')
+    parser.add_argument('--workers', type=int, default=4, help='Refreshes running at the same time')
+    parser.add_argument('--all-projects', action='store_true', help='Poll every project the API key can access')
+    args = parser.parse_args()
+
+    atlas = Atlas(user=os.getenv('ATLAS_USER'), password=os.getenv('ATLAS_KEY'), group=os.getenv('ATLAS_GROUP'))
+    instrumentation = Instrumentation()
+    fleet = Fleet(atlas, all_projects=args.all_projects, instrumentation=instrumentation,
+                  series_store=SeriesStore(args.series_store) if args.series_store else None)
+    store = LatestStateStore(args.store)
+    daemon = FleetDaemon(fleet, store, granularity=args.granularity, period=args.period,
+                         metrics_interval=args.metrics_interval, namespaces_interval=args.namespaces_interval,
+                         discovery_interval=args.discovery_interval, max_workers=args.workers)
+    server = serve(store, args.host, args.port, instrumentation=instrumentation)
+    daemon.start()
+    logger.info(f'Serving the latest report on http://{args.host}:{args.port}/report')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.stop()
+        store.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
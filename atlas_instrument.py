@@ -0,0 +1,352 @@
+from atlasapi.atlas import Atlas
+from atlasapi.errors import ErrAtlasGeneric
+from atlasapi.settings import Settings
+from atlas_ratelimit import ThrottledNetwork, TOO_MANY_REQUESTS
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from texttable import Texttable
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the API latency histogram buckets, a last +Inf bucket is implied.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Report stages timed by Fleet and the sinks.
+STAGES = ('discovery', 'host_lookup', 'metrics', 'namespaces', 'export')
+
+# Path segments holding ids, replaced by placeholders so calls are counted per endpoint and not per resource.
+ENDPOINT_PATTERNS = [
+    (re.compile(r'/groups/[^/]+'), '/groups/{group}'),
+    (re.compile(r'/clusters/[^/]+'), '/clusters/{cluster}'),
+    (re.compile(r'/processes/[^/]+'), '/processes/{host}'),
+    (re.compile(r'/databases/[^/]+'), '/databases/{database}'),
+    (re.compile(r'/disks/[^/]+'), '/disks/{disk}'),
+]
+PROCESS_PATTERN = re.compile(r'/processes/([^/:]+)')
+CLUSTER_PATTERN = re.compile(r'/clusters/([^/]+)')
+# A process hostname is <cluster>-shard-NN-NN or <cluster>-config-NN-NN, the cluster name may itself hold -config-.
+HOST_CLUSTER_PATTERN = re.compile(r'(.+)-(?:shard|config)-\d+-\d+')
+
+
+def endpoint_of(uri: str) -> Tuple[str, str]:
+    """Returns the endpoint template of an API uri and the name of the cluster it concerns ('' if none).
+
+    The cluster name is taken from the hostname of a process, up to its last -shard-NN-NN or -config-NN-NN.
+    """
+    path = urlparse(uri).path
+    if path.startswith(Settings.URI_STUB):
+        path = path[len(Settings.URI_STUB):]
+    cluster = ''
+    process = PROCESS_PATTERN.search(path)
+    if process:
+        hostname = process.group(1)
+        host_match = HOST_CLUSTER_PATTERN.match(hostname)
+        cluster = host_match.group(1) if host_match else hostname.split('-')[0]
+    else:
+        cluster_match = CLUSTER_PATTERN.search(path)
+        if cluster_match:
+            cluster = cluster_match.group(1)
+    for each_pattern, each_template in ENDPOINT_PATTERNS:
+        path = each_pattern.sub(each_template, path)
+    return path.rstrip('/') or '/', cluster
+
+
+def response_size(response) -> int:
+    """Returns the size of an API response in bytes, as compact JSON for parsed responses."""
+    if isinstance(response, (bytes, bytearray)):
+        return len(response)
+    try:
+        return len(json.dumps(response, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 0
+
+
+class CallStats:
+    __slots__ = ('calls', 'errors', 'retries', 'bytes', 'seconds', 'max_seconds', 'buckets')
+
+    def __init__(self):
+        """Counters of the API calls of one endpoint (and cluster)."""
+        self.calls = 0
+        self.errors = 0
+        # Calls answered with 429, which ThrottledNetwork retries.
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds: float, size: int, code: Optional[int] = None) -> None:
+        self.calls += 1
+        if code == TOO_MANY_REQUESTS:
+            self.retries += 1
+        elif code is not None:
+            self.errors += 1
+        self.bytes += size
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for index, each_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= each_bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def merge(self, other: 'CallStats') -> None:
+        self.calls += other.calls
+        self.errors += other.errors
+        self.retries += other.retries
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, other.buckets)]
+
+
+class StageStats:
+    __slots__ = ('runs', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        """Timings of one report stage (and cluster)."""
+        self.runs = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.runs += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def merge(self, other: 'StageStats') -> None:
+        self.runs += other.runs
+        self.seconds += other.seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+
+
+class Instrumentation:
+    def __init__(self):
+        """Collects API call counters and stage timings of report runs, per endpoint, stage and cluster.
+
+        Thread safe, a single Instrumentation is shared by all the threads of a Fleet. Install it with
+        `instrument()` or Fleet(instrumentation=...), then read it with `summary()` or `openmetrics()`.
+        """
+        self.started = time.monotonic()
+        self._calls: Dict[Tuple[str, str], CallStats] = defaultdict(CallStats)
+        self._stages: Dict[Tuple[str, str], StageStats] = defaultdict(StageStats)
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+            self._stages.clear()
+            self.started = time.monotonic()
+
+    def record_call(self, uri: str, seconds: float, size: int = 0, code: Optional[int] = None) -> None:
+        """Records one API call.
+
+        :param uri: The requested uri.
+        :param seconds: Time until the response (or error) was received.
+        :param size: Size of the response in bytes.
+        :param code: The HTTP status of a failed call, None for a successful one.
+        """
+        endpoint, cluster = endpoint_of(uri)
+        with self._lock:
+            self._calls[endpoint, cluster].add(seconds, size, code)
+
+    def record_stage(self, name: str, seconds: float, cluster: Optional[str] = None) -> None:
+        with self._lock:
+            self._stages[name, cluster or ''].add(seconds)
+
+    @contextmanager
+    def stage(self, name: str, cluster: Optional[str] = None) -> Iterator[None]:
+        """Times the enclosed block as a run of a report stage, e.g. `with instrumentation.stage('metrics', 'c0')`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start, cluster)
+
+    def _merged(self, stats: dict, key_index: int, factory) -> Dict[str, object]:
+        merged = OrderedDict()
+        with self._lock:
+            items = list(stats.items())
+        for each_key, each_stats in sorted(items):
+            merged.setdefault(each_key[key_index], factory()).merge(each_stats)
+        return merged
+
+    def endpoints(self) -> Dict[str, CallStats]:
+        """Call counters by endpoint, all clusters together."""
+        return self._merged(self._calls, 0, CallStats)
+
+    def stages(self) -> Dict[str, StageStats]:
+        """Stage timings by stage in pipeline order, all clusters together."""
+        merged = self._merged(self._stages, 0, StageStats)
+        order = {name: index for index, name in enumerate(STAGES)}
+        return OrderedDict(sorted(merged.items(), key=lambda item: (order.get(item[0], len(STAGES)), item[0])))
+
+    def clusters(self) -> Dict[str, Dict[str, float]]:
+        """Calls, bytes, API seconds and stage seconds by cluster, the slowest cluster first."""
+        clusters = defaultdict(lambda: OrderedDict([('calls', 0), ('errors', 0), ('retries', 0), ('bytes', 0),
+                                                    ('api_seconds', 0.0), ('stage_seconds', 0.0)]))
+        with self._lock:
+            calls = list(self._calls.items())
+            stages = list(self._stages.items())
+        for (_, cluster), each_stats in calls:
+            if cluster:
+                totals = clusters[cluster]
+                totals['calls'] += each_stats.calls
+                totals['errors'] += each_stats.errors
+                totals['retries'] += each_stats.retries
+                totals['bytes'] += each_stats.bytes
+                totals['api_seconds'] += each_stats.seconds
+        for (_, cluster), each_stats in stages:
+            if cluster:
+                clusters[cluster]['stage_seconds'] += each_stats.seconds
+        return OrderedDict(sorted(clusters.items(), key=lambda item: (-item[1]['stage_seconds'],
+                                                                       -item[1]['api_seconds'], item[0])))
+
+    def summary(self, top: int = 10) -> str:
+        """Returns a text report of the stages, the endpoints and the `top` slowest clusters."""
+        elapsed = time.monotonic() - self.started
+        stages = Texttable(max_width=0)
+        stages.set_deco(Texttable.HEADER)
+        stages.header(['stage', 'runs', 'seconds', 'max seconds'])
+        for name, each in self.stages().items():
+            stages.add_row([name, each.runs, f'{each.seconds:.3f}', f'{each.max_seconds:.3f}'])
+        endpoints = Texttable(max_width=0)
+        endpoints.set_deco(Texttable.HEADER)
+        endpoints.header(['endpoint', 'calls', 'errors', '429', 'bytes', 'mean seconds', 'max seconds'])
+        for name, each in self.endpoints().items():
+            endpoints.add_row([name, each.calls, each.errors, each.retries, each.bytes,
+                               f'{each.seconds / each.calls:.3f}' if each.calls else '-',
+                               f'{each.max_seconds:.3f}'])
+        clusters = Texttable(max_width=0)
+        clusters.set_deco(Texttable.HEADER)
+        clusters.header(['cluster', 'calls', 'errors', '429', 'bytes', 'API seconds', 'stage seconds'])
+        for name, each in list(self.clusters().items())[:top]:
+            clusters.add_row([name, each['calls'], each['errors'], each['retries'], each['bytes'],
+                              f'{each["api_seconds"]:.3f}', f'{each["stage_seconds"]:.3f}'])
+        return '\n\n'.join([f'Instrumented for {elapsed:.1f} seconds', stages.draw(), endpoints.draw(),
+                            f'Slowest {top} clusters', clusters.draw()])
+
+    def openmetrics(self, openmetrics: bool = True) -> str:
+        """Returns the counters in the OpenMetrics text format, or the Prometheus 0.0.4 text format.
+
+        :param openmetrics: False for the Prometheus format, e.g. for the node_exporter textfile collector.
+        """
+        lines: List[str] = []
+
+        def family(name: str, kind: str, description: str) -> None:
+            family_name = name[:-len('_total')] if openmetrics and name.endswith('_total') else name
+            lines.append(f'# HELP {family_name} {description}')
+            lines.append(f'# TYPE {family_name} {kind}')
+
+        def sample(name: str, labels: Dict[str, str], value: float) -> None:
+            text = ','.join(f'{key}="{escape(str(each))}"' for key, each in labels.items())
+            lines.append(f'{name}{{{text}}} {value}' if text else f'{name} {value}')
+
+        with self._lock:
+            calls = sorted(self._calls.items())
+            stages = sorted(self._stages.items())
+        counters = [('atlas_api_requests_total', 'calls', 'Atlas API calls.'),
+                    ('atlas_api_errors_total', 'errors', 'Atlas API calls that failed, 429 excluded.'),
+                    ('atlas_api_retries_total', 'retries', 'Atlas API calls answered with 429 and retried.'),
+                    ('atlas_api_response_bytes_total', 'bytes', 'Bytes of Atlas API responses.')]
+        for each_name, attribute, description in counters:
+            family(each_name, 'counter', description)
+            for (endpoint, cluster), each_stats in calls:
+                sample(each_name, OrderedDict(endpoint=endpoint, cluster=cluster), getattr(each_stats, attribute))
+        family('atlas_api_request_duration_seconds', 'histogram', 'Atlas API call latency.')
+        for endpoint, each_stats in self.endpoints().items():
+            cumulative = 0
+            for each_bound, each_count in zip(LATENCY_BUCKETS + (float('inf'),), each_stats.buckets):
+                cumulative += each_count
+                sample('atlas_api_request_duration_seconds_bucket',
+                       OrderedDict(endpoint=endpoint, le='+Inf' if each_bound == float('inf') else repr(each_bound)),
+                       cumulative)
+            sample('atlas_api_request_duration_seconds_sum', {'endpoint': endpoint}, each_stats.seconds)
+            sample('atlas_api_request_duration_seconds_count', {'endpoint': endpoint}, each_stats.calls)
+        family('atlas_report_stage_seconds_total', 'counter', 'Time spent in each report stage.')
+        for (name, cluster), each_stats in stages:
+            sample('atlas_report_stage_seconds_total', OrderedDict(stage=name, cluster=cluster), each_stats.seconds)
+        family('atlas_report_stage_runs_total', 'counter', 'Runs of each report stage.')
+        for (name, cluster), each_stats in stages:
+            sample('atlas_report_stage_runs_total', OrderedDict(stage=name, cluster=cluster), each_stats.runs)
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write_openmetrics(self, path: str, openmetrics: bool = True) -> None:
+        """Writes the counters to a file, replacing it atomically so a scraper never reads a partial file."""
+        with open(f'{path}.tmp', 'w') as output_file:
+            output_file.write(self.openmetrics(openmetrics))
+        os.replace(f'{path}.tmp', path)
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def stage(instrumentation: Optional[Instrumentation], name: str, cluster: Optional[str] = None):
+    """Returns instrumentation.stage(name, cluster), or a no-op context without instrumentation."""
+    return instrumentation.stage(name, cluster) if instrumentation else nullcontext()
+
+
+class InstrumentedNetwork:
+    CALLS = ThrottledNetwork.CALLS
+
+    def __init__(self, network, instrumentation: Instrumentation):
+        """Wraps an atlasapi Network so every request is recorded in an Instrumentation.
+
+        Installed below any ThrottledNetwork (see instrument), so that each attempt of a retried call is recorded
+        and the time spent waiting for the rate limiter is not counted as API latency.
+
+        :param network: The atlasapi Network object to wrap.
+        :param instrumentation: The Instrumentation shared by all threads.
+        """
+        self.network = network
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, item):
+        attribute = getattr(self.network, item)
+        if item in self.CALLS:
+            def instrumented(uri, *args, **kwargs):
+                return self._call(attribute, uri, *args, **kwargs)
+            return instrumented
+        return attribute
+
+    def _call(self, method, uri: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = method(uri, *args, **kwargs)
+        except ErrAtlasGeneric as e:
+            self.instrumentation.record_call(uri, time.perf_counter() - start, code=e.code)
+            raise e
+        except Exception as e:
+            self.instrumentation.record_call(uri, time.perf_counter() - start, code=0)
+            raise e
+        self.instrumentation.record_call(uri, time.perf_counter() - start, response_size(response))
+        return response
+
+
+def instrument(atlas_obj: Atlas, instrumentation: Instrumentation) -> InstrumentedNetwork:
+    """Records all API calls of the Atlas object in the passed Instrumentation.
+
+    Calling it again on an already instrumented Atlas object only swaps the Instrumentation.
+
+    :param atlas_obj: An instantiated Atlas object, throttled or not.
+    :param instrumentation: The Instrumentation to record in.
+    :return: The installed InstrumentedNetwork
+    """
+    holder = atlas_obj.network if isinstance(atlas_obj.network, ThrottledNetwork) else atlas_obj
+    if isinstance(holder.network, InstrumentedNetwork):
+        holder.network.instrumentation = instrumentation
+    else:
+        holder.network = InstrumentedNetwork(holder.network, instrumentation)
+    return holder.network
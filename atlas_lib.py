@@ -1,11 +1,30 @@
-from atlasapi.atlas import Atlas
+from atlasapi.atlas import Atlas, HostsGetAll
+from atlasapi.settings import Settings
 from atlasapi.clusters import ClusterConfig, ClusterType
+from atlasapi.projects import Project
 from atlasapi.specs import ReplicaSetTypes, AtlasPeriods, AtlasGranularities, Host, AtlasMeasurementTypes, \
     AtlasMeasurement, AtlasMeasurementValue
 from pprint import pprint
-from typing import List, Optional, Generator, Union, Iterable
+from typing import List, Optional, Generator, Union, Iterable, Dict, Collection, Tuple
 from pandas import DataFrame as df
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+import numpy as np
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from functools import partial
+from statistics import NormalDist
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+import isodate
+from atlas_ratelimit import TokenBucket, throttle
+from atlas_cache import MeasurementCache, SeriesStore, ReportJournal, ATLAS_TIMESTAMP
+from atlas_aggregate import Aggregator, aggregate_rows
+from atlas_instrument import Instrumentation, instrument, stage
+from atlas_sinks import DataFrameSink
+import copy
+import random
+import re
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,142 +58,793 @@ DISK_METRICS = [
     AtlasMeasurementTypes.Disk.Util.util_max
 ]
 
+SYSTEM_DATABASES = ['admin', 'local', 'config']
+
+NAMESPACE_COUNTERS = {
+    AtlasMeasurementTypes.Namespaces.collection_count: 'collections',
+    AtlasMeasurementTypes.Namespaces.index_count: 'indexes',
+    AtlasMeasurementTypes.Namespaces.view_count: 'views',
+    AtlasMeasurementTypes.Namespaces.object_count: 'objects',
+}
+
+# Measurement name -> HostData attribute, in report column order. Used to store each measurement and to build rows.
+HOST_METRIC_ATTRIBUTES = OrderedDict([
+    (AtlasMeasurementTypes.Cache.used, 'cache_used'),
+    (AtlasMeasurementTypes.Cache.dirty, 'cache_dirty'),
+    (AtlasMeasurementTypes.Cache.bytes_read, 'cache_bytes_read'),
+    (AtlasMeasurementTypes.Cache.bytes_written, 'cache_bytes_written'),
+    (AtlasMeasurementTypes.QueryTargetingScanned.objects_per_returned, 'targeting_objects'),
+    (AtlasMeasurementTypes.QueryTargetingScanned.per_returned, 'targeting_per_returned'),
+    (AtlasMeasurementTypes.GlobalLockCurrentQueue.readers, 'queued_readers'),
+    (AtlasMeasurementTypes.GlobalLockCurrentQueue.writers, 'queued_writers'),
+    (AtlasMeasurementTypes.TicketsAvailable.writes, 'tickets_write'),
+    (AtlasMeasurementTypes.TicketsAvailable.reads, 'tickets_read'),
+    (AtlasMeasurementTypes.Db.data_size, 'db_data_size'),
+    (AtlasMeasurementTypes.Db.storage, 'db_storage'),
+    (AtlasMeasurementTypes.Network.bytes_in, 'net_in_data'),
+    (AtlasMeasurementTypes.Network.bytes_out, 'net_out_data'),
+    (AtlasMeasurementTypes.Disk.Util.util, 'disk_util'),
+    (AtlasMeasurementTypes.Disk.Util.util_max, 'disk_util_max'),
+    (AtlasMeasurementTypes.Disk.Latency.write, 'disk_latency_write'),
+    (AtlasMeasurementTypes.Disk.Latency.write_max, 'disk_latency_write_max'),
+    (AtlasMeasurementTypes.Disk.Latency.read, 'disk_latency_read'),
+    (AtlasMeasurementTypes.Disk.Latency.read_max, 'disk_latency_read_max'),
+    (AtlasMeasurementTypes.Disk.IOPS.read, 'disk_iops_read'),
+    (AtlasMeasurementTypes.Disk.IOPS.read_max, 'disk_iops_read_max'),
+    (AtlasMeasurementTypes.Disk.IOPS.write, 'disk_iops_write'),
+    (AtlasMeasurementTypes.Disk.IOPS.write_max, 'disk_iops_write_max'),
+])
+
+
+# How the metric columns of a sharded cluster roll up the shard primaries: sizes and throughput add up, available
+# tickets report the most constrained shard, and every other metric reports the busiest shard (max).
+SHARD_ROLLUPS = {
+    AtlasMeasurementTypes.Cache.used: 'sum',
+    AtlasMeasurementTypes.Cache.dirty: 'sum',
+    AtlasMeasurementTypes.Cache.bytes_read: 'sum',
+    AtlasMeasurementTypes.Cache.bytes_written: 'sum',
+    AtlasMeasurementTypes.Db.data_size: 'sum',
+    AtlasMeasurementTypes.Db.storage: 'sum',
+    AtlasMeasurementTypes.Network.bytes_in: 'sum',
+    AtlasMeasurementTypes.Network.bytes_out: 'sum',
+    AtlasMeasurementTypes.Disk.IOPS.read: 'sum',
+    AtlasMeasurementTypes.Disk.IOPS.write: 'sum',
+    AtlasMeasurementTypes.TicketsAvailable.reads: 'min',
+    AtlasMeasurementTypes.TicketsAvailable.writes: 'min',
+}
+
+# How the namespace counts of a database roll up across the shard primaries of a sharded cluster. Documents and
+# index entries are split across shards and add up. A sharded collection (and its views) exists on every shard
+# holding its chunks, so the collection and view counts are those of the shard holding the most.
+NAMESPACE_SHARD_ROLLUPS = {
+    'objects': 'sum',
+    'indexes': 'sum',
+    'collections': 'max',
+    'views': 'max',
+}
+
+# Metric groups which can be requested as report columns, e.g. get_full_report_primary_metrics(columns=['disk']).
+# The namespace counts are the `namespaces` group, see NAMESPACE_COLUMNS.
+METRIC_GROUPS = OrderedDict([
+    ('cache', [AtlasMeasurementTypes.Cache.used, AtlasMeasurementTypes.Cache.dirty,
+               AtlasMeasurementTypes.Cache.bytes_read, AtlasMeasurementTypes.Cache.bytes_written]),
+    ('targeting', [AtlasMeasurementTypes.QueryTargetingScanned.objects_per_returned,
+                   AtlasMeasurementTypes.QueryTargetingScanned.per_returned]),
+    ('queues', [AtlasMeasurementTypes.GlobalLockCurrentQueue.readers,
+                AtlasMeasurementTypes.GlobalLockCurrentQueue.writers]),
+    ('tickets', [AtlasMeasurementTypes.TicketsAvailable.writes, AtlasMeasurementTypes.TicketsAvailable.reads]),
+    ('storage', [AtlasMeasurementTypes.Db.data_size, AtlasMeasurementTypes.Db.storage]),
+    ('network', [AtlasMeasurementTypes.Network.bytes_in, AtlasMeasurementTypes.Network.bytes_out]),
+    # The list itself, so that disk metrics added by register_metric are part of the group.
+    ('disk', DISK_METRICS),
+])
+
+
+def cluster_topology(data_dict: dict) -> OrderedDict:
+    """Returns the shard and node counts of a cluster dict in the format of the Atlas API.
+
+    Node counts are added up across every region of every replication spec (zone), so they describe a whole shard
+    (replica set) of multi-region and global clusters.
+
+    :param data_dict: A cluster as returned by the Atlas clusters endpoint.
+    :return: shards, electable, analytics, ro and regions (a comma separated list of region names)
+    """
+    topology = OrderedDict(shards=0, electable=0, analytics=0, ro=0)
+    regions = []
+    replication_specs = data_dict.get('replicationSpecs') or []
+    for each_spec in replication_specs:
+        topology['shards'] += each_spec.get('numShards', 1)
+        for region_name, region_config in (each_spec.get('regionsConfig') or {}).items():
+            topology['electable'] += region_config.get('electableNodes') or 0
+            topology['analytics'] += region_config.get('analyticsNodes') or 0
+            topology['ro'] += region_config.get('readOnlyNodes') or 0
+            if region_name not in regions:
+                regions.append(region_name)
+    if not replication_specs:
+        topology['shards'] = data_dict.get('numShards', 1)
+    topology['regions'] = ','.join(regions)
+    return topology
+
+
+def register_metric(name: str, disk: bool = False) -> None:
+    """Adds a measurement to every following report.
+
+    The measurement is requested with the other host metrics (or, for a data partition metric, read from the disk
+    measurements response), kept in `HostData.extra_metrics` and reported as a column of its own.
+
+    :param name: The Atlas measurement name, e.g. AtlasMeasurementTypes.connections
+    :param disk: True for a data partition measurement.
+    """
+    if name in HOST_METRIC_ATTRIBUTES:
+        return
+    HOST_METRIC_ATTRIBUTES[name] = None
+    if not disk:
+        METRICS.append(name)
+    else:
+        DISK_METRICS.append(name)
+
+
+class SeriesStats:
+    __slots__ = ('samples', 'mean', 'min', 'max', 'p95')
+
+    def __init__(self, values: np.ndarray):
+        """Summary statistics of a series.
+
+        As atlasapi's StatisticalValues does, missing and zero points are not counted.
+
+        :param values: The series values, NaN for missing points.
+        """
+        sample = values[np.isfinite(values) & (values != 0)]
+        self.samples: int = int(sample.size)
+        if sample.size:
+            self.mean: float = float(sample.mean())
+            self.min: float = float(sample.min())
+            self.max: float = float(sample.max())
+            self.p95: float = float(np.percentile(sample, 95))
+        else:
+            logger.warning('Could not compute statistical values.')
+            self.mean = self.min = self.max = self.p95 = 0.0
+
+
+class CompactMeasurement:
+    __slots__ = ('name', 'units', 'period', 'granularity', 'timestamps', 'values', '_stats')
+
+    def __init__(self, name: str, units: Optional[str], period: AtlasPeriods, granularity: AtlasGranularities,
+                 timestamps: np.ndarray, values: np.ndarray):
+        """A measurement series held as two NumPy buffers instead of one object per data point.
+
+        Offers the parts of the AtlasMeasurement interface used by reports (`name`, `units`, `measurement_stats`).
+
+        :param name: The measurement name
+        :param units: The units of the values
+        :param period: The period the series covers
+        :param granularity: The granularity of the series
+        :param timestamps: datetime64[s] timestamps
+        :param values: float64 values, NaN for missing points
+        """
+        self.name = name
+        self.units = units
+        self.period = period
+        self.granularity = granularity
+        self.timestamps: Optional[np.ndarray] = timestamps
+        self.values: Optional[np.ndarray] = values
+        self._stats: Optional[SeriesStats] = None
+
+    @classmethod
+    def from_dict(cls, data_dict: dict, granularity: AtlasGranularities, period: AtlasPeriods) -> 'CompactMeasurement':
+        """Parses a raw measurement of an API response (name, units and dataPoints)."""
+        points = data_dict.get('dataPoints', [])
+        values = np.array([each.get('value') for each in points], dtype=np.float64)
+        try:
+            timestamps = np.array([each.get('timestamp', '').rstrip('Z') for each in points], dtype='datetime64[s]')
+        except ValueError:
+            timestamps = np.array([AtlasMeasurementValue(each).timestamp.replace(tzinfo=None) for each in points],
+                                  dtype='datetime64[s]')
+        return cls(data_dict.get('name'), data_dict.get('units', None), period, granularity, timestamps, values)
+
+    @property
+    def measurement_stats(self) -> SeriesStats:
+        """Returns statistical info for the measurement data."""
+        if self._stats is None:
+            self._stats = SeriesStats(self.values)
+        return self._stats
+
+    def drop_points(self) -> None:
+        """Computes the statistics and releases the data point buffers."""
+        self.measurement_stats
+        self.timestamps = None
+        self.values = None
+
+    @property
+    def latest(self) -> Optional[float]:
+        """The value of the last data point that is not missing, None if there is none."""
+        if self.values is None:
+            return None
+        present = self.values[np.isfinite(self.values)]
+        return float(present[-1]) if present.size else None
+
+    @property
+    def measurements_count(self) -> int:
+        return 0 if self.values is None else int(self.values.size)
+
+    @property
+    def date_start(self) -> Optional[np.datetime64]:
+        return self.timestamps.min() if self.measurements_count else None
+
+    @property
+    def date_end(self) -> Optional[np.datetime64]:
+        return self.timestamps.max() if self.measurements_count else None
+
+
+def measurements_from_response(response: dict, granularity: AtlasGranularities,
+                               period: AtlasPeriods) -> Iterable[CompactMeasurement]:
+    """Yields a CompactMeasurement for every measurement of a raw measurements API response."""
+    for each in response.get('measurements', []):
+        yield CompactMeasurement.from_dict(each, granularity=granularity, period=period)
+
+
+# Replica set roles of config server members.
+CONFIG_SERVER_TYPES = (ReplicaSetTypes.SHARD_CONFIG, ReplicaSetTypes.SHARD_CONFIG_PRIMARY,
+                       ReplicaSetTypes.SHARD_CONFIG_SECONDARY)
+
+
+def is_config_server(host: Host) -> bool:
+    """True if the host is a member of a config server replica set, going by its role or replica set name."""
+    return host.type in CONFIG_SERVER_TYPES or bool(re.search(r'-config-\d+$', host.replica_set_name or ''))
+
+
+def host_cluster_name(host: Host) -> str:
+    """Returns the name of the cluster of a host: its hostname up to the last -shard-NN-NN or -config-NN-NN.
+
+    Host.cluster_name splits on the first -config-, which cuts clusters named like app-config-store short.
+    """
+    match = re.match(r'(.+)-(?:shard|config)-\d+-\d+', host.hostname or '')
+    return match.group(1) if match else host.cluster_name
+
+
+class HostInventory:
+    def __init__(self, atlas_obj: Atlas, ttl: Optional[float] = 300.0, cache: Optional[MeasurementCache] = None):
+        """Snapshot of every host (process) in the project, indexed by cluster name and replica role.
+
+        The host list is downloaded once and shared by every ClusterData of a Fleet, instead of each cluster
+        re-listing the whole project for every lookup.
+
+        Refresh policy: the snapshot is re-fetched on first use, when `refresh()` is called explicitly, and
+        lazily on lookup once it is older than `ttl` seconds, so that long report runs still notice primary
+        failovers. A `ttl` of None keeps the snapshot until `refresh()` is called.
+
+        :param atlas_obj: An instantiated Atlas object for connectivity to the API
+        :param ttl: Maximum age of the snapshot in seconds (default = 300)
+        :param cache: Stores each snapshot for offline replay. Online, the host list is always re-fetched.
+        """
+        self.atlas = atlas_obj
+        self.ttl = ttl
+        self.cache = cache
+        self.fetched_at: Optional[float] = None
+        self._by_cluster: Dict[str, Dict[ReplicaSetTypes, List[Host]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        if self.fetched_at is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.monotonic() - self.fetched_at > self.ttl
+
+    def refresh(self) -> None:
+        """Re-downloads the host list for the project and rebuilds the index."""
+        # fill_host_list() downloads the full host list twice, so we page through the processes once ourselves.
+        def fetch() -> List[dict]:
+            return list(HostsGetAll(self.atlas, Settings.pageNum, Settings.itemsPerPage))
+
+        if self.cache:
+            host_dicts = self.cache.cached(self.atlas.group, 'processes', None, None, fetch, reuse=False)
+        else:
+            host_dicts = fetch()
+        self.load([Host(each) for each in host_dicts])
+
+    def load(self, host_list: List[Host]) -> None:
+        """Replaces the snapshot with the passed hosts."""
+        by_cluster: Dict[str, Dict[ReplicaSetTypes, List[Host]]] = defaultdict(lambda: defaultdict(list))
+        for host in host_list:
+            by_cluster[host_cluster_name(host)][host.type].append(host)
+        self._by_cluster = by_cluster
+        self.fetched_at = time.monotonic()
+        logger.info(f'Host inventory refreshed: {len(host_list)} hosts in {len(by_cluster)} clusters')
+
+    def _index(self) -> Dict[str, Dict[ReplicaSetTypes, List[Host]]]:
+        if self.is_stale:
+            with self._lock:
+                # Another thread may have refreshed while we waited for the lock.
+                if self.is_stale:
+                    self.refresh()
+        return self._by_cluster
+
+    def hosts(self, cluster_name: str) -> List[Host]:
+        """Returns all hosts of the named cluster."""
+        roles = self._index().get(cluster_name, {})
+        return [host for role_hosts in roles.values() for host in role_hosts]
+
+    def hosts_by_role(self, cluster_name: str, role: ReplicaSetTypes) -> List[Host]:
+        """Returns the hosts of the named cluster which currently have the passed replica set role."""
+        return list(self._index().get(cluster_name, {}).get(role, []))
+
+    def primary(self, cluster_name: str) -> Optional[Host]:
+        """Returns the current primary of the named cluster (of its first shard if sharded), or None."""
+        primaries = list(self.shard_primaries(cluster_name).values())
+        return primaries[0] if primaries else None
+
+    def shard_primaries(self, cluster_name: str) -> Dict[str, Host]:
+        """Returns the current primary of every shard of the named cluster by replica set name.
+
+        A replica set cluster has a single entry. Config server replica sets are left out.
+        """
+        primaries = self.hosts_by_role(cluster_name, ReplicaSetTypes.REPLICA_PRIMARY) + \
+            self.hosts_by_role(cluster_name, ReplicaSetTypes.SHARD_PRIMARY)
+        by_replica_set = OrderedDict()
+        for host in sorted(primaries, key=lambda each: each.replica_set_name or ''):
+            if not is_config_server(host):
+                by_replica_set[host.replica_set_name or cluster_name] = host
+        return by_replica_set
+
+
 class HostData:
-    def __init__(self, host_obj: Host):
+    __slots__ = ('host_obj', 'keep_points', 'errors', 'extra_metrics',
+                 'net_out_data', 'net_in_data',
+                 'cache_bytes_read', 'cache_bytes_written', 'cache_used', 'cache_dirty',
+                 'tickets_read', 'tickets_write', 'queued_readers', 'queued_writers',
+                 'db_data_size', 'db_storage', 'targeting_per_returned', 'targeting_objects',
+                 'disk_iops_read', 'disk_iops_read_max', 'disk_iops_write', 'disk_iops_write_max',
+                 'disk_latency_write', 'disk_latency_write_max', 'disk_latency_read', 'disk_latency_read_max',
+                 'disk_util', 'disk_util_max')
+
+    def __init__(self, host_obj: Host, keep_points: Union[bool, Collection[str]] = True):
         """Holds information for each Atlas Host
 
         :param host_obj: An atlasAPI host object.
+        :param keep_points: Keep the data points of each series. If False only the statistics are kept, computed
+            as each measurement is stored. A collection of measurement names keeps the data points of those only.
         """
         self.host_obj: Host = host_obj
-        self.net_out_data: Optional[AtlasMeasurement] = None
-        self.net_in_data: Optional[AtlasMeasurement] = None
+        self.keep_points = keep_points
+        self.net_out_data: Optional[CompactMeasurement] = None
+        self.net_in_data: Optional[CompactMeasurement] = None
 
-        self.cache_bytes_read: Optional[AtlasMeasurement] = None
-        self.cache_bytes_written: Optional[AtlasMeasurement] = None
-        self.cache_used: Optional[AtlasMeasurement] = None
-        self.cache_dirty: Optional[AtlasMeasurement] = None
+        self.cache_bytes_read: Optional[CompactMeasurement] = None
+        self.cache_bytes_written: Optional[CompactMeasurement] = None
+        self.cache_used: Optional[CompactMeasurement] = None
+        self.cache_dirty: Optional[CompactMeasurement] = None
 
-        self.tickets_read: Optional[AtlasMeasurement] = None
-        self.tickets_write: Optional[AtlasMeasurement] = None
+        self.tickets_read: Optional[CompactMeasurement] = None
+        self.tickets_write: Optional[CompactMeasurement] = None
 
-        self.queued_readers: Optional[AtlasMeasurement] = None
-        self.queued_writers: Optional[AtlasMeasurement] = None
+        self.queued_readers: Optional[CompactMeasurement] = None
+        self.queued_writers: Optional[CompactMeasurement] = None
 
-        self.db_data_size: Optional[AtlasMeasurement] = None
-        self.db_storage: Optional[AtlasMeasurement] = None
+        self.db_data_size: Optional[CompactMeasurement] = None
+        self.db_storage: Optional[CompactMeasurement] = None
 
-        self.targeting_per_returned: Optional[AtlasMeasurement] = None
-        self.targeting_objects: Optional[AtlasMeasurement] = None
+        self.targeting_per_returned: Optional[CompactMeasurement] = None
+        self.targeting_objects: Optional[CompactMeasurement] = None
 
+        self.disk_iops_read: Optional[CompactMeasurement] = None
+        self.disk_iops_read_max: Optional[CompactMeasurement] = None
+        self.disk_iops_write: Optional[CompactMeasurement] = None
+        self.disk_iops_write_max: Optional[CompactMeasurement] = None
 
-        self.disk_iops_read: Optional[AtlasMeasurement] = None
-        self.disk_iops_read_max: Optional[AtlasMeasurement] = None
-        self.disk_iops_write: Optional[AtlasMeasurement] = None
-        self.disk_iops_write_max : Optional[AtlasMeasurement] = None
+        self.disk_latency_write: Optional[CompactMeasurement] = None
+        self.disk_latency_write_max: Optional[CompactMeasurement] = None
+        self.disk_latency_read: Optional[CompactMeasurement] = None
+        self.disk_latency_read_max: Optional[CompactMeasurement] = None
 
-        self.disk_latency_write: Optional[AtlasMeasurement] = None
-        self.disk_latency_write_max: Optional[AtlasMeasurement] = None
-        self.disk_latency_read: Optional[AtlasMeasurement] = None
-        self.disk_latency_read_max: Optional[AtlasMeasurement] = None
+        self.disk_util: Optional[CompactMeasurement] = None
+        self.disk_util_max: Optional[CompactMeasurement] = None
 
-        self.disk_util: Optional[AtlasMeasurement] = None
-        self.disk_util_max: Optional[AtlasMeasurement] = None
+        self.extra_metrics: Dict[str, CompactMeasurement] = {}
+        self.errors: Dict[str, Exception] = {}
 
-    def store_measurement(self, measurements_obj: AtlasMeasurement) -> bool:
-        try:
-            #Disk Metrics
-            if measurements_obj.name == AtlasMeasurementTypes.Disk.IOPS.read:
-                self.disk_iops_read = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.IOPS.read_max:
-                self.disk_iops_read_max = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.IOPS.write:
-                self.disk_iops_write = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.IOPS.read_max:
-                self.disk_iops_read_max = measurements_obj
-
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.Latency.read:
-                self.disk_latency_read = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.Latency.read_max:
-                self.disk_latency_read_max = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.Latency.write:
-                self.disk_latency_write = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.Latency.write_max:
-                self.disk_latency_write_max = measurements_obj
-
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.Util.util:
-                self.disk_util = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Disk.Util.util_max:
-                self.disk_util_max = measurements_obj
-
-            # DB Size and Storage
-            if measurements_obj.name == AtlasMeasurementTypes.Db.data_size:
-                self.db_data_size = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Db.storage:
-                self.db_storage = measurements_obj
-
-            # Targeting
-            elif measurements_obj.name == AtlasMeasurementTypes.QueryTargetingScanned.per_returned:
-                self.targeting_per_returned = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.QueryTargetingScanned.objects_per_returned:
-                self.targeting_objects = measurements_obj
-
-            # Queues
-            elif measurements_obj.name == AtlasMeasurementTypes.GlobalLockCurrentQueue.writers:
-                self.queued_writers = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.GlobalLockCurrentQueue.readers:
-                self.queued_readers = measurements_obj
-
-            # Tickets
-            elif measurements_obj.name == AtlasMeasurementTypes.TicketsAvailable.reads:
-                self.tickets_read = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.TicketsAvailable.writes:
-                self.tickets_write = measurements_obj
-
-
-            # Network
-            elif measurements_obj.name == AtlasMeasurementTypes.Network.bytes_out:
-                self.net_out_data = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Network.bytes_in:
-                self.net_in_data = measurements_obj
-            # Cache
-            elif measurements_obj.name == AtlasMeasurementTypes.Cache.bytes_read:
-                self.cache_bytes_read = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Cache.bytes_written:
-                self.cache_bytes_written = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Cache.used:
-                self.cache_used = measurements_obj
-            elif measurements_obj.name == AtlasMeasurementTypes.Cache.dirty:
-                self.cache_dirty = measurements_obj
+    def store_measurement(self, measurements_obj: CompactMeasurement) -> bool:
+        """Stores a measurement in the HostData attribute registered for its name in HOST_METRIC_ATTRIBUTES.
 
-        except Exception as e:
-            logger.info(f'We got an error adding the measurement: {e}')
+        :return: False if the measurement is not registered.
+        """
+        if measurements_obj.name not in HOST_METRIC_ATTRIBUTES:
+            logger.debug(f'Skipping unregistered measurement {measurements_obj.name}')
             return False
+        if self.keep_points is not True and measurements_obj.name not in (self.keep_points or ()):
+            measurements_obj.drop_points()
+        attribute = HOST_METRIC_ATTRIBUTES[measurements_obj.name]
+        if attribute:
+            setattr(self, attribute, measurements_obj)
+        else:
+            self.extra_metrics[measurements_obj.name] = measurements_obj
         return True
 
+    def metric(self, name: str) -> Optional[CompactMeasurement]:
+        """Returns the stored measurement of the passed name, None if it was not stored."""
+        attribute = HOST_METRIC_ATTRIBUTES.get(name)
+        if attribute:
+            return getattr(self, attribute)
+        return self.extra_metrics.get(name)
+
+    def series_chunk(self, cluster_name: str) -> Dict[str, np.ndarray]:
+        """Returns the stored data points of every metric as long-format columns.
+
+        The columns are cluster, host, metric, timestamp (datetime64[s]) and value (float64), one entry per data
+        point, built from the measurement buffers without a Python object per point. Missing points are skipped.
+
+        :param cluster_name: The value of the cluster column.
+        """
+        measurements = [self.metric(each) for each in HOST_METRIC_ATTRIBUTES]
+        measurements = [each for each in measurements if each is not None and each.measurements_count]
+        timestamps = np.concatenate([each.timestamps for each in measurements] or [np.array([], 'datetime64[s]')])
+        values = np.concatenate([each.values for each in measurements] or [np.array([], np.float64)])
+        metrics = np.repeat(np.array([each.name for each in measurements], dtype=object),
+                            [each.measurements_count for each in measurements])
+        valid = np.isfinite(values)
+        return OrderedDict([('cluster', np.full(int(valid.sum()), cluster_name, dtype=object)),
+                            ('host', np.full(int(valid.sum()), self.cache_key, dtype=object)),
+                            ('metric', metrics[valid]),
+                            ('timestamp', timestamps[valid]),
+                            ('value', values[valid])])
+
+    @property
+    def cache_key(self) -> str:
+        return f'{self.host_obj.hostname}:{self.host_obj.port}'
+
+    def fetch_host_measurements(self, atlas_obj: Atlas, metrics: List[str],
+                                granularity: Optional[AtlasGranularities] = None,
+                                period: Optional[AtlasPeriods] = None,
+                                cache: Optional[MeasurementCache] = None,
+                                series_store: Optional[SeriesStore] = None) -> List[CompactMeasurement]:
+        """Fetches several host measurements with a single request.
+
+        The process measurements endpoint accepts a repeated `m` parameter, so all passed metrics are requested
+        at once instead of one round trip per metric. With a cache, only the metrics without a fresh cache entry
+        are requested. With a series store, only the points newer than the stored series are requested.
+
+        :param atlas_obj: An instantiated Atlas object for connectivity to the API
+        :param metrics: The measurement names to request.
+        :param granularity: The granularity to be used for metrics. (default = 1 hour)
+        :param period: The period to be used for metrics. (default = 1 week)
+        :param cache: An optional MeasurementCache
+        :param series_store: An optional SeriesStore for incremental sync, takes precedence over the cache.
+        :return: The parsed measurements.
+        """
+        granularity = granularity or AtlasGranularities.HOUR
+        period = period or AtlasPeriods.WEEKS_1
+        if series_store:
+            return self.sync_series(metrics, granularity, period, series_store,
+                                    lambda missing, time_range: self._request_host_measurements(
+                                        atlas_obj, missing, granularity, time_range))
+        raw_measurements = []
+        missing = list(metrics)
+        if cache:
+            missing = []
+            for each_metric in metrics:
+                cached = cache.get(self.cache_key, each_metric, granularity, period)
+                if cached is None:
+                    missing.append(each_metric)
+                else:
+                    raw_measurements.append(cached)
+        if missing:
+            response = self._request_host_measurements(atlas_obj, missing, granularity, {'period': period})
+            for each in response.get('measurements', []):
+                if cache:
+                    cache.put(self.cache_key, each.get('name'), granularity, period, each)
+                raw_measurements.append(each)
+        return list(measurements_from_response({'measurements': raw_measurements},
+                                               granularity=granularity, period=period))
+
+    def _request_host_measurements(self, atlas_obj: Atlas, metrics: List[str], granularity: AtlasGranularities,
+                                   time_range: dict) -> dict:
+        """Returns the raw API response for the passed metrics over a period or a start/end range."""
+        query = urlencode([('granularity', granularity)] + list(time_range.items()) + [('m', each) for each in metrics])
+        uri = f'{Settings.URI_STUB}/groups/{self.host_obj.group_id}/processes/{self.host_obj.hostname}:' \
+              f'{self.host_obj.port}/measurements?{query}'
+        return atlas_obj.network.get(Settings.BASE_URL + uri)
+
+    def _request_disk_measurements(self, atlas_obj: Atlas, partition_name: str, granularity: AtlasGranularities,
+                                   time_range: dict) -> dict:
+        """Returns the raw API response for all measurements of a partition over a period or a start/end range."""
+        uri = Settings.api_resources["Monitoring and Logs"]["Get Measurements of a Disk for Process"].format(
+            group_id=self.host_obj.group_id,
+            host=self.host_obj.hostname,
+            port=self.host_obj.port,
+            disk_name=partition_name,
+        )
+        return atlas_obj.network.get_big(Settings.BASE_URL + uri, params=dict(time_range, granularity=granularity))
+
+    def sync_series(self, metrics: List[str], granularity: AtlasGranularities, period: AtlasPeriods,
+                    series_store: SeriesStore, request, single_request: bool = False) -> List[CompactMeasurement]:
+        """Incrementally syncs measurements into a SeriesStore and returns the merged series.
+
+        Only the points after the last stored timestamp of each metric are requested, using start/end instead of
+        the period. A metric whose stored series does not reach back to the start of the period (e.g. it was only
+        synced over a shorter period) is fetched again over the whole period. The merged series is cut to the
+        period, so the statistics are computed over the whole period as with a full fetch.
+
+        :param metrics: The measurement names to sync.
+        :param granularity:
+        :param period: The period the merged series covers.
+        :param series_store: The SeriesStore holding the series of previous runs.
+        :param request: Callable taking (metrics, time_range dict) and returning a raw API response.
+        :param single_request: Fetch all metrics in one request from the oldest last timestamp, for endpoints
+            which always return every metric (disk partitions).
+        """
+        end = datetime.now(timezone.utc)
+        since = (end - isodate.parse_duration(period)).strftime(ATLAS_TIMESTAMP)
+        by_start: Dict[str, List[str]] = defaultdict(list)
+        for each_metric in metrics:
+            covered, last = series_store.coverage(self.cache_key, each_metric, granularity)
+            by_start[max(last, since) if last and covered and covered <= since else since].append(each_metric)
+        if single_request:
+            by_start = {min(by_start): list(metrics)}
+
+        raw_measurements = []
+        for start, start_metrics in by_start.items():
+            logger.info(f'Syncing {len(start_metrics)} metrics for {self.host_obj.hostname} since {start}')
+            response = request(start_metrics, {'start': start, 'end': end.strftime(ATLAS_TIMESTAMP)})
+            for each in response.get('measurements', []):
+                raw_measurements.append(series_store.merge(self.cache_key, each, granularity, since, start=start))
+        return list(measurements_from_response({'measurements': raw_measurements},
+                                               granularity=granularity, period=period))
+
+    def fetch_disk_measurements(self, atlas_obj: Atlas, granularity: Optional[AtlasGranularities] = None,
+                                period: Optional[AtlasPeriods] = None, partition_name: str = 'data',
+                                cache: Optional[MeasurementCache] = None,
+                                series_store: Optional[SeriesStore] = None) -> List[CompactMeasurement]:
+        """Fetches all measurements of a partition (default = data) of the host."""
+        granularity = granularity or AtlasGranularities.HOUR
+        period = period or AtlasPeriods.WEEKS_1
+        if series_store:
+            return self.sync_series(DISK_METRICS, granularity, period, series_store,
+                                    lambda metrics, time_range: self._request_disk_measurements(
+                                        atlas_obj, partition_name, granularity, time_range),
+                                    single_request=True)
+
+        def fetch() -> dict:
+            return self._request_disk_measurements(atlas_obj, partition_name, granularity, {'period': period})
+
+        if cache:
+            response = cache.cached(self.cache_key, f'disk:{partition_name}', granularity, period, fetch)
+        else:
+            response = fetch()
+        return list(measurements_from_response(response, granularity=granularity, period=period))
+
     def store_measurements(self, atlas_obj: Atlas, granularity: AtlasGranularities = AtlasGranularities.FIVE_MINUTE,
-                           period=AtlasPeriods.WEEKS_1) -> None:
+                           period=AtlasPeriods.WEEKS_1, max_workers: int = 4,
+                           cache: Optional[MeasurementCache] = None,
+                           series_store: Optional[SeriesStore] = None,
+                           metrics: Optional[List[str]] = None, disk: bool = True) -> None:
         """Stores measurements from the API to the HostData object.
 
-
+        All METRICS are requested in one batched call while the data partition stats are fetched at the same time.
+        If the batched call fails, each metric is retried on its own in a bounded thread pool. A metric (or the
+        disk stats) which still fails is recorded in `errors` instead of aborting the host.
 
         :param atlas_obj (Atlas):
         :param granularity:
         :param period:
+        :param max_workers: Maximum concurrent requests for this host.
+        :param cache: An optional MeasurementCache, fresh cached series are not requested again.
+        :param series_store: An optional SeriesStore, to only request the points added since the previous run.
+        :param metrics: The host measurements to request (default = METRICS), an empty list requests none.
+        :param disk: Request the data partition measurements.
+        """
+        self.errors = {}
+        metrics = METRICS if metrics is None else metrics
+        logger.info(f'Getting Measurements for {len(metrics)} metrics. . .')
+        with ThreadPoolExecutor(max_workers=max(2, max_workers), thread_name_prefix='host-metrics') as pool:
+            # Retrieving Disk Measurements in the background
+            disk_future = pool.submit(self.fetch_disk_measurements, atlas_obj, granularity=granularity,
+                                      period=period, cache=cache, series_store=series_store) if disk else None
+            # Retrieving and storing Host Metrics
+            try:
+                results = self.fetch_host_measurements(atlas_obj, metrics, granularity=granularity, period=period,
+                                                       cache=cache, series_store=series_store) if metrics else []
+            except Exception as e:
+                logger.warning(f'Batched measurement request for {self.host_obj.hostname} failed ({e}), '
+                               f'requesting each metric separately.')
+                results = []
+                futures = {pool.submit(self.fetch_host_measurements, atlas_obj, [each_measurement],
+                                       granularity=granularity, period=period, cache=cache,
+                                       series_store=series_store): each_measurement
+                           for each_measurement in metrics}
+                for each_future in as_completed(futures):
+                    try:
+                        results.extend(each_future.result())
+                    except Exception as e:
+                        logger.warning(f'Could not get {futures[each_future]} for {self.host_obj.hostname}: {e}')
+                        self.errors[futures[each_future]] = e
+            for each_result in results:
+                self.store_measurement(each_result)
+            for each_missing in set(metrics) - {each_result.name for each_result in results} - set(self.errors):
+                self.errors[each_missing] = LookupError(f'{each_missing} was not returned by the API')
+
+            # Storing Disk Measurements
+            if disk_future is None:
+                return
+            try:
+                for each_disk_measure in disk_future.result():
+                    self.store_measurement(each_disk_measure)
+            except Exception as e:
+                logger.warning(f'Could not get disk measurements for {self.host_obj.hostname}: {e}')
+                self.errors['disk'] = e
+
+
+class NamespaceStats:
+    def __init__(self, databases: int = 0, collections: float = 0, indexes: float = 0, views: float = 0,
+                 objects: float = 0, sampled: Optional[int] = None, estimated: bool = False,
+                 errors: Optional[Dict[str, Optional[float]]] = None):
+        """Namespace counts for all userland databases of a cluster, collected in a single pass.
+
+        Each count is the sum over all databases of the matching Namespaces measurement. When only some of the
+        databases were measured (see NamespaceCounter), the counts are estimated and `errors` holds the half
+        width of their confidence interval.
+
+        :param databases: Count of userland databases
+        :param collections: Total of DATABASE_COLLECTION_COUNT
+        :param indexes: Total of DATABASE_INDEX_COUNT
+        :param views: Total of DATABASE_VIEW_COUNT
+        :param objects: Total of DATABASE_OBJECT_COUNT
+        :param sampled: Count of databases measured, all of them by default.
+        :param estimated: True if the counts are estimated from the sampled databases.
+        :param errors: The +/- bound of each estimated count by attribute (collections, indexes ...), None if
+            fewer than two databases were sampled.
+
+        A count is None when its measurement was not requested.
+        """
+        self.databases = databases
+        self.collections = collections
+        self.indexes = indexes
+        self.views = views
+        self.objects = objects
+        self.sampled = databases if sampled is None else sampled
+        self.estimated = estimated
+        self.errors = errors or {}
+
+
+class NamespaceCounter:
+    def __init__(self, counters: Optional[Collection[str]] = None,
+                 granularity: AtlasGranularities = AtlasGranularities.DAY, period: AtlasPeriods = AtlasPeriods.HOURS_48,
+                 max_databases: Optional[int] = None, max_seconds: Optional[float] = None,
+                 confidence: float = 0.95, max_workers: int = 1, seed: Optional[int] = None):
+        """How the namespace counts of a cluster are collected, see ClusterData.namespace_stats.
+
+        Only the `counters` measurements are requested, at the coarsest granularity and shortest period that still
+        hold the latest value of each counter, which is the value counted for a database.
+
+        Clusters with more than `max_databases` databases, or whose databases take more than `max_seconds` to
+        measure, are estimated: the databases are measured in random order, and the totals are extrapolated from
+        the ones measured before the budget ran out, with a `confidence` interval (normal approximation with
+        finite population correction).
+
+        :param counters: The Namespaces measurements to count (default = all of NAMESPACE_COUNTERS)
+        :param granularity: The granularity of the requests.
+        :param period: The period of the requests, at least one `granularity` long.
+        :param max_databases: Databases measured per cluster, None to measure all of them.
+        :param max_seconds: Seconds spent measuring the databases of a cluster, None for no limit.
+        :param confidence: The confidence level of the estimation bounds.
+        :param max_workers: Databases measured at the same time.
+        :param seed: Seeds the random order of the databases of each cluster, for reproducible samples.
+        """
+        self.counters = list(NAMESPACE_COUNTERS if counters is None else counters)
+        self.granularity = granularity
+        self.period = period
+        self.max_databases = max_databases
+        self.max_seconds = max_seconds
+        self.confidence = confidence
+        self.max_workers = max_workers
+        self.seed = seed
+
+    def with_counters(self, counters: Collection[str]) -> 'NamespaceCounter':
+        """Returns a copy of the counter requesting only the passed measurements."""
+        counter = copy.copy(self)
+        counter.counters = list(counters)
+        return counter
+
+    @property
+    def params(self) -> dict:
+        """The query parameters of a database measurements request."""
+        return {'granularity': self.granularity, 'period': self.period, 'm': self.counters}
+
+    def database_counts(self, measurements: Iterable[CompactMeasurement]) -> Dict[str, float]:
+        """Returns the latest value of each counter of a database by attribute, 0 for a missing counter."""
+        counts = OrderedDict((NAMESPACE_COUNTERS[each], 0.0) for each in self.counters)
+        for each_measurement in measurements:
+            attribute = NAMESPACE_COUNTERS.get(each_measurement.name)
+            if attribute in counts:
+                counts[attribute] = each_measurement.latest or 0.0
+        return counts
+
+    @staticmethod
+    def combine(shard_counts: List[Dict[str, float]]) -> Dict[str, float]:
+        """Rolls up the counts of a database on several shards as set in NAMESPACE_SHARD_ROLLUPS."""
+        if len(shard_counts) == 1:
+            return shard_counts[0]
+        counts = OrderedDict()
+        for attribute in (shard_counts[0] if shard_counts else {}):
+            rollup = max if NAMESPACE_SHARD_ROLLUPS.get(attribute) == 'max' else sum
+            counts[attribute] = rollup(each[attribute] for each in shard_counts)
+        return counts
+
+    def order(self, cluster_id: str, databases: List[str]) -> List[str]:
+        """Returns the databases in the order they are measured, random unless every database is measured."""
+        if self.max_databases is None and self.max_seconds is None:
+            return list(databases)
+        ordered = list(databases)
+        random.Random(None if self.seed is None else f'{self.seed}:{cluster_id}').shuffle(ordered)
+        return ordered
+
+    def stats(self, databases: int, counts: List[Dict[str, float]]) -> NamespaceStats:
+        """Sums or, when not every database was measured, estimates the counts of a cluster.
+
+        :param databases: Count of userland databases of the cluster.
+        :param counts: The counts of each measured database, see database_counts.
+        """
+        sampled = len(counts)
+        totals = OrderedDict((NAMESPACE_COUNTERS[each], 0.0) for each in self.counters)
+        for each_counts in counts:
+            for attribute, value in each_counts.items():
+                totals[attribute] += value
+        # Counters that were not requested are unknown, rather than zero.
+        uncounted = {each: None for each in NAMESPACE_COUNTERS.values() if each not in totals}
+        if sampled >= databases:
+            return NamespaceStats(databases=databases, sampled=sampled, **totals, **uncounted)
+        errors = OrderedDict()
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        for attribute in totals:
+            values = np.array([each[attribute] for each in counts])
+            totals[attribute] = databases * float(values.mean()) if sampled else None
+            if sampled >= 2:
+                correction = np.sqrt((databases - sampled) / (databases - 1))
+                errors[attribute] = float(z * databases * values.std(ddof=1) / np.sqrt(sampled) * correction)
+            else:
+                errors[attribute] = None
+        return NamespaceStats(databases=databases, sampled=sampled, estimated=True, errors=errors, **totals,
+                              **uncounted)
+
+    def count(self, cluster: 'ClusterData', atlas_obj: Atlas, primaries: Dict[str, Host]) -> NamespaceStats:
+        """Lists the databases of every shard primary and measures them, within the budget.
+
+        A database is counted once however many shards hold it, its counts on each shard are rolled up (see
+        combine), and the budget applies to databases rather than to the requests on each shard.
+
+        :param cluster:
+        :param atlas_obj:
+        :param primaries: The primary of every shard by replica set name, see ClusterData.shard_primaries.
         """
-        status_str = f'Getting Measurements for {len(METRICS)} metrics. . .'
-        # Retrieving and storing Host Metrics
-        for each_measurement in METRICS:
-            logger.info(status_str)
-            result = list(self.host_obj.get_measurement_for_host(atlas_obj=atlas_obj,
-                                                                 granularity=granularity, period=period,
-                                                                 measurement=each_measurement))[0]
-            self.store_measurement(result)
-            status_str.swapcase()
-        # Retrieving and Storing Disk Measurements
-        for each_disk_measure in self.host_obj.data_partition_stats(atlas_obj=atlas_obj,
-                                                                    granularity=granularity,
-                                                                    period=period):
-            self.store_measurement(each_disk_measure)
+        shard_databases = OrderedDict((name, cluster.databases(atlas_obj, each)) for name, each in primaries.items())
+        databases = list(OrderedDict.fromkeys(each for names in shard_databases.values() for each in names))
+        if not self.counters:
+            return self.stats(len(databases), [{} for _ in databases])
+        ordered = self.order(cluster.id, databases)
+        if self.max_databases is not None:
+            ordered = ordered[:self.max_databases]
+
+        def measure(database_name: str) -> Dict[str, float]:
+            return self.combine([self.database_counts(cluster.database_measurements(atlas_obj, primaries[shard],
+                                                                                    database_name, counter=self))
+                                 for shard, names in shard_databases.items() if database_name in names])
+
+        counts = []
+        start = time.monotonic()
+        batch_size = max(self.max_workers, 1)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cluster-databases') \
+            if self.max_workers > 1 else None
+        try:
+            for index in range(0, len(ordered), batch_size):
+                if self.max_seconds is not None and counts and time.monotonic() - start > self.max_seconds:
+                    logger.info(f'Namespace budget of {cluster.name} exhausted after {len(counts)} databases')
+                    break
+                batch = ordered[index:index + batch_size]
+                counts.extend(pool.map(measure, batch) if pool else map(measure, batch))
+        finally:
+            if pool:
+                pool.shutdown(wait=True)
+        return self.stats(len(databases), counts)
 
 
 class ClusterData:
@@ -183,6 +853,9 @@ class ClusterData:
     def __init__(self, project_name: str, project_id: str,
                  id: str, name: str, disk_size: int, tier: str, IOPS: int, io_type: str,
                  shards: int, electable: int, analytics: int, ro: int,
+                 inventory: Optional[HostInventory] = None, cache: Optional[MeasurementCache] = None,
+                 series_store: Optional[SeriesStore] = None, regions: str = '',
+                 namespace_counter: Optional[NamespaceCounter] = None,
                  ):
         """Holds key data for an Atlas cluster.
 
@@ -200,8 +873,17 @@ class ClusterData:
         :param electable:
         :param analytics:
         :param ro:
+        :param inventory: A shared HostInventory, used instead of re-listing the project hosts on each call.
+        :param cache: A MeasurementCache for database listings and measurements.
+        :param series_store: A SeriesStore to sync the primary's metrics incrementally.
+        :param regions: Comma separated names of the regions the cluster has nodes in.
+        :param namespace_counter: How namespace_stats collects the counts (default = NamespaceCounter())
         :db_count:
         """
+        self._inventory = inventory
+        self._namespace_counter = namespace_counter
+        self._cache = cache
+        self._series_store = series_store
         self.ro = ro
         self.analytics = analytics
         self.electable = electable
@@ -214,20 +896,66 @@ class ClusterData:
         self.id = id
         self.project_id = project_id
         self.project_name = project_name
+        self.regions = regions
+
+    @classmethod
+    def from_dict(cls, data_dict: dict, project_name: str, project_id: str,
+                  inventory: Optional[HostInventory] = None,
+                  cache: Optional[MeasurementCache] = None,
+                  series_store: Optional[SeriesStore] = None,
+                  namespace_counter: Optional[NamespaceCounter] = None) -> 'ClusterData':
+        """Creates a ClusterData from a cluster dict in the format of the Atlas API.
+
+        :param data_dict: A cluster as returned by the Atlas clusters endpoint.
+        :param project_name:
+        :param project_id:
+        :param inventory: A shared HostInventory for host lookups.
+        :param cache: A shared MeasurementCache.
+        :param series_store: A shared SeriesStore.
+        :param namespace_counter: A shared NamespaceCounter.
+        """
+        # ClusterConfig only parses a single replication spec, the topology is read from all of them.
+        replication_specs = data_dict.get('replicationSpecs') or []
+        cluster = ClusterConfig.fill_from_dict(dict(data_dict, replicationSpecs=replication_specs[:1]))
+        topology = cluster_topology(data_dict)
+        return cls(project_name, project_id,
+                   cluster.id, cluster.name, cluster.disk_size_gb,
+                   cluster.providerSettings.instance_size_name, cluster.providerSettings.diskIOPS
+                   , cluster.providerSettings.volumeType, topology['shards'],
+                   topology['electable'], topology['analytics'], topology['ro'],
+                   inventory=inventory, cache=cache, series_store=series_store, regions=topology['regions'],
+                   namespace_counter=namespace_counter,
+                   )
+
+    def as_dict(self) -> OrderedDict:
+        """Returns the public cluster attributes, used as the base of a report row."""
+        return OrderedDict((key, value) for key, value in self.__dict__.items() if not key.startswith('_'))
 
     def hosts(self, atlas_obj: Atlas) -> Iterable[Host]:
+        if self._inventory:
+            logger.info(f'Cluster: {self.name}')
+            return self._inventory.hosts(self.name)
         atlas_obj.Hosts.fill_host_list()
         host_list = list(atlas_obj.Hosts.host_list)
         logger.info(f'Cluster: {self.name}')
-        filtered = [host for host in host_list if host.cluster_name == self.name]
+        filtered = [host for host in host_list if host_cluster_name(host) == self.name]
         return filtered
 
+    def shard_primaries(self, atlas_obj: Atlas) -> Dict[str, Host]:
+        """Returns the current primary of every shard by replica set name, a replica set has a single entry."""
+        if self._inventory:
+            return self._inventory.shard_primaries(self.name)
+        primary = self.primary(atlas_obj)
+        return OrderedDict([(self.name, primary)]) if primary else OrderedDict()
+
     def primary(self, atlas_obj: Atlas) -> Optional[Host]:
         """Returns a Host object of the CLusters current primary.
 
         :param atlas_obj:
         :return:
         """
+        if self._inventory:
+            return self._inventory.primary(self.name)
         primary_member = None
         for each in self.hosts(atlas_obj):
             if each.type == ReplicaSetTypes.REPLICA_PRIMARY:
@@ -236,39 +964,66 @@ class ClusterData:
                 pass
         return primary_member
 
+    def databases(self, atlas_obj: Atlas, primary: Host) -> List[str]:
+        """Returns the names of all userland databases on the passed primary."""
+        def fetch() -> List[str]:
+            return [each for each in primary.get_databases(atlas_obj) if each not in SYSTEM_DATABASES]
+
+        if self._cache:
+            return self._cache.cached(f'{primary.hostname}:{primary.port}', 'databases', None, None, fetch)
+        return fetch()
+
+    def database_measurements(self, atlas_obj: Atlas, primary: Host, database_name: str,
+                              granularity: AtlasGranularities = AtlasGranularities.HOUR,
+                              period: AtlasPeriods = AtlasPeriods.WEEKS_1,
+                              counter: Optional[NamespaceCounter] = None) -> List[CompactMeasurement]:
+        """Returns the Namespaces measurements of a database on the passed primary.
+
+        :param counter: Only request the measurements of this NamespaceCounter, at its granularity and period,
+            instead of all of them.
+        """
+        params = counter.params if counter else {'granularity': granularity, 'period': period}
+        granularity, period = params['granularity'], params['period']
+        measurement = f'database:{database_name}' + (f':{",".join(counter.counters)}' if counter else '')
+
+        def fetch() -> dict:
+            uri = Settings.api_resources["Monitoring and Logs"]["Get Measurements of a Database for Process"].format(
+                group_id=primary.group_id,
+                host=primary.hostname,
+                port=primary.port,
+                database_name=database_name,
+            )
+            return atlas_obj.network.get_big(Settings.BASE_URL + uri, params=dict(params))
+
+        if self._cache:
+            response = self._cache.cached(f'{primary.hostname}:{primary.port}', measurement, granularity, period,
+                                          fetch)
+        else:
+            response = fetch()
+        return list(measurements_from_response(response, granularity=granularity, period=period))
+
     def db_count(self, atlas_obj: Atlas, userland_only: bool = True) -> int:
-        """Returns a count of userland databases on the Primary of the cluster.
+        """Returns a count of userland databases on the Primary of the cluster (on any shard primary if sharded).
 
         :param atlas_obj:
         :param userland_only:
         :return:
         """
-        primary = self.primary(atlas_obj)
-        count = 0
-        if primary:
-            for each in primary.get_databases(atlas_obj):
-                if each not in ['admin', 'local', 'config']:
-                    count += 1
-        return count
+        return len({each for primary in self.shard_primaries(atlas_obj).values()
+                    for each in self.databases(atlas_obj, primary)})
 
     def db_item_count(self, atlas_obj: Atlas, measurement_to_count: AtlasMeasurementTypes.Namespaces):
         """Returns the total count of the passed Namespace measurement for all databases.
 
-        Iterates through all userland databases and adds the max value.
+        Only the passed measurement is requested for each userland database, see namespace_stats.
 
         :param atlas_obj:
         :param measurement_to_count:
         """
-        primary = self.primary(atlas_obj)
         logger.info(F"Getting counts for {measurement_to_count}")
-        item_count = 0
-        for each_database in primary.get_databases(atlas_obj=atlas_obj):
-            if each_database not in ['admin', 'local', 'config']:
-                database_stats = primary.get_measurements_for_database(atlas_obj=atlas_obj, database_name=each_database)
-                for each_measurement in database_stats:
-                    if each_measurement.name == measurement_to_count:
-                        item_count += each_measurement.measurement_stats.max
-        return item_count
+        counter = (self._namespace_counter or NamespaceCounter()).with_counters([measurement_to_count])
+        stats = self.namespace_stats(atlas_obj, counter=counter)
+        return getattr(stats, NAMESPACE_COUNTERS[measurement_to_count]) if stats else 0
 
     def count_collections(self, atlas_obj: Atlas) -> int:
         return self.db_item_count(atlas_obj,AtlasMeasurementTypes.Namespaces.collection_count)
@@ -287,8 +1042,33 @@ class ClusterData:
         """
         return self.db_item_count(atlas_obj,AtlasMeasurementTypes.Namespaces.object_count)
 
+    def namespace_stats(self, atlas_obj: Atlas, counter: Optional[NamespaceCounter] = None,
+                        counters: Optional[Collection[str]] = None) -> Optional[NamespaceStats]:
+        """Returns database, collection, index, view and object counts for all userland databases.
+
+        Lists the primary's databases once and fetches each database's counters once, folding every counter in
+        the same pass instead of one full sweep per counter. The databases of a sharded cluster are listed and
+        measured on every shard primary, and rolled up as set in NAMESPACE_SHARD_ROLLUPS. With a NamespaceCounter
+        budget, the counts of clusters with many databases are estimated from a sample of them.
+
+        :param atlas_obj:
+        :param counter: Overrides the cluster's NamespaceCounter.
+        :param counters: Only counts these Namespaces measurements, an empty list only counts the databases.
+        :return: The counts, or None if the cluster has no primary.
+        """
+        primaries = self.shard_primaries(atlas_obj)
+        if not primaries:
+            return None
+        logger.info(f'Getting namespace counts for {self.name}')
+        counter = counter or self._namespace_counter or NamespaceCounter()
+        if counters is not None:
+            counter = counter.with_counters(counters)
+        return counter.count(self, atlas_obj, primaries)
+
     def primary_metrics(self, atlas_obj: Atlas,
-                        granularity: AtlasGranularities = None, period: AtlasPeriods = None) -> Optional[HostData]:
+                        granularity: AtlasGranularities = None, period: AtlasPeriods = None,
+                        keep_points: Union[bool, Collection[str]] = True, metrics: Optional[List[str]] = None,
+                        disk: bool = True) -> Optional[HostData]:
         """Returns Atlas Metrics for the cluster's primary.
 
         Returns the pre-defined metrics defined in METRICS
@@ -296,58 +1076,504 @@ class ClusterData:
         :param atlas_obj: and instantiated Atlas object for connectivity to the API
         :param granularity: The granularity to be used for metrics.
         :param period: The period to be used for metrics.
+        :param keep_points: Keep the data points, or only the statistics of each series. A collection of
+            measurement names keeps the data points of those only.
+        :param metrics: The host measurements to request (default = METRICS)
+        :param disk: Request the data partition measurements.
         :return:
         """
-        primary: HostData = HostData(self.primary(atlas_obj=atlas_obj))
+        primary: HostData = HostData(self.primary(atlas_obj=atlas_obj), keep_points=keep_points)
         if primary.host_obj:
             logger.info(f'The primary is {primary.host_obj.hostname_alias}')
-            primary.store_measurements(atlas_obj, granularity=granularity, period=period)
+            primary.store_measurements(atlas_obj, granularity=granularity, period=period, cache=self._cache,
+                                       series_store=self._series_store, metrics=metrics, disk=disk)
             return primary
         else:
             return None
 
+    def shard_metrics(self, atlas_obj: Atlas, granularity: AtlasGranularities = None, period: AtlasPeriods = None,
+                      keep_points: Union[bool, Collection[str]] = True, max_workers: int = 4,
+                      metrics: Optional[List[str]] = None, disk: bool = True) -> Dict[str, HostData]:
+        """Returns Atlas Metrics for the primary of every shard, by replica set name.
+
+        A replica set cluster returns its primary only. The shards of a sharded cluster are fetched in parallel.
+
+        :param atlas_obj: and instantiated Atlas object for connectivity to the API
+        :param granularity: The granularity to be used for metrics.
+        :param period: The period to be used for metrics.
+        :param keep_points: As for primary_metrics.
+        :param max_workers: Shards fetched concurrently.
+        :param metrics: As for primary_metrics.
+        :param disk: As for primary_metrics.
+        """
+        if not self._inventory:
+            primary = self.primary_metrics(atlas_obj, granularity=granularity, period=period, keep_points=keep_points,
+                                           metrics=metrics, disk=disk)
+            return OrderedDict([(self.name, primary)]) if primary else OrderedDict()
+        return self._hosts_metrics(atlas_obj, self._inventory.shard_primaries(self.name), granularity, period,
+                                   keep_points, max_workers, metrics=metrics, disk=disk)
+
+    def member_metrics(self, atlas_obj: Atlas, granularity: AtlasGranularities = None, period: AtlasPeriods = None,
+                       keep_points: Union[bool, Collection[str]] = True, max_workers: int = 4,
+                       metrics: Optional[List[str]] = None, disk: bool = True) -> Dict[str, HostData]:
+        """Returns Atlas Metrics for every member of the cluster (all hosts of every role), by hostname:port.
+
+        Members are fetched in parallel, each with the METRICS and DISK_METRICS requests of store_measurements.
+
+        :param atlas_obj: and instantiated Atlas object for connectivity to the API
+        :param granularity: The granularity to be used for metrics.
+        :param period: The period to be used for metrics.
+        :param keep_points: As for primary_metrics.
+        :param max_workers: Members fetched concurrently.
+        :param metrics: As for primary_metrics.
+        :param disk: As for primary_metrics.
+        """
+        hosts = OrderedDict((f'{each.hostname}:{each.port}', each) for each in self.hosts(atlas_obj))
+        return self._hosts_metrics(atlas_obj, hosts, granularity, period, keep_points, max_workers, metrics=metrics,
+                                   disk=disk)
+
+    def _hosts_metrics(self, atlas_obj: Atlas, hosts: Dict[str, Host], granularity: AtlasGranularities,
+                       period: AtlasPeriods, keep_points: Union[bool, Collection[str]],
+                       max_workers: int, metrics: Optional[List[str]] = None,
+                       disk: bool = True) -> Dict[str, HostData]:
+        """Fetches the metrics of the passed hosts, on a thread pool when there are several."""
+        def fetch(host: Host) -> HostData:
+            host_data = HostData(host, keep_points=keep_points)
+            host_data.store_measurements(atlas_obj, granularity=granularity, period=period, cache=self._cache,
+                                         series_store=self._series_store, metrics=metrics, disk=disk)
+            return host_data
+
+        if len(hosts) <= 1 or max_workers <= 1:
+            return OrderedDict((key, fetch(host)) for key, host in hosts.items())
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts)), thread_name_prefix='cluster-hosts') as pool:
+            return OrderedDict(zip(hosts, pool.map(fetch, hosts.values())))
+
+
+def report_row(cluster: ClusterData, host_data: Optional[HostData], namespace_stats: Optional[NamespaceStats],
+               granularity: AtlasGranularities, period: AtlasPeriods,
+               shard_data: Optional[Dict[str, HostData]] = None, plan: Optional['ReportPlan'] = None) -> OrderedDict:
+    """Builds a report row from a cluster, the metrics of its primary and its namespace counts.
+
+    There is a column for every measurement in HOST_METRIC_ATTRIBUTES, None if it could not be fetched. If the
+    cluster has no primary only the cluster attributes are returned.
+
+    With the metrics of more than one shard, the metric columns roll the shards up as set in SHARD_ROLLUPS, and
+    every shard also gets its own `<replica set name>:<metric>` columns.
+
+    :param cluster:
+    :param host_data: The primary's metrics, None if there is no primary.
+    :param namespace_stats: The cluster's namespace counts, None if there is no primary.
+    :param granularity:
+    :param period:
+    :param shard_data: The metrics of each shard primary by replica set name, see ClusterData.shard_metrics.
+    :param plan: The ReportPlan the metrics and counts were fetched for, only its columns are built.
+    """
+    base_dict = cluster.as_dict()
+    if (host_data is None and (plan is None or plan.fetches_metrics)) or \
+            (namespace_stats is None and (plan is None or plan.namespaces)):
+        logger.info(f"No primary available for {cluster.name}, could not get metrics")
+        return base_dict
+    if namespace_stats is not None:
+        base_dict.update(namespace_columns(namespace_stats))
+    if host_data is not None:
+        base_dict.update(metric_columns(host_data, granularity, period, shard_data=shard_data,
+                                        metrics=plan.metrics if plan else None))
+    else:
+        base_dict.update(Granularity=granularity, Period=period)
+    return base_dict
+
+
+def namespace_columns(namespace_stats: NamespaceStats) -> OrderedDict:
+    """Returns the namespace count columns of a report row."""
+    columns = OrderedDict([('views', namespace_stats.views), ('objects', namespace_stats.objects),
+                           ('indexes', namespace_stats.indexes), ('collections', namespace_stats.collections),
+                           ('databases', namespace_stats.databases)])
+    # Whether the counts are estimated from a sample of the databases, and the margin of error of each estimate.
+    columns['namespaces_estimated'] = namespace_stats.estimated
+    columns['namespaces_sampled'] = namespace_stats.sampled
+    for each_attribute in ('views', 'objects', 'indexes', 'collections'):
+        columns[f'{each_attribute}_margin'] = namespace_stats.errors.get(each_attribute)
+    return columns
+
+
+def metric_columns(host_data: HostData, granularity: AtlasGranularities, period: AtlasPeriods,
+                   shard_data: Optional[Dict[str, HostData]] = None,
+                   metrics: Optional[Collection[str]] = None) -> OrderedDict:
+    """Returns the host and data disk measurement columns of a report row, see report_row.
+
+    :param metrics: Only returns the columns of these measurements (default = every one of HOST_METRIC_ATTRIBUTES)
+    """
+    columns = OrderedDict()
+    if shard_data and len(shard_data) > 1:
+        shard_means = OrderedDict((shard, metric_means(each, metrics)) for shard, each in shard_data.items())
+        for each_name in (HOST_METRIC_ATTRIBUTES if metrics is None else metrics):
+            values = [means[each_name] for means in shard_means.values() if means[each_name] is not None]
+            rollup = {'sum': sum, 'min': min}.get(SHARD_ROLLUPS.get(each_name), max)
+            columns[str(each_name)] = rollup(values) if values else None
+        for shard, means in shard_means.items():
+            for each_name, each_value in means.items():
+                columns[f'{shard}:{each_name}'] = each_value
+    else:
+        columns.update(metric_means(host_data, metrics))
+
+    columns['Granularity'] = granularity
+    columns['Period'] = period
+    return columns
+
+
+def project_atlas(atlas_obj: Atlas, project_id: str) -> Atlas:
+    """Returns an Atlas object for another project, sharing the network (and so any rate limiter) of atlas_obj."""
+    if project_id == atlas_obj.group:
+        return atlas_obj
+    project_obj = Atlas(user='', password='', group=project_id)
+    project_obj.network = atlas_obj.network
+    return project_obj
+
+
+def metric_means(host_data: HostData, metrics: Optional[Collection[str]] = None) -> OrderedDict:
+    """Returns the mean of every measurement in HOST_METRIC_ATTRIBUTES, None if it could not be fetched.
+
+    :param metrics: Only returns the means of these measurements.
+    """
+    means = OrderedDict()
+    for each_name in (HOST_METRIC_ATTRIBUTES if metrics is None else metrics):
+        measurement = host_data.metric(each_name)
+        means[str(each_name)] = measurement.measurement_stats.mean if measurement else None
+    return means
+
+
+# Report names of the replica set roles, in column order.
+MEMBER_ROLES = OrderedDict([
+    (ReplicaSetTypes.REPLICA_PRIMARY, 'primary'),
+    (ReplicaSetTypes.SHARD_PRIMARY, 'primary'),
+    (ReplicaSetTypes.REPLICA_SECONDARY, 'secondary'),
+    (ReplicaSetTypes.SHARD_SECONDARY, 'secondary'),
+    (ReplicaSetTypes.RECOVERING, 'recovering'),
+    (ReplicaSetTypes.SHARD_CONFIG, 'config'),
+    (ReplicaSetTypes.SHARD_CONFIG_PRIMARY, 'config'),
+    (ReplicaSetTypes.SHARD_CONFIG_SECONDARY, 'config'),
+    (ReplicaSetTypes.SHARD_MONGOS, 'mongos'),
+    (ReplicaSetTypes.SHARD_STANDALONE, 'standalone'),
+    (ReplicaSetTypes.NO_DATA, 'no_data'),
+])
+
+
+def member_role(host: Host) -> str:
+    """Returns the report name of a host's replica set role, config servers are reported as config."""
+    if is_config_server(host):
+        return MEMBER_ROLES[ReplicaSetTypes.SHARD_CONFIG]
+    return MEMBER_ROLES.get(host.type, host.type.name.lower())
+
+
+def role_aggregates(members: Dict[str, HostData]) -> OrderedDict:
+    """Returns, for every role, its member count and the highest mean of each metric across its members.
+
+    The columns are `<role>_members` and `<role>_max:<metric>`, e.g. secondary_max:CACHE_USED_BYTES.
+
+    :param members: The metrics of each member, see ClusterData.member_metrics.
+    """
+    by_role = defaultdict(list)
+    for each in members.values():
+        by_role[member_role(each.host_obj)].append(metric_means(each))
+    roles = [each for each in dict.fromkeys(MEMBER_ROLES.values()) if each in by_role] + \
+            [each for each in by_role if each not in MEMBER_ROLES.values()]
+    row = OrderedDict()
+    for each_role in roles:
+        row[f'{each_role}_members'] = len(by_role[each_role])
+        for each_name in HOST_METRIC_ATTRIBUTES:
+            values = [means[str(each_name)] for means in by_role[each_role] if means[str(each_name)] is not None]
+            row[f'{each_role}_max:{each_name}'] = max(values) if values else None
+    return row
+
+
+def member_row(cluster: ClusterData, host_data: HostData, granularity: AtlasGranularities,
+               period: AtlasPeriods) -> OrderedDict:
+    """Builds a report row for a single cluster member, with the mean of each of its metrics."""
+    row = OrderedDict([('project_name', cluster.project_name), ('project_id', cluster.project_id),
+                       ('cluster', cluster.name), ('cluster_id', cluster.id), ('host', host_data.cache_key),
+                       ('replica_set', host_data.host_obj.replica_set_name), ('role', member_role(host_data.host_obj))])
+    row.update(metric_means(host_data))
+    row['Granularity'] = granularity
+    row['Period'] = period
+    return row
+
+
+# The columns of a report row, by source. The namespace columns are the `namespaces` column group.
+CLUSTER_COLUMNS = tuple(ClusterData('', '', '', '', 0, '', 0, '', 0, 0, 0, 0).as_dict())
+NAMESPACE_COLUMNS = tuple(namespace_columns(NamespaceStats()))
+PARAMETER_COLUMNS = ('Granularity', 'Period')
+
+# The DataFrame column kind of the report columns which are not float, see report_schema.
+REPORT_COLUMN_KINDS = {
+    'ro': 'int', 'analytics': 'int', 'electable': 'int', 'shards': 'int', 'IOPS': 'int',
+    'io_type': 'category', 'tier': 'category', 'project_id': 'category', 'project_name': 'category',
+    'regions': 'category', 'name': 'string', 'id': 'string',
+    'databases': 'int', 'namespaces_sampled': 'int', 'namespaces_estimated': 'bool',
+    'Granularity': 'category', 'Period': 'category',
+}
+
+
+def report_schema(plan: Optional['ReportPlan'] = None) -> OrderedDict:
+    """Returns the kind of every report column in row order, the schema of a DataFrameSink.
+
+    The per-shard and aggregate columns are left out, the sink adds them as float columns when they appear.
+
+    :param plan: Only the columns of this ReportPlan (default = every column)
+    """
+    columns = plan.columns if plan else list(CLUSTER_COLUMNS) + list(NAMESPACE_COLUMNS) + \
+        [str(each) for each in HOST_METRIC_ATTRIBUTES] + list(PARAMETER_COLUMNS)
+    return OrderedDict((each, REPORT_COLUMN_KINDS.get(each, 'float')) for each in columns)
+
+
+class ReportPlan:
+    def __init__(self, columns: Iterable[str], extra_metrics: Iterable[str] = ()):
+        """The API requests needed to build the passed report columns, see Fleet.get_full_report_primary_metrics.
+
+        A column is a cluster attribute (see CLUSTER_COLUMNS), a measurement of HOST_METRIC_ATTRIBUTES, a namespace
+        column (see NAMESPACE_COLUMNS), Granularity or Period, or a group of columns: a key of METRIC_GROUPS or
+        `namespaces`. Only the host measurements, the disk request and the namespace counters behind the columns
+        are fetched, e.g. the disk group skips the host measurements request and the namespace counts.
+
+        :param columns: The report columns, in row order.
+        :param extra_metrics: Measurements to fetch without a column of their own, e.g. the aggregated ones.
+        :raises ValueError: If a column is unknown.
+        """
+        self.columns: List[str] = list(OrderedDict.fromkeys(each for name in columns for each in self.expand(name)))
+        # Measurements are kept in report column order.
+        self.metrics: List[str] = [each for each in HOST_METRIC_ATTRIBUTES if each in self.columns]
+        fetched = set(self.metrics) | set(extra_metrics)
+        self.host_metrics: List[str] = [each for each in METRICS if each in fetched]
+        self.disk: bool = any(each in fetched for each in DISK_METRICS)
+        self.counters: List[str] = [name for name, attribute in NAMESPACE_COUNTERS.items()
+                                    if attribute in self.columns or f'{attribute}_margin' in self.columns]
+        self.namespaces: bool = any(each in NAMESPACE_COLUMNS for each in self.columns)
+
+    @staticmethod
+    def expand(column: str) -> List[str]:
+        """Returns the columns of a column group, or the column itself.
+
+        :raises ValueError: If the column is unknown.
+        """
+        if column in METRIC_GROUPS:
+            return [str(each) for each in METRIC_GROUPS[column]]
+        if column == 'namespaces':
+            return list(NAMESPACE_COLUMNS)
+        if column in HOST_METRIC_ATTRIBUTES or column in NAMESPACE_COLUMNS or column in CLUSTER_COLUMNS or \
+                column in PARAMETER_COLUMNS:
+            return [column]
+        raise ValueError(f'Unknown report column {column}, use a column name or one of the groups '
+                         f'{list(METRIC_GROUPS) + ["namespaces"]}')
+
+    @property
+    def fetches_metrics(self) -> bool:
+        """True if any measurement of the primaries is requested."""
+        return bool(self.host_metrics) or self.disk
+
+    def project(self, row: dict, extra: Iterable[str] = ()) -> OrderedDict:
+        """Returns the planned columns of a row, None for those it lacks (e.g. for a cluster without a primary).
+
+        The `<shard>:<metric>` columns of the planned measurements and the `extra` columns (e.g. the aggregates)
+        follow the planned columns.
+        """
+        projected = OrderedDict((each, row.get(each)) for each in self.columns)
+        for key, value in row.items():
+            if key.partition(':')[2] in self.metrics:
+                projected[key] = value
+        for each in extra:
+            projected[each] = row.get(each)
+        return projected
+
 
 class Fleet:
-    def __init__(self, atlas_obj: Atlas):
+    def __init__(self, atlas_obj: Atlas, host_ttl: Optional[float] = 300.0,
+                 rate_limiter: Optional[TokenBucket] = None, cache: Optional[MeasurementCache] = None,
+                 series_store: Optional[SeriesStore] = None, project_ids: Optional[List[str]] = None,
+                 all_projects: bool = False, project_workers: int = 4,
+                 instrumentation: Optional[Instrumentation] = None,
+                 namespace_counter: Optional[NamespaceCounter] = None):
         """Holds information for an Atlas Fleet.
 
-        Can be single or Multi orginization.
+        Can be single or Multi orginization: by default the Fleet is the project (group) of the Atlas object, but
+        it can span a list of projects or every project visible to the API key. Project metadata is fetched once
+        per report run, and the clusters and hosts of several projects are listed in parallel. Clusters are
+        always returned in project order.
 
         :type atlas_obj: Atlas
+        :param host_ttl: Seconds before the shared host inventory is re-fetched, None to never expire it.
+        :param rate_limiter: A TokenBucket all API calls are drawn from. Parallel reports install a default bucket
+            of DEFAULT_REQUESTS_PER_MINUTE if none is passed.
+        :param cache: A MeasurementCache for measurements and listings. With an offline cache, reports are
+            replayed from it without calling the API.
+        :param series_store: A SeriesStore, to only fetch the points added since the previous run for host and disk
+            metrics.
+        :param project_ids: The projects in the Fleet (default = the Atlas object's group)
+        :param all_projects: Span every project the API key can access, instead of project_ids.
+        :param project_workers: Projects whose clusters and hosts are listed at the same time.
+        :param instrumentation: Records every API call, and times the discovery, host_lookup, metrics and
+            namespaces stages of report runs (per cluster for the last two).
+        :param namespace_counter: How the namespace counts of every cluster are collected, e.g. with a budget for
+            clusters with thousands of databases (see NamespaceCounter).
         """
         self.atlas = atlas_obj
+        self.cache = cache
+        self.series_store = series_store
+        self.namespace_counter = namespace_counter
+        self.rate_limiter = rate_limiter
+        if rate_limiter:
+            throttle(atlas_obj, rate_limiter)
+        self.instrumentation = instrumentation
+        if instrumentation:
+            instrument(atlas_obj, instrumentation)
+        self.host_ttl = host_ttl
+        self.project_ids = project_ids
+        self.all_projects = all_projects
+        self.project_workers = project_workers
+        self.inventory = HostInventory(atlas_obj, ttl=host_ttl, cache=cache)
+        self.inventories: Dict[str, HostInventory] = {atlas_obj.group: self.inventory}
+        self._project_atlases: Dict[str, Atlas] = {atlas_obj.group: atlas_obj}
+        self._projects: Optional[Dict[str, Project]] = None
+        self._lock = threading.Lock()
 
     @property
-    def clusters_list(self) -> Iterable[ClusterData]:
-        """List of all clusters (databases) in the Fleet.
-
-        if the Atlas obj is instantiated without an Org, this can be from multiple orgs, depending on the access
-        level of the key used.
+    def projects(self) -> Dict[str, Project]:
+        """The projects of the Fleet by project id, fetched once per report run."""
+        if self._projects is None:
+            with self._lock:
+                if self._projects is None:
+                    with stage(self.instrumentation, 'discovery'):
+                        self._projects = OrderedDict((each.id, each) for each in self._fetch_projects())
+        return self._projects
+
+    def _fetch_projects(self) -> List[Project]:
+        def fetch_all() -> List[dict]:
+            # Atlas answers one page of projects at a time, they are paged through until totalCount is reached.
+            uri = Settings.api_resources["Projects"]["Projects that the authenticated user can access"]
+            results = []
+            page_num = Settings.pageNum
+            while True:
+                response = self.atlas.network.get(f'{Settings.BASE_URL}{uri}?pageNum={page_num}'
+                                                  f'&itemsPerPage={Settings.itemsPerPage}')
+                page = response.get('results', [])
+                results.extend(page)
+                if not page or len(results) >= response.get('totalCount', len(results)):
+                    return results
+                page_num += 1
+
+        def fetch_one(project_id: str) -> dict:
+            uri = Settings.api_resources["Projects"]["Project by group_id"].format(GROUP_ID=project_id)
+            return self.atlas.network.get(Settings.BASE_URL + uri)
+
+        if self.all_projects:
+            project_dicts = self.cache.cached('', 'projects', None, None, fetch_all, reuse=False) \
+                if self.cache else fetch_all()
+        else:
+            project_dicts = []
+            for each_id in self.project_ids or [self.atlas.group]:
+                project_dicts.append(self.cache.cached(each_id, 'project', None, None, partial(fetch_one, each_id),
+                                                       reuse=False) if self.cache else fetch_one(each_id))
+        return [Project.from_dict(each) for each in project_dicts]
+
+    def refresh(self) -> None:
+        """Forgets the project metadata and marks the host inventories stale, so the next run fetches them again."""
+        with self._lock:
+            self._projects = None
+            for each_inventory in self.inventories.values():
+                each_inventory.fetched_at = None
+
+    def ensure_rate_limiter(self) -> TokenBucket:
+        """Installs a TokenBucket of DEFAULT_REQUESTS_PER_MINUTE unless the Fleet already has a rate limiter."""
+        with self._lock:
+            if self.rate_limiter is None:
+                self.rate_limiter = TokenBucket.per_minute()
+                throttle(self.atlas, self.rate_limiter)
+        return self.rate_limiter
+
+    def _project(self, project_id: str) -> Tuple[Atlas, HostInventory]:
+        """Returns the Atlas object and the host inventory of a project."""
+        with self._lock:
+            if project_id not in self._project_atlases:
+                self._project_atlases[project_id] = project_atlas(self.atlas, project_id)
+                self.inventories[project_id] = HostInventory(self._project_atlases[project_id], ttl=self.host_ttl,
+                                                             cache=self.cache)
+            atlas_obj = self._project_atlases[project_id]
+            # Follows the network of the Fleet's Atlas object, which is replaced when a rate limiter is installed.
+            atlas_obj.network = self.atlas.network
+            return atlas_obj, self.inventories[project_id]
+
+    def _project_clusters(self, project_id: str) -> List[ClusterData]:
+        """Lists the clusters of a project, and loads its host inventory if stale."""
+        atlas_obj, inventory = self._project(project_id)
+
+        def fetch() -> List[dict]:
+            return list(atlas_obj.Clusters.get_all_clusters(iterable=True))
+
+        with stage(self.instrumentation, 'discovery'):
+            if self.cache:
+                cluster_dicts = self.cache.cached(project_id, 'clusters', None, None, fetch, reuse=False)
+            else:
+                cluster_dicts = fetch()
+        # Loads the host list now if it is stale, in parallel with the other projects.
+        with stage(self.instrumentation, 'host_lookup'):
+            inventory._index()
+        project_name = self.projects[project_id].name
+        return [ClusterData.from_dict(each, project_name, project_id, inventory=inventory, cache=self.cache,
+                                      series_store=self.series_store, namespace_counter=self.namespace_counter)
+                for each in cluster_dicts]
 
-        """
-        for each in self.atlas.Clusters.get_all_clusters(iterable=True):
-            cluster = ClusterConfig.fill_from_dict(each)
-            cluster_obj = ClusterData(self.atlas.Projects.project_by_id(self.atlas.group).name, self.atlas.group,
-                                      cluster.id, cluster.name, cluster.disk_size_gb,
-                                      cluster.providerSettings.instance_size_name, cluster.providerSettings.diskIOPS
-                                      , cluster.providerSettings.volumeType, cluster.num_shards,
-                                      cluster.replication_specs[0].regions_config.get('US_EAST_1').get(
-                                          'electableNodes'),
-                                      cluster.replication_specs[0].regions_config.get('US_EAST_1').get('analyticsNodes',
-                                                                                                       0),
-                                      cluster.replication_specs[0].regions_config.get('US_EAST_1').get('readOnlyNodes',
-                                                                                                       0),
-                                      )
-            yield cluster_obj
+    @property
+    def clusters_list(self) -> Iterable[ClusterData]:
+        """List of all clusters (databases) in the Fleet, in project order.
 
-    def get_full_report_primary_metrics(self, granularity: AtlasGranularities, period: AtlasPeriods) -> Iterable[dict]:
+        The clusters of up to `project_workers` projects are listed at the same time.
         """
+        project_ids = list(self.projects)
+        if len(project_ids) > 1 and self.project_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(self.project_workers, len(project_ids)),
+                                    thread_name_prefix='fleet-projects') as pool:
+                for each_project in pool.map(self._project_clusters, project_ids):
+                    yield from each_project
+            return
+        for each_project_id in project_ids:
+            yield from self._project_clusters(each_project_id)
+
+    def get_full_report_primary_metrics(self, granularity: AtlasGranularities, period: AtlasPeriods,
+                                        max_workers: int = 1, executor: Optional[Executor] = None,
+                                        ordered: bool = True, aggregations: Optional[Dict[str, List[str]]] = None,
+                                        batch_size: int = 20, journal: Optional[ReportJournal] = None,
+                                        resume: bool = False, columns: Optional[Iterable[str]] = None
+                                        ) -> Iterable[dict]:
+        """Yields a report row for every cluster, with namespace counts and the metrics of its primary.
+
+        With `max_workers` > 1, or an `executor`, several clusters are fetched at the same time. All threads draw
+        from the Fleet's shared rate limiter and back off when Atlas answers 429.
+
+        With `aggregations`, the data points of the aggregated metrics are kept until `batch_size` clusters are
+        fetched, and then reduced together to one `<metric>_<reducer>` column per reducer (see Aggregator). The
+        points of every shard primary of a sharded cluster are reduced together, and a cluster without a primary
+        gets None in every aggregate column.
+
+        With a `journal`, every yielded row is checkpointed, and a cluster that raises is recorded in the journal
+        and skipped instead of aborting the run. With `resume`, the rows of the clusters the journal already holds
+        are yielded in their place in the fleet and only the remaining (or failed) clusters are fetched; otherwise,
+        or if the journal's run was built with another granularity, period, columns or aggregations, it is reset.
+
+        With `columns`, the rows only hold those columns (and the per-shard and aggregate columns of their
+        measurements), and only the requests behind them are made: see ReportPlan for the column names and groups,
+        e.g. columns=['name', 'disk'] skips the host measurements and the namespace counts of every cluster.
 
         :type period: object
         :type granularity: AtlasGranularities
         :param granularity: The granularity for the metrics. (default = 10 seconds)
         :param period : The period for metrics. (default = 24 hours)
-
+        :param max_workers: Clusters fetched concurrently (default = 1, serial)
+        :param executor: An Executor to run the cluster fetches on, instead of an internal thread pool.
+        :param ordered: Yield rows in cluster order (default), or as soon as each cluster completes if False.
+        :param aggregations: Reducers by measurement name, e.g. {AtlasMeasurementTypes.Disk.Util.util: ['p95']}
+        :param batch_size: Clusters reduced together when aggregating.
+        :param journal: A ReportJournal to checkpoint the run in.
+        :param resume: Resume the journal's run instead of starting it over.
+        :param columns: The report columns and column groups, None for every column.
+        :raises ValueError: If a column is unknown.
         """
         if not granularity:
             granularity = AtlasGranularities.TEN_SECOND
@@ -355,74 +1581,208 @@ class Fleet:
         if not period:
             period = AtlasPeriods.HOURS_24
 
-        for each_cluster in self.clusters_list:
-            try:
-                host_data = each_cluster.primary_metrics(atlas_obj=self.atlas, granularity=granularity, period=period)
-            except Exception as e:
-                logger.debug('--------Error Here-----------')
+        aggregator = Aggregator(aggregations) if aggregations else None
+        plan = ReportPlan(columns, extra_metrics=aggregator.metrics if aggregator else ()) \
+            if columns is not None else None
+
+        def output(row: dict) -> dict:
+            return plan.project(row, extra=aggregator.columns if aggregator else ()) if plan else row
+
+        completed = {}
+        if journal:
+            completed = journal.start({'granularity': granularity, 'period': period,
+                                       'columns': list(columns) if columns is not None else None,
+                                       'aggregations': aggregations}, resume=resume)
+            if completed:
+                logger.info(f'Resuming the report, {len(completed)} clusters are already done')
+        # The finished clusters are yielded in fleet order, each before the first fetched cluster that follows it.
+        self.refresh()
+        clusters = list(self.clusters_list)
+        positions = {each.id: position for position, each in enumerate(clusters)}
+        pending = sorted(completed.values(), key=lambda each: positions.get(each.get('id'), len(positions)))
+
+        keep_points = set(aggregator.metrics) if aggregator else False
+        results = (each for each in self._cluster_results(granularity, period, keep_points, max_workers, executor,
+                                                          ordered, journal=journal, skip=completed, plan=plan,
+                                                          clusters=clusters)
+                   if each is not None)
+        if aggregator:
+            rows = aggregate_rows(results, aggregator, granularity, batch_size=batch_size)
+        else:
+            rows = (each_row for each_row, _ in results)
+        for each_row in rows:
+            if journal:
+                journal.record_row(each_row.get('id'), each_row.get('name'), each_row)
+            position = positions.get(each_row.get('id'), len(positions))
+            while pending and positions.get(pending[0].get('id'), len(positions)) < position:
+                yield output(pending.pop(0))
+            yield output(each_row)
+        yield from (output(each) for each in pending)
+
+    def _cluster_results(self, granularity: AtlasGranularities, period: AtlasPeriods,
+                         keep_points: Union[bool, Collection[str]], max_workers: int, executor: Optional[Executor],
+                         ordered: bool, journal: Optional[ReportJournal] = None, skip: Collection[str] = (),
+                         plan: Optional[ReportPlan] = None, clusters: Optional[List[ClusterData]] = None
+                         ) -> Iterable[Optional[Tuple[OrderedDict, List[HostData]]]]:
+        """Yields the report row and the HostData of every shard primary of every cluster, None for a failed
+        cluster."""
+        return self._map_clusters(self._cluster_result, (granularity, period, keep_points, journal, plan),
+                                  max_workers, executor, ordered, skip=skip, clusters=clusters)
+
+    def _map_clusters(self, function, args: tuple, max_workers: int, executor: Optional[Executor],
+                      ordered: bool, skip: Collection[str] = (), clusters: Optional[List[ClusterData]] = None
+                      ) -> Iterable:
+        """Yields function(cluster, *args) for every cluster, on a thread pool when several workers are used.
+
+        :param skip: Ids of clusters to leave out.
+        :param clusters: The clusters, already listed after a refresh, instead of listing the Fleet's.
+        """
+        if clusters is None:
+            # One project and host list download per report run, later lookups only re-fetch once the inventory
+            # ttl expires.
+            self.refresh()
+            clusters = self.clusters_list
+        clusters = (each for each in clusters if each.id not in skip)
+        if executor is None and max_workers <= 1:
+            for each_cluster in clusters:
+                yield function(each_cluster, *args)
+            return
+
+        self.ensure_rate_limiter()
+        pool = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet-report')
+        try:
+            futures = [pool.submit(function, each_cluster, *args) for each_cluster in clusters]
+            for each_future in (futures if ordered else as_completed(futures)):
+                yield each_future.result()
+        finally:
+            if executor is None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def get_series(self, granularity: AtlasGranularities, period: AtlasPeriods, max_workers: int = 1,
+                   executor: Optional[Executor] = None, ordered: bool = True) -> Iterable[Dict[str, np.ndarray]]:
+        """Yields the data points of every primary in long format, one chunk of columns per cluster.
+
+        Each chunk holds the cluster, host, metric, timestamp and value columns of HostData.series_chunk, ready
+        to be written by a series sink such as SQLiteSeriesSink or ParquetSeriesSink. Clusters without a primary
+        are skipped.
+
+        :param granularity: The granularity for the metrics. (default = 10 seconds)
+        :param period : The period for metrics. (default = 24 hours)
+        :param max_workers: Clusters fetched concurrently (default = 1, serial)
+        :param executor: An Executor to run the cluster fetches on, instead of an internal thread pool.
+        :param ordered: Yield chunks in cluster order (default), or as soon as each cluster completes if False.
+        """
+        granularity = granularity or AtlasGranularities.TEN_SECOND
+        period = period or AtlasPeriods.HOURS_24
+        for each_chunk in self._map_clusters(self._cluster_series, (granularity, period), max_workers, executor,
+                                             ordered):
+            if each_chunk is not None:
+                yield each_chunk
+
+    def _cluster_series(self, each_cluster: ClusterData, granularity: AtlasGranularities,
+                        period: AtlasPeriods) -> Optional[Dict[str, np.ndarray]]:
+        with stage(self.instrumentation, 'metrics', each_cluster.name):
+            shard_data = each_cluster.shard_metrics(atlas_obj=self.atlas, granularity=granularity, period=period)
+        if not shard_data:
+            logger.info(f"No primary available for {each_cluster.name}, could not get metrics")
+            return None
+        chunks = [each.series_chunk(each_cluster.name) for each in shard_data.values()]
+        return OrderedDict((each, np.concatenate([chunk[each] for chunk in chunks])) for each in chunks[0])
+
+    def _cluster_result(self, each_cluster: ClusterData, granularity: AtlasGranularities, period: AtlasPeriods,
+                        keep_points: Union[bool, Collection[str]] = False, journal: Optional[ReportJournal] = None,
+                        plan: Optional[ReportPlan] = None) -> Optional[Tuple[OrderedDict, List[HostData]]]:
+        """Builds the report row for a single cluster, returned with the HostData of every shard primary.
+
+        The metrics of every shard primary are fetched, a cluster without a primary returns an empty list. With a
+        plan, only its measurements and namespace counters are fetched. With a journal, an error is recorded in it
+        and None is returned instead of raising.
+        """
+        try:
+            shard_data = OrderedDict()
+            if plan is None or plan.fetches_metrics:
+                with stage(self.instrumentation, 'metrics', each_cluster.name):
+                    shard_data = each_cluster.shard_metrics(atlas_obj=self.atlas, granularity=granularity,
+                                                            period=period, keep_points=keep_points,
+                                                            metrics=plan.host_metrics if plan else None,
+                                                            disk=plan.disk if plan else True)
+            host_data = next(iter(shard_data.values()), None)
+            namespace_stats = None
+            if plan is None or plan.namespaces:
+                with stage(self.instrumentation, 'namespaces', each_cluster.name):
+                    namespace_stats = each_cluster.namespace_stats(self.atlas,
+                                                                   counters=plan.counters if plan else None)
+            row = report_row(each_cluster, host_data, namespace_stats, granularity, period, shard_data=shard_data,
+                             plan=plan)
+        except Exception as e:
+            if journal is None:
                 raise e
-            base_dict = OrderedDict(each_cluster.__dict__)
-            try:
-                # Namespace Counts
-                base_dict['views'] = each_cluster.count_views(self.atlas)
-                base_dict['objects'] = each_cluster.count_objects(self.atlas)
-                base_dict['indexes'] = each_cluster.count_indexes(self.atlas)
-                base_dict['collections'] = each_cluster.count_collections(self.atlas)
-                base_dict['databases'] = each_cluster.db_count(self.atlas)
-
-                # Host Measurements
-                base_dict[str(host_data.cache_used.name)] = host_data.cache_used.measurement_stats.mean
-                base_dict[str(host_data.cache_dirty.name)] = host_data.cache_dirty.measurement_stats.mean
-                base_dict[str(host_data.cache_bytes_read.name)] = host_data.cache_bytes_read.measurement_stats.mean
-                base_dict[
-                    str(host_data.cache_bytes_written.name)] = host_data.cache_bytes_written.measurement_stats.mean
-
-                base_dict[str(host_data.targeting_objects.name)] = host_data.targeting_objects.measurement_stats.mean
-                base_dict[
-                    str(host_data.targeting_per_returned.name)] = host_data.targeting_per_returned.measurement_stats.mean
-
-                base_dict[str(host_data.queued_readers.name)] = host_data.queued_readers.measurement_stats.mean
-                base_dict[str(host_data.queued_writers.name)] = host_data.queued_writers.measurement_stats.mean
-
-                base_dict[str(host_data.tickets_write.name)] = host_data.tickets_write.measurement_stats.mean
-                base_dict[str(host_data.tickets_read.name)] = host_data.tickets_read.measurement_stats.mean
-
-                base_dict[str(host_data.db_data_size.name)] = host_data.db_data_size.measurement_stats.mean
-                base_dict[str(host_data.db_storage.name)] = host_data.db_storage.measurement_stats.mean
-
-                base_dict[str(host_data.net_in_data.name)] = host_data.net_in_data.measurement_stats.mean
-                base_dict[str(host_data.net_out_data.name)] = host_data.net_out_data.measurement_stats.mean
-
-                # Data Disk Metrics
-                base_dict[str(host_data.disk_util.name)] = host_data.disk_util.measurement_stats.mean
-                base_dict[str(host_data.disk_util_max.name)] = host_data.disk_util_max.measurement_stats.mean
-
-                base_dict[str(host_data.disk_latency_write.name)] = host_data.disk_latency_write.measurement_stats.mean
-                base_dict[str(host_data.disk_latency_write_max.name)] = host_data.disk_latency_write_max.measurement_stats.mean
-                base_dict[str(host_data.disk_latency_read.name)] = host_data.disk_latency_read.measurement_stats.mean
-                base_dict[str(host_data.disk_latency_read_max.name)] = host_data.disk_latency_read_max.measurement_stats.mean
-
-                base_dict[str(host_data.disk_iops_read.name)] = host_data.disk_iops_read.measurement_stats.mean
-                base_dict[str(host_data.disk_iops_read_max.name)] = host_data.disk_iops_read_max.measurement_stats.mean
-                base_dict[str(host_data.disk_iops_write.name)] = host_data.disk_iops_write.measurement_stats.mean
-                base_dict[str(host_data.disk_iops_write_max.name)] = host_data.disk_iops_write_max.measurement_stats.mean
-
-                base_dict['Granularity'] = granularity
-                base_dict['Period'] = period
-            except AttributeError as e:
-                # We want to skip over an error which is caused by no primary being available.
-                if 'object has no attribute' in str(e):
-                    logger.info(f"No primary available for {each_cluster.name}, could not get metrics")
-                else:
-                    raise e
+            logger.warning(f'Could not build the report row for {each_cluster.name}: {e}')
+            journal.record_failure(each_cluster.id, each_cluster.name, e)
+            return None
+        return row, list(shard_data.values())
 
-            yield base_dict
+    def get_full_report_member_metrics(self, granularity: AtlasGranularities, period: AtlasPeriods,
+                                       max_workers: int = 1, executor: Optional[Executor] = None,
+                                       ordered: bool = True, per_host: bool = False,
+                                       member_workers: int = 4) -> Iterable[dict]:
+        """Yields a report row for every cluster, with the metrics of all its members.
 
-    def get_full_report_primary_metrics_df(self, granularity: AtlasGranularities, period: AtlasPeriods) -> df:
-        data_list = []
-        for each_record in self.get_full_report_primary_metrics(granularity, period):
-            data_list.append(each_record)
+        Each row holds the columns of get_full_report_primary_metrics, plus the role aggregates of
+        role_aggregates (e.g. the highest cache usage across the secondaries). With `per_host`, a row per member
+        is yielded instead (see member_row).
 
-        dataFrame = df(data_list)
+        Measuring every member multiplies the API calls by the number of members, so the members of a cluster
+        are fetched `member_workers` at a time, on top of the `max_workers` clusters fetched at the same time.
 
-        return dataFrame
+        :param granularity: The granularity for the metrics. (default = 10 seconds)
+        :param period : The period for metrics. (default = 24 hours)
+        :param max_workers: Clusters fetched concurrently (default = 1, serial)
+        :param executor: An Executor to run the cluster fetches on, instead of an internal thread pool.
+        :param ordered: Yield rows in cluster order (default), or as soon as each cluster completes if False.
+        :param per_host: Yield a row per member instead of a row per cluster.
+        :param member_workers: Members of a cluster fetched concurrently.
+        """
+        granularity = granularity or AtlasGranularities.TEN_SECOND
+        period = period or AtlasPeriods.HOURS_24
+        for each_rows in self._map_clusters(self._cluster_members, (granularity, period, per_host, member_workers),
+                                            max_workers, executor, ordered):
+            yield from each_rows
+
+    def _cluster_members(self, each_cluster: ClusterData, granularity: AtlasGranularities, period: AtlasPeriods,
+                         per_host: bool, member_workers: int) -> List[OrderedDict]:
+        with stage(self.instrumentation, 'metrics', each_cluster.name):
+            members = each_cluster.member_metrics(atlas_obj=self.atlas, granularity=granularity, period=period,
+                                                  keep_points=False, max_workers=member_workers)
+        if per_host:
+            return [member_row(each_cluster, each, granularity, period) for each in members.values()]
+        # The primaries were measured with the other members, they are not fetched again.
+        shard_data = OrderedDict((name, members[f'{host.hostname}:{host.port}'])
+                                 for name, host in each_cluster.shard_primaries(self.atlas).items()
+                                 if f'{host.hostname}:{host.port}' in members)
+        with stage(self.instrumentation, 'namespaces', each_cluster.name):
+            namespace_stats = each_cluster.namespace_stats(self.atlas)
+        row = report_row(each_cluster, next(iter(shard_data.values()), None), namespace_stats, granularity, period,
+                         shard_data=shard_data)
+        row.update(role_aggregates(members))
+        return [row]
+
+    def get_full_report_primary_metrics_df(self, granularity: AtlasGranularities, period: AtlasPeriods,
+                                           columns: Optional[Iterable[str]] = None, capacity: int = 256,
+                                           **kwargs) -> df:
+        """Returns the report as a DataFrame with a fixed set of typed columns, see report_schema.
+
+        The rows are written into preallocated column arrays as they arrive (see DataFrameSink): the metrics are
+        float64, the cluster sizes nullable integers and the names, tiers and other labels categorical. The metric
+        columns of a cluster without a primary are NaN.
+
+        :param granularity:
+        :param period:
+        :param columns: As for get_full_report_primary_metrics.
+        :param capacity: Rows allocated up front, e.g. the expected number of clusters.
+        :param kwargs: Passed to get_full_report_primary_metrics, e.g. max_workers.
+        """
+        sink = DataFrameSink(report_schema(ReportPlan(columns) if columns is not None else None), capacity=capacity)
+        sink.write(self.get_full_report_primary_metrics(granularity, period, columns=columns, **kwargs),
+                   instrumentation=self.instrumentation)
+        return sink.frame
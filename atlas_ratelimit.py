@@ -0,0 +1,111 @@
+from atlasapi.atlas import Atlas
+from atlasapi.errors import ErrAtlasGeneric
+from typing import Optional
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The Atlas Administration API allows roughly 100 requests per minute per project before answering 429.
+DEFAULT_REQUESTS_PER_MINUTE = 100
+TOO_MANY_REQUESTS = 429
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Thread safe token bucket shared by every thread calling the Atlas API.
+
+        :param rate: Tokens added per second.
+        :param capacity: Maximum tokens held, i.e. the largest burst allowed (default = one second of tokens, min 1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                   capacity: Optional[float] = None) -> 'TokenBucket':
+        return cls(rate=requests_per_minute / 60.0, capacity=capacity)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Blocks until `tokens` are available and takes them.
+
+        :return: The number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ThrottledNetwork:
+    CALLS = ('get', 'get_big', 'get_file', 'post', 'patch', 'delete')
+
+    def __init__(self, network, bucket: TokenBucket, max_retries: int = 5, backoff: float = 2.0,
+                 max_backoff: float = 60.0):
+        """Wraps an atlasapi Network so every request takes a token from a shared bucket.
+
+        Requests answered with HTTP 429 are retried with exponential backoff and jitter, up to `max_retries` times.
+
+        :param network: The atlasapi Network object to wrap.
+        :param bucket: The TokenBucket shared by all threads.
+        :param max_retries: Retries of a single request after a 429 before the error is raised.
+        :param backoff: Initial backoff in seconds, doubled for each retry.
+        :param max_backoff: Upper bound for a single backoff sleep in seconds.
+        """
+        self.network = network
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def __getattr__(self, item):
+        attribute = getattr(self.network, item)
+        if item in self.CALLS:
+            def throttled(*args, **kwargs):
+                return self._call(attribute, *args, **kwargs)
+            return throttled
+        return attribute
+
+    def _call(self, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return method(*args, **kwargs)
+            except ErrAtlasGeneric as e:
+                if e.code != TOO_MANY_REQUESTS or attempt >= self.max_retries:
+                    raise e
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                logger.warning(f'Atlas answered 429, retry {attempt}/{self.max_retries} in {delay:.1f} seconds')
+                time.sleep(delay)
+
+
+def throttle(atlas_obj: Atlas, bucket: TokenBucket, **kwargs) -> ThrottledNetwork:
+    """Routes all API calls of the Atlas object through a ThrottledNetwork using the passed bucket.
+
+    Calling it again on an already throttled Atlas object only swaps the bucket.
+
+    :param atlas_obj: An instantiated Atlas object
+    :param bucket: The TokenBucket to draw from
+    :param kwargs: Passed to ThrottledNetwork
+    :return: The installed ThrottledNetwork
+    """
+    if isinstance(atlas_obj.network, ThrottledNetwork):
+        atlas_obj.network.bucket = bucket
+    else:
+        atlas_obj.network = ThrottledNetwork(atlas_obj.network, bucket, **kwargs)
+    return atlas_obj.network
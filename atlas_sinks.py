@@ -0,0 +1,637 @@
+from typing import List, Optional, Iterable, Any, Dict
+from enum import Enum
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import csv
+import math
+import sqlite3
+import time
+import xlsxwriter
+import logging
+from atlas_instrument import Instrumentation, stage
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_FORMAT = {
+    "wrapStrategy": 'WRAP',
+    "backgroundColor": {
+        "red": 0.0,
+        "green": 0.0,
+        "blue": 0.0
+    },
+    "horizontalAlignment": "CENTER",
+    "textFormat": {
+        "foregroundColor": {
+            "red": 1.0,
+            "green": 1.0,
+            "blue": 1.0
+        },
+        "fontSize": 10,
+        "bold": True
+
+    }
+}
+
+
+def normalize_value(value: Any) -> Any:
+    """Returns a report value as a plain scalar, Enums are replaced by their value."""
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+class ReportSink:
+    """Consumes report rows one at a time, e.g. from Fleet.get_full_report_primary_metrics."""
+    rows_written = 0
+
+    def write_row(self, row: dict) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def write(self, rows: Iterable[dict], *, instrumentation: Optional[Instrumentation] = None) -> int:
+        """Writes every row of an iterable as the rows arrive, then closes the sink.
+
+        :param instrumentation: Times the writes as the export stage, excluding the time waiting for rows.
+        :return: The number of rows written.
+        """
+        for each_row in rows:
+            with stage(instrumentation, 'export'):
+                self.write_row(each_row)
+        with stage(instrumentation, 'export'):
+            self.close()
+        return self.rows_written
+
+
+class TabularSink(ReportSink):
+    def __init__(self, columns: Optional[List[str]] = None, batch_rows: int = 1000):
+        """Base of the file sinks, which need a fixed set of columns before the first row is written.
+
+        Rows are buffered and written `batch_rows` at a time. Unless `columns` are passed, the columns are the
+        keys of the rows in the first batch, in order of appearance; keys first seen in a later batch are dropped.
+
+        :param columns: The columns to write.
+        :param batch_rows: Rows buffered before they are written.
+        """
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self.rows_written = 0
+        self._buffer: List[dict] = []
+        self._dropped = set()
+
+    def write_row(self, row: dict) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        if self.columns is None:
+            self.columns = list(dict.fromkeys(key for each_row in self._buffer for key in each_row))
+            self._open()
+        for each_key in {key for each_row in self._buffer for key in each_row} - set(self.columns) - self._dropped:
+            logger.warning(f'Column {each_key} is not in the first batch of rows, it is not written')
+            self._dropped.add(each_key)
+        self._write_batch([[normalize_value(each_row.get(each)) for each in self.columns]
+                           for each_row in self._buffer])
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def close(self) -> None:
+        self.flush()
+        self._close()
+
+    def _open(self) -> None:
+        """Called once the columns are known."""
+
+    def _write_batch(self, rows: List[list]) -> None:
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        pass
+
+
+class CSVSink(TabularSink):
+    def __init__(self, path: str, columns: Optional[List[str]] = None, batch_rows: int = 1000, **fmtparams):
+        """Writes report rows to a CSV file.
+
+        :param path: The CSV file
+        :param columns: The columns to write (default = the keys of the first batch of rows)
+        :param batch_rows: Rows buffered before they are written.
+        :param fmtparams: Passed to csv.writer
+        """
+        super().__init__(columns=columns, batch_rows=batch_rows)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file, **fmtparams)
+        if columns:
+            self._open()
+
+    def _open(self) -> None:
+        self.writer.writerow(self.columns)
+
+    def _write_batch(self, rows: List[list]) -> None:
+        self.writer.writerows(rows)
+
+    def _close(self) -> None:
+        self.file.close()
+
+
+class ExcelSink(TabularSink):
+    def __init__(self, path: str, worksheet_name: Optional[str] = None, columns: Optional[List[str]] = None,
+                 batch_rows: int = 1000):
+        """Writes report rows to an xlsx workbook in xlsxwriter's constant_memory mode.
+
+        Each row is flushed to disk as soon as it is written, so memory use does not grow with the number of rows.
+
+        :param path: The xlsx file
+        :param worksheet_name: The worksheet name (default = Sheet1)
+        :param columns: The columns to write (default = the keys of the first batch of rows)
+        :param batch_rows: Rows buffered before they are written.
+        """
+        super().__init__(columns=columns, batch_rows=batch_rows)
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+        self.worksheet = self.workbook.add_worksheet(worksheet_name)
+        self.header_format = self.workbook.add_format({'bold': True, 'text_wrap': True, 'align': 'center',
+                                                       'bg_color': 'black', 'font_color': 'white'})
+        if columns:
+            self._open()
+
+    def _open(self) -> None:
+        self.worksheet.write_row(0, 0, self.columns, self.header_format)
+        self.worksheet.freeze_panes(1, 0)
+
+    def _write_batch(self, rows: List[list]) -> None:
+        for offset, each_row in enumerate(rows, start=self.rows_written + 1):
+            self.worksheet.write_row(offset, 0, [each if each is None or isinstance(each, (int, float, bool))
+                                                 else str(each) for each in each_row])
+
+    def _close(self) -> None:
+        self.workbook.close()
+
+
+class ParquetSink(TabularSink):
+    def __init__(self, path: str, columns: Optional[List[str]] = None, batch_rows: int = 1000,
+                 file_format: str = 'parquet', schema: Optional[Dict[str, str]] = None, max_pending: int = 10):
+        """Writes report rows to a Parquet file, one row group per batch, or to an Arrow IPC file.
+
+        Requires pyarrow. The type of a column is set by `schema`, or else inferred from the rows: integers are
+        written as float64, so that a later fractional value is not truncated, and values of conflicting types
+        are written as strings. The file is opened once every column has a type, up to `max_pending` batches are
+        held back for the columns holding only None so far, which are float64 after that. A later value that does
+        not fit the type of its column is written as null, with a warning.
+
+        :param path: The output file
+        :param columns: The columns to write (default = the columns of the schema, or the keys of the first batch)
+        :param batch_rows: Rows per row group (Parquet) or record batch (Arrow).
+        :param file_format: 'parquet' or 'arrow'
+        :param schema: Column kinds as for DataFrameSink (e.g. report_schema() of atlas_lib), category and string
+            columns are written as strings.
+        :param max_pending: Batches held back while columns have no type.
+        :raises ValueError: If the file format or a column kind is unknown.
+        """
+        if pyarrow is None:
+            raise ImportError('ParquetSink requires pyarrow, install it with pip install pyarrow')
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError(f'Unknown file format {file_format}, use parquet or arrow')
+        super().__init__(columns=columns if columns is not None or schema is None else list(schema),
+                         batch_rows=batch_rows)
+        self.path = path
+        self.file_format = file_format
+        self.max_pending = max_pending
+        self.types: Dict[str, 'pyarrow.DataType'] = OrderedDict(
+            (name, self.arrow_type(kind)) for name, kind in (schema or {}).items())
+        self.schema: Optional[pyarrow.Schema] = None
+        self.writer = None
+        self._pending: List[List[list]] = []
+
+    @staticmethod
+    def arrow_type(kind: str) -> 'pyarrow.DataType':
+        """Returns the Arrow type of a DataFrameSink column kind."""
+        types = {'float': pyarrow.float64(), 'int': pyarrow.int64(), 'bool': pyarrow.bool_(),
+                 'category': pyarrow.string(), 'string': pyarrow.string()}
+        if kind not in types:
+            raise ValueError(f'Unknown column kind {kind}, use one of {COLUMN_KINDS}')
+        return types[kind]
+
+    @staticmethod
+    def infer_type(values: list) -> 'pyarrow.DataType':
+        """Returns the Arrow type of a column's values: null if all are None, float64 for integers."""
+        try:
+            inferred = pyarrow.array(values).type
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            return pyarrow.string()
+        return pyarrow.float64() if pyarrow.types.is_integer(inferred) else inferred
+
+    def _column_type(self, index: int) -> 'pyarrow.DataType':
+        """Returns the type of a column from the pending batches, null while it only holds None."""
+        name = self.columns[index]
+        if name in self.types:
+            return self.types[name]
+        inferred = {self.infer_type(each[index]) for each in self._pending} - {pyarrow.null()}
+        if len(inferred) > 1:
+            return pyarrow.string()
+        return inferred.pop() if inferred else pyarrow.null()
+
+    def _array(self, name: str, values: list, field: 'pyarrow.Field') -> 'pyarrow.Array':
+        try:
+            return pyarrow.array(values, type=field.type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            pass
+        if pyarrow.types.is_string(field.type):
+            return pyarrow.array([None if each is None else str(each) for each in values], type=field.type)
+        fitted = []
+        for each in values:
+            try:
+                fitted.append(pyarrow.array([each], type=field.type)[0].as_py())
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                logger.warning(f'{each!r} does not fit the {field.type} column {name}, it is written as null')
+                fitted.append(None)
+        return pyarrow.array(fitted, type=field.type)
+
+    def _table(self, arrays: List[list]) -> 'pyarrow.Table':
+        return pyarrow.Table.from_arrays([self._array(field.name, each, field)
+                                          for each, field in zip(arrays, self.schema)], schema=self.schema)
+
+    def _write_batch(self, rows: List[list]) -> None:
+        arrays = [list(column) for column in zip(*rows)]
+        if self.schema is not None:
+            self.writer.write_table(self._table(arrays))
+            return
+        self._pending.append(arrays)
+        self._resolve(force=len(self._pending) >= self.max_pending)
+
+    def _resolve(self, force: bool) -> None:
+        """Opens the file once every column has a type (or when forced) and writes the pending batches."""
+        types = [self._column_type(index) for index in range(len(self.columns))]
+        if not force and any(pyarrow.types.is_null(each) for each in types):
+            return
+        self.schema = pyarrow.schema([pyarrow.field(name, pyarrow.float64() if pyarrow.types.is_null(each) else each)
+                                      for name, each in zip(self.columns, types)])
+        if self.file_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(self.path, self.schema)
+        for each in self._pending:
+            self.writer.write_table(self._table(each))
+        self._pending = []
+
+    def _close(self) -> None:
+        if self.schema is None and self._pending:
+            self._resolve(force=True)
+        if self.writer is not None:
+            self.writer.close()
+
+
+# The kinds of DataFrameSink columns.
+COLUMN_KINDS = ('float', 'int', 'bool', 'category', 'string')
+
+
+class FrameColumn:
+    __slots__ = ('kind', 'values', 'mask', 'categories')
+
+    def __init__(self, kind: str, capacity: int):
+        """A preallocated, typed column of a DataFrameSink.
+
+        float columns are float64 with NaN for missing values, int and bool columns hold a missing-value mask
+        (and become nullable Int64 and boolean columns), category columns hold int32 codes (-1 for missing) and
+        string columns are object arrays.
+
+        :param kind: One of COLUMN_KINDS.
+        :param capacity: Rows allocated.
+        :raises ValueError: If the kind is unknown.
+        """
+        if kind not in COLUMN_KINDS:
+            raise ValueError(f'Unknown column kind {kind}, use one of {COLUMN_KINDS}')
+        self.kind = kind
+        self.values = self._allocate(capacity)
+        self.mask = np.ones(capacity, dtype=bool) if kind in ('int', 'bool') else None
+        self.categories: Optional[Dict[Any, int]] = {} if kind == 'category' else None
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self.kind == 'float':
+            return np.full(capacity, np.nan)
+        if self.kind == 'int':
+            return np.zeros(capacity, dtype=np.int64)
+        if self.kind == 'bool':
+            return np.zeros(capacity, dtype=bool)
+        if self.kind == 'category':
+            return np.full(capacity, -1, dtype=np.int32)
+        return np.full(capacity, None, dtype=object)
+
+    def grow(self, capacity: int) -> None:
+        """Reallocates the column with room for `capacity` rows, keeping its values."""
+        values = self._allocate(capacity)
+        values[:len(self.values)] = self.values
+        if self.mask is not None:
+            self.mask = np.concatenate([self.mask, np.ones(capacity - len(self.mask), dtype=bool)])
+        self.values = values
+
+    def set(self, index: int, value: Any) -> None:
+        value = normalize_value(value)
+        if value is None:
+            return
+        if self.kind == 'category':
+            value = self.categories.setdefault(value, len(self.categories))
+        elif self.mask is not None:
+            self.mask[index] = False
+        self.values[index] = value
+
+    def array(self, length: int):
+        """Returns the first `length` values as the array of a DataFrame column.
+
+        The unused capacity is trimmed by copying the column, unless it is full, so that the DataFrame does not
+        keep the spare rows alive.
+        """
+        values = self.values if length == len(self.values) else self.values[:length].copy()
+        mask = None if self.mask is None else self.mask[:length].copy()
+        if self.kind == 'int':
+            return pd.arrays.IntegerArray(values, mask)
+        if self.kind == 'bool':
+            return pd.arrays.BooleanArray(values, mask)
+        if self.kind == 'category':
+            return pd.Categorical.from_codes(values, categories=list(self.categories))
+        return values
+
+
+class DataFrameSink(ReportSink):
+    def __init__(self, columns: Optional[Dict[str, str]] = None, capacity: int = 256):
+        """Builds a pandas DataFrame from report rows, filling typed column arrays as the rows arrive.
+
+        The schema maps each column to one of COLUMN_KINDS. A schema column missing from a row (e.g. the metrics
+        of a cluster without a primary) is NaN or missing in that row. A key outside the schema gets a column of
+        its own when its first value arrives: float for numbers, category otherwise, missing in the earlier rows.
+
+        The arrays double when full, so the rows are never held as dicts, and the DataFrame is built from the
+        arrays at close, trimming them one column at a time.
+
+        :param columns: The schema, column names to kinds in column order, e.g. report_schema() of atlas_lib.
+        :param capacity: Rows allocated up front, e.g. the expected number of clusters.
+        :raises ValueError: If a kind is unknown.
+        """
+        self.capacity = max(capacity, 1)
+        self.rows_written = 0
+        self._columns: Dict[str, FrameColumn] = OrderedDict(
+            (name, FrameColumn(kind, self.capacity)) for name, kind in (columns or {}).items())
+        self._frame: Optional[pd.DataFrame] = None
+
+    def write_row(self, row: dict) -> None:
+        if self.rows_written == self.capacity:
+            self.capacity *= 2
+            for each in self._columns.values():
+                each.grow(self.capacity)
+        for key, value in row.items():
+            column = self._columns.get(key)
+            if column is None:
+                if value is None:
+                    continue
+                kind = 'float' if isinstance(value, (int, float, np.number)) and not isinstance(value, Enum) \
+                    else 'category'
+                column = self._columns[key] = FrameColumn(kind, self.capacity)
+            column.set(self.rows_written, value)
+        self.rows_written += 1
+
+    def close(self) -> None:
+        arrays = OrderedDict()
+        while self._columns:
+            name = next(iter(self._columns))
+            arrays[name] = self._columns.pop(name).array(self.rows_written)
+        self._frame = pd.DataFrame(arrays, copy=False)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """The DataFrame of the rows written, available once the sink is closed."""
+        if self._frame is None:
+            raise RuntimeError('The DataFrame is built when the sink is closed')
+        return self._frame
+
+
+class SeriesSink:
+    """Consumes long-format series chunks (cluster, host, metric, timestamp, value), e.g. from Fleet.get_series."""
+    points_written = 0
+
+    def write_chunk(self, chunk: Dict[str, np.ndarray]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def write(self, chunks: Iterable[Dict[str, np.ndarray]], *,
+              instrumentation: Optional[Instrumentation] = None) -> int:
+        """Writes every chunk of an iterable as the chunks arrive, then closes the sink.
+
+        :param instrumentation: Times the writes as the export stage, excluding the time waiting for chunks.
+        :return: The number of data points written.
+        """
+        for each_chunk in chunks:
+            with stage(instrumentation, 'export'):
+                self.write_chunk(each_chunk)
+            self.points_written += len(each_chunk['value'])
+        with stage(instrumentation, 'export'):
+            self.close()
+        return self.points_written
+
+
+class SQLiteSeriesSink(SeriesSink):
+    def __init__(self, path: str, table: str = 'series'):
+        """Writes series chunks to a SQLite table.
+
+        The table has the columns cluster, host, metric, timestamp (Unix seconds) and value, and is created if
+        missing. Each chunk is inserted in a single transaction.
+
+        :param path: The SQLite file
+        :param table: The table name
+        """
+        self.table = table
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (cluster TEXT, host TEXT, metric TEXT, '
+                           f'timestamp INTEGER, value REAL)')
+        self._conn.commit()
+
+    def write_chunk(self, chunk: Dict[str, np.ndarray]) -> None:
+        rows = zip(chunk['cluster'].tolist(), chunk['host'].tolist(), chunk['metric'].tolist(),
+                   chunk['timestamp'].astype('int64').tolist(), chunk['value'].tolist())
+        with self._conn:
+            self._conn.executemany(f'INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?)', rows)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ParquetSeriesSink(SeriesSink):
+    def __init__(self, path: str, file_format: str = 'parquet'):
+        """Writes series chunks to a Parquet file, one row group per chunk, or to an Arrow IPC file.
+
+        Requires pyarrow. The value and timestamp buffers are handed to Arrow without conversion, the cluster,
+        host and metric columns are dictionary encoded.
+
+        :param path: The output file
+        :param file_format: 'parquet' or 'arrow'
+        """
+        if pyarrow is None:
+            raise ImportError('ParquetSeriesSink requires pyarrow, install it with pip install pyarrow')
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError(f'Unknown file format {file_format}, use parquet or arrow')
+        self.schema = pyarrow.schema([('cluster', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                                      ('host', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                                      ('metric', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                                      ('timestamp', pyarrow.timestamp('s')),
+                                      ('value', pyarrow.float64())])
+        if file_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write_chunk(self, chunk: Dict[str, np.ndarray]) -> None:
+        arrays = [pyarrow.array(chunk[each.name], type=each.type.value_type).dictionary_encode()
+                  if pyarrow.types.is_dictionary(each.type) else pyarrow.array(chunk[each.name], type=each.type)
+                  for each in self.schema]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class GoogleSheetSink(ReportSink):
+    STATUS_ROW = 0
+    HEADER_ROW = 1
+    FIRST_DATA_ROW = 2
+
+    def __init__(self, worksheet, batch_rows: int = 200, status_interval: float = 5.0,
+                 header_format: Optional[dict] = None):
+        """Writes report rows to a Google Sheets worksheet in batches.
+
+        The layout is the one of gsheet.py: a status message in A1, the header in row 2 and a row per cluster from
+        row 3. Buffered rows, the header (with its formatting), any pending status and the grid resize they need
+        are sent as a single spreadsheets.batchUpdate call every `batch_rows` rows. Status messages are written at
+        most once every `status_interval` seconds, later ones wait for the next write.
+
+        Columns are added to the header as new keys are seen, so rows do not need to share the same keys.
+
+        :param worksheet: A gspread Worksheet
+        :param batch_rows: Rows buffered before they are sent.
+        :param status_interval: Minimum seconds between two status updates.
+        :param header_format: A Sheets CellFormat for the header row (default = HEADER_FORMAT)
+        """
+        self.worksheet = worksheet
+        self.batch_rows = batch_rows
+        self.status_interval = status_interval
+        self.header_format = header_format or HEADER_FORMAT
+        self.header: List[str] = []
+        self.rows_written = 0
+        self.api_calls = 0
+        self._buffer: List[list] = []
+        self._header_written = 0
+        self._grid_rows = worksheet.row_count
+        self._grid_cols = worksheet.col_count
+        self._status: Optional[str] = None
+        self._status_sent_at: Optional[float] = None
+
+    @staticmethod
+    def cell(value: Any) -> dict:
+        """Returns a Sheets CellData holding the value."""
+        value = normalize_value(value)
+        if value is None or (isinstance(value, float) and not math.isfinite(value)):
+            return {}
+        if isinstance(value, bool):
+            return {'userEnteredValue': {'boolValue': value}}
+        if isinstance(value, (int, float)):
+            return {'userEnteredValue': {'numberValue': value}}
+        return {'userEnteredValue': {'stringValue': str(value)}}
+
+    def _update_cells(self, row_index: int, rows: List[list], fields: str = 'userEnteredValue',
+                      cell_format: Optional[dict] = None) -> dict:
+        row_data = []
+        for each_row in rows:
+            cells = [self.cell(each) for each in each_row]
+            if cell_format:
+                for each_cell in cells:
+                    each_cell['userEnteredFormat'] = cell_format
+            row_data.append({'values': cells})
+        return {'updateCells': {'start': {'sheetId': self.worksheet.id, 'rowIndex': row_index, 'columnIndex': 0},
+                                'rows': row_data, 'fields': fields}}
+
+    def _grow(self, dimension: str, length: int) -> dict:
+        return {'appendDimension': {'sheetId': self.worksheet.id, 'dimension': dimension, 'length': length}}
+
+    def _send(self, requests: List[dict]) -> None:
+        if requests:
+            self.worksheet.spreadsheet.batch_update({'requests': requests})
+            self.api_calls += 1
+
+    def _status_request(self) -> List[dict]:
+        if self._status is None:
+            return []
+        request = self._update_cells(self.STATUS_ROW, [[self._status]])
+        self._status = None
+        self._status_sent_at = time.monotonic()
+        return [request]
+
+    def status(self, message: str, force: bool = False) -> None:
+        """Sets the status message in A1, sent right away unless one was sent less than status_interval ago."""
+        self._status = message
+        if force or self._status_sent_at is None or \
+                time.monotonic() - self._status_sent_at >= self.status_interval:
+            self._send(self._status_request())
+
+    def write_row(self, row: dict) -> None:
+        """Buffers a report row, flushing once batch_rows rows are buffered."""
+        for each_key in row:
+            if each_key not in self.header:
+                self.header.append(each_key)
+        self._buffer.append([row.get(each) for each in self.header])
+        if len(self._buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """Sends the buffered rows, header changes and pending status in a single batchUpdate call."""
+        requests = []
+        rows_needed = self.FIRST_DATA_ROW + self.rows_written + len(self._buffer)
+        if rows_needed > self._grid_rows:
+            requests.append(self._grow('ROWS', rows_needed - self._grid_rows))
+            self._grid_rows = rows_needed
+        if len(self.header) > self._grid_cols:
+            requests.append(self._grow('COLUMNS', len(self.header) - self._grid_cols))
+            self._grid_cols = len(self.header)
+        if len(self.header) > self._header_written:
+            requests.append(self._update_cells(self.HEADER_ROW, [self.header],
+                                               fields='userEnteredValue,userEnteredFormat',
+                                               cell_format=self.header_format))
+            self._header_written = len(self.header)
+        if self._buffer:
+            requests.append(self._update_cells(self.FIRST_DATA_ROW + self.rows_written, self._buffer))
+        requests += self._status_request()
+        self._send(requests)
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def write(self, rows: Iterable[dict], name_key: str = 'name', *,
+              instrumentation: Optional[Instrumentation] = None) -> int:
+        """Writes every row of an iterable as the rows arrive, with a status message for each, then closes the sink.
+
+        :param rows: The report rows.
+        :param name_key: The row key shown in the status message.
+        :param instrumentation: Times the writes as the export stage, excluding the time waiting for rows.
+        :return: The number of rows written.
+        """
+        for each_row in rows:
+            with stage(instrumentation, 'export'):
+                self.write_row(each_row)
+                self.status(f'Received data for {each_row.get(name_key)}')
+        with stage(instrumentation, 'export'):
+            self.close()
+        return self.rows_written
+
+    def close(self, message: str = 'COMPLETE!') -> None:
+        """Sends the remaining rows together with a final status message."""
+        self._status = message
+        self.flush()
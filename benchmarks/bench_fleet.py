@@ -0,0 +1,198 @@
+"""Benchmarks the report paths against the offline FakeAtlasNetwork.
+
+Measures wall time, API calls and peak memory of the report (in full and for a few columns), store_measurements
+and DataFrame paths at several fleet sizes. Results can be saved and compared against a baseline to catch regressions:
+
+    python -m benchmarks.bench_fleet --sizes 10,50 --latency 0.005 --output baseline.json
+    python -m benchmarks.bench_fleet --sizes 10,50 --latency 0.005 --baseline baseline.json
+
+With --throttle-rate, the fake answers that share of the requests with 429, to benchmark the retry and backoff path:
+
+    python -m benchmarks.bench_fleet --sizes 10 --throttle-rate 0.05 --backoff 0.01
+"""
+from atlas_lib import Fleet, HostData
+from atlas_ratelimit import TokenBucket, throttle
+from atlasapi.atlas import Atlas
+from atlasapi.measurements import AtlasMeasurementTypes
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from tests.fake_atlas import fake_atlas
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from texttable import Texttable
+import argparse
+import humanfriendly
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY = AtlasGranularities.HOUR
+PERIOD = AtlasPeriods.WEEKS_1
+# A typical alerting report, which only needs a few columns.
+ALERT_COLUMNS = ['name', AtlasMeasurementTypes.Disk.Util.util, AtlasMeasurementTypes.Cache.dirty,
+                 AtlasMeasurementTypes.TicketsAvailable.writes]
+# Metrics compared against a baseline, lower is better for all of them.
+COMPARED = ('wall_seconds', 'api_calls', 'peak_bytes')
+
+
+def fleet(atlas_obj: Atlas) -> Fleet:
+    # The fake answers instantly, so the default 100 requests per minute bucket would only measure the bucket.
+    return Fleet(atlas_obj, rate_limiter=TokenBucket(rate=1e6))
+
+
+def bench_report(atlas_obj: Atlas, workers: int) -> Callable[[], object]:
+    return lambda: sum(1 for _ in fleet(atlas_obj).get_full_report_primary_metrics(GRANULARITY, PERIOD,
+                                                                                   max_workers=workers))
+
+
+def bench_report_columns(atlas_obj: Atlas, workers: int) -> Callable[[], object]:
+    return lambda: sum(1 for _ in fleet(atlas_obj).get_full_report_primary_metrics(GRANULARITY, PERIOD,
+                                                                                   max_workers=workers,
+                                                                                   columns=ALERT_COLUMNS))
+
+
+def bench_store_measurements(atlas_obj: Atlas, workers: int) -> Callable[[], object]:
+    # The primaries are looked up before the timed part, which only stores their measurements.
+    primaries = [each.primary(atlas_obj) for each in fleet(atlas_obj).clusters_list]
+    atlas_obj.network.reset()
+
+    def run() -> int:
+        for each in primaries:
+            HostData(each, keep_points=False).store_measurements(atlas_obj, granularity=GRANULARITY, period=PERIOD,
+                                                                 max_workers=workers)
+        return len(primaries)
+    return run
+
+
+def bench_dataframe(atlas_obj: Atlas, workers: int) -> Callable[[], object]:
+    return lambda: len(fleet(atlas_obj).get_full_report_primary_metrics_df(GRANULARITY, PERIOD, max_workers=workers))
+
+
+CASES = OrderedDict([('report', bench_report), ('report_columns', bench_report_columns),
+                     ('store_measurements', bench_store_measurements), ('dataframe', bench_dataframe)])
+
+
+def measure(case: str, clusters: int, databases: int = 4, hosts: int = 3, latency: float = 0.0, workers: int = 1,
+            repeat: int = 3, memory: bool = True, throttle_rate: float = 0.0, backoff: float = 2.0) -> Dict:
+    """Runs a benchmark case on a fresh fake fleet.
+
+    The wall time is the best of `repeat` runs. Peak memory is measured in a separate run under tracemalloc, whose
+    overhead would otherwise skew the wall time, and slows the benchmark down severalfold.
+
+    :param case: A name of CASES.
+    :param clusters: Clusters of the fake fleet.
+    :param databases: Databases per cluster.
+    :param hosts: Members per cluster.
+    :param latency: Seconds every fake API call takes.
+    :param workers: Passed as max_workers to the benchmarked call.
+    :param repeat: Timed runs.
+    :param memory: Measure the peak memory, None is reported otherwise.
+    :param throttle_rate: Share of the fake API calls answered with 429, each retried after a backoff.
+    :param backoff: Initial backoff in seconds after a 429, doubled for each retry of the same request.
+    """
+    def prepare() -> Callable[[], object]:
+        atlas_obj = fake_atlas(clusters=clusters, databases=databases, hosts=hosts, latency=latency,
+                               throttle_rate=throttle_rate)
+        # The Fleet only swaps the bucket of an already throttled network, keeping its backoff.
+        throttle(atlas_obj, TokenBucket(rate=1e6), backoff=backoff)
+        run = CASES[case](atlas_obj, workers)
+        networks.append(atlas_obj.network)
+        return run
+
+    networks = []
+    timings = []
+    for _ in range(repeat):
+        run = prepare()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        run = prepare()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    network = getattr(networks[-1], 'network', networks[-1])
+    return OrderedDict([('case', case), ('clusters', clusters), ('workers', workers),
+                        ('wall_seconds', min(timings)), ('api_calls', network.requests),
+                        ('retries', network.throttled), ('data_points', network.points), ('peak_bytes', peak)])
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Returns a message for every result worse than its baseline by more than `tolerance` (0.2 is 20%)."""
+    expected = {(each['case'], each['clusters'], each['workers']): each for each in baseline}
+    regressions = []
+    for each in results:
+        previous = expected.get((each['case'], each['clusters'], each['workers']))
+        if not previous:
+            continue
+        for each_metric in COMPARED:
+            if each[each_metric] is None or previous[each_metric] is None:
+                continue
+            if each[each_metric] > previous[each_metric] * (1 + tolerance):
+                regressions.append(f'{each["case"]} with {each["clusters"]} clusters: {each_metric} '
+                                   f'{each[each_metric]:.6g} > {previous[each_metric]:.6g}')
+    return regressions
+
+
+def table(results: List[Dict]) -> str:
+    output = Texttable(max_width=0)
+    output.set_deco(Texttable.HEADER)
+    output.header(['case', 'clusters', 'workers', 'wall', 'API calls', '429 retries', 'data points', 'peak memory'])
+    output.set_cols_align(['l', 'r', 'r', 'r', 'r', 'r', 'r', 'r'])
+    for each in results:
+        output.add_row([each['case'], each['clusters'], each['workers'],
+                        f'{each["wall_seconds"]:.3f}s', each['api_calls'], each.get('retries', 0), each['data_points'],
+                        humanfriendly.format_size(each['peak_bytes']) if each['peak_bytes'] is not None else '-'])
+    return output.draw()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default=','.join(CASES), help='Comma separated cases to run')
+    parser.add_argument('--sizes', default='10,50', help='Comma separated fleet sizes (clusters)')
+    parser.add_argument('--databases', type=int, default=4, help='Databases per cluster')
+    parser.add_argument('--hosts', type=int, default=3, help='Members per cluster')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds every fake API call takes')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of the fake API calls answered with 429 (default = 0)')
+    parser.add_argument('--backoff', type=float, default=2.0, help='Initial backoff in seconds after a 429')
+    parser.add_argument('--workers', default='1', help='Comma separated max_workers values')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs, the best is kept')
+    parser.add_argument('--skip-memory', action='store_true', help='Do not measure the peak memory')
+    parser.add_argument('--output', help='Save the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression against the baseline')
+    args = parser.parse_args(argv)
+
+    results = []
+    for each_case in args.cases.split(','):
+        for each_size in map(int, args.sizes.split(',')):
+            for each_workers in map(int, args.workers.split(',')):
+                logger.info(f'Running {each_case} with {each_size} clusters and {each_workers} workers')
+                results.append(measure(each_case, each_size, databases=args.databases, hosts=args.hosts,
+                                       latency=args.latency, workers=each_workers, repeat=args.repeat,
+                                       memory=not args.skip_memory, throttle_rate=args.throttle_rate,
+                                       backoff=args.backoff))
+    print(table(results))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for each in regressions:
+            print(f'REGRESSION: {each}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""An offline stand-in for the Atlas API, serving a synthetic fleet.
+
+FakeAtlasNetwork replaces the atlasapi Network of an Atlas object (see fake_atlas) and can also answer the requests of
+an AsyncAtlasClient through an httpx.MockTransport (see fake_async_client), so reports can be tested and benchmarked
+without credentials.
+"""
+from atlasapi.atlas import Atlas
+from atlasapi.errors import ErrAtlasNotFound, ErrAtlasServerErrors
+from atlasapi.measurements import AtlasMeasurementTypes
+from atlas_async import AsyncAtlasClient
+from atlas_ratelimit import TOO_MANY_REQUESTS
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+from urllib.parse import urlparse, parse_qs
+import asyncio
+import isodate
+import random
+import re
+import threading
+import time
+import httpx
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def measurement_names(measurement_types) -> List[str]:
+    """Returns every measurement name of an AtlasMeasurementTypes group, e.g. AtlasMeasurementTypes.Disk."""
+    names = []
+    for key, value in vars(measurement_types).items():
+        if key.startswith('_'):
+            continue
+        if isinstance(value, str):
+            names.append(value)
+        elif isinstance(value, type):
+            names.extend(measurement_names(value))
+    return names
+
+
+DISK_MEASUREMENTS = measurement_names(AtlasMeasurementTypes.Disk)
+NAMESPACE_MEASUREMENTS = measurement_names(AtlasMeasurementTypes.Namespaces)
+
+
+class FakeAtlasNetwork:
+    def __init__(self, clusters: int = 3, databases: int = 4, hosts: int = 3, sharded: int = 0, shards: int = 3,
+                 projects: Iterable[str] = ('g1',), group: str = 'g1', latency: float = 0.0,
+                 throttle_rate: float = 0.0, seed: int = 0, now: Optional[float] = None, name_prefix: str = '',
+                 max_items_per_page: int = 500, failing_metrics: Iterable[str] = ()):
+        """Answers Atlas API requests for a synthetic fleet.
+
+        Every project holds `clusters` replica sets of `hosts` members and `sharded` sharded clusters of `shards`
+        shards (and a config server replica set). Clusters of projects other than `group` are prefixed with the
+        project id. Data points are deterministic functions of their timestamp (and database).
+
+        :param clusters: Replica set clusters per project.
+        :param databases: User databases per cluster, admin and local are added to them.
+        :param hosts: Members of each replica set.
+        :param sharded: Sharded clusters per project.
+        :param shards: Shards of each sharded cluster.
+        :param projects: The project ids listed to the authenticated user.
+        :param group: The project of the Atlas object.
+        :param latency: Seconds every request takes.
+        :param throttle_rate: Probability of answering a request with 429.
+        :param seed: Seed of the 429 draws.
+        :param now: The current time as a POSIX timestamp, None for the clock.
+        :param name_prefix: Prefixes every cluster name, e.g. app-config- for names holding -config-.
+        :param max_items_per_page: Caps the itemsPerPage of the project listing, as Atlas caps it at 500.
+        :param failing_metrics: Host measurements answered with 500, as is every request that includes them.
+        """
+        self.cluster_names = [f'{name_prefix}c{i}' for i in range(clusters)]
+        self.sharded_names = [f'{name_prefix}s{i}' for i in range(sharded)]
+        self.database_names = [f'db{i}' for i in range(databases)] + ['admin', 'local']
+        self.hosts_per_cluster = hosts
+        self.shards = shards
+        self.projects = list(projects)
+        self.group = group
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.max_items_per_page = max_items_per_page
+        self.failing_metrics = set(failing_metrics)
+        self.now = now
+        self.calls = Counter()
+        self.points = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def requests(self) -> int:
+        """Requests answered, not counting those answered with 429."""
+        return sum(self.calls.values())
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.points = 0
+        self.throttled = 0
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                self.throttled += 1
+                return True
+        return False
+
+    def _count(self, kind: str, response: dict) -> dict:
+        with self._lock:
+            self.calls[kind] += 1
+            self.points += sum(len(each['dataPoints']) for each in response.get('measurements', []))
+        return response
+
+    def series(self, query: dict, offset: float = 0.0) -> List[dict]:
+        """Returns the data points of a measurement request, over its period or start/end range.
+
+        :param offset: Added to every value, e.g. so that each database has different counts.
+        """
+        step = isodate.parse_duration(query.get('granularity', ['PT1H'])[0]).total_seconds()
+        now = self.now or time.time()
+        if 'start' in query:
+            start = isodate.parse_datetime(query['start'][0]).timestamp()
+            end = isodate.parse_datetime(query['end'][0]).timestamp()
+        else:
+            end = now
+            start = (datetime.fromtimestamp(now, timezone.utc) -
+                     isodate.parse_duration(query.get('period', ['P1D'])[0])).timestamp()
+        points = []
+        timestamp = -(-start // step) * step
+        while timestamp <= end:
+            points.append({'timestamp': datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIMESTAMP_FORMAT),
+                           'value': float(int(timestamp) % 997) + offset})
+            timestamp += step
+        return points
+
+    def _clusters(self, prefix: str) -> List[dict]:
+        results = []
+        for each in self.cluster_names:
+            results.append(self._cluster(prefix + each, 'REPLICASET', 'M10', 1, [
+                {'id': 'spec0', 'numShards': 1, 'zoneName': 'Zone 1',
+                 'regionsConfig': {'US_EAST_1': {'electableNodes': self.hosts_per_cluster, 'analyticsNodes': 0,
+                                                 'readOnlyNodes': 0}}}]))
+        for each in self.sharded_names:
+            # Two zones, so the shards of a cluster span several specs and regions.
+            first = max(self.shards - 1, 1)
+            results.append(self._cluster(prefix + each, 'SHARDED', 'M30', self.shards, [
+                {'id': 'spec0', 'numShards': first, 'zoneName': 'Zone 1',
+                 'regionsConfig': {'EU_WEST_1': {'electableNodes': 2, 'analyticsNodes': 1, 'readOnlyNodes': 0},
+                                   'EU_CENTRAL_1': {'electableNodes': 1, 'analyticsNodes': 0, 'readOnlyNodes': 1}}},
+                {'id': 'spec1', 'numShards': self.shards - first, 'zoneName': 'Zone 2',
+                 'regionsConfig': {'US_WEST_2': {'electableNodes': 3, 'analyticsNodes': 0, 'readOnlyNodes': 0}}}]))
+        return results
+
+    @staticmethod
+    def _cluster(name: str, cluster_type: str, instance_size: str, shards: int, specs: List[dict]) -> dict:
+        return {'name': name, 'id': name + 'id', 'clusterType': cluster_type, 'diskSizeGB': 10, 'numShards': shards,
+                'createDate': '2020-01-01T00:00:00Z', 'mongoURIUpdated': '2020-01-01T00:00:00Z',
+                'mongoDBMajorVersion': '6.0', 'stateName': 'IDLE', 'replicationSpecs': specs,
+                'providerSettings': {'instanceSizeName': instance_size, 'providerName': 'AWS', 'diskIOPS': 100,
+                                     'volumeType': 'STANDARD', 'regionName': 'US_EAST_1'}}
+
+    def _processes(self, group: str, prefix: str) -> List[dict]:
+        results = []
+        for each in self.cluster_names:
+            results.extend(self._replica_set(group, f'{prefix}{each}-shard-00', f'atlas-{prefix}{each}-shard-0',
+                                             self.hosts_per_cluster))
+        for each in self.sharded_names:
+            for k in range(self.shards):
+                results.extend(self._replica_set(group, f'{prefix}{each}-shard-0{k}', f'atlas-{prefix}{each}-shard-{k}',
+                                                 3))
+            results.extend(self._replica_set(group, f'{prefix}{each}-config-00', f'atlas-{prefix}{each}-config-0', 3,
+                                             config=True))
+        return results
+
+    @staticmethod
+    def _replica_set(group: str, host_prefix: str, replica_set_name: str, members: int,
+                     config: bool = False) -> List[dict]:
+        role = 'SHARD_CONFIG' if config else 'REPLICA'
+        return [{'hostname': f'{host_prefix}-0{n}.abc.mongodb.net', 'port': 27017, 'groupId': group,
+                 'typeName': f'{role}_PRIMARY' if n == 0 else f'{role}_SECONDARY', 'replicaSetName': replica_set_name,
+                 'created': '2020-01-01T00:00:00Z', 'id': f'{host_prefix}-0{n}'} for n in range(members)]
+
+    def route(self, uri: str, params=None) -> dict:
+        """Returns the response of a GET request, counting it in `calls` by kind.
+
+        :raises ErrAtlasNotFound: For unknown resources.
+        """
+        url = urlparse(uri)
+        query = parse_qs(url.query)
+        for key, value in (params.items() if isinstance(params, dict) else params or []):
+            query.setdefault(key, []).extend(value if isinstance(value, (list, tuple)) else [value])
+        path = url.path.rstrip('/')
+        match = re.search(r'/groups/([^/]+)', path)
+        group = match.group(1) if match else None
+        prefix = '' if group in (None, self.group) else group + '-'
+        if path.endswith('/groups'):
+            results = [{'id': each, 'name': 'Proj' + each, 'orgId': 'o1', 'created': '2020-01-01T00:00:00Z'}
+                       for each in self.projects]
+            # Paged as Atlas pages it, 100 items by default.
+            per_page = min(int(query.get('itemsPerPage', [100])[0]), self.max_items_per_page)
+            start = (int(query.get('pageNum', [1])[0]) - 1) * per_page
+            return self._count('projects', {'results': results[start:start + per_page], 'totalCount': len(results)})
+        if group is not None and group not in self.projects:
+            raise ErrAtlasNotFound(404, {'detail': f'No group with ID {group} exists.'})
+        if re.search(r'/groups/[^/]+$', path):
+            return self._count('project', {'id': group, 'name': 'Proj' if group == self.group else 'Proj' + group,
+                                           'orgId': 'o1', 'created': '2020-01-01T00:00:00Z'})
+        if path.endswith('/clusters'):
+            results = self._clusters(prefix)
+            return self._count('clusters', {'results': results, 'totalCount': len(results)})
+        if path.endswith('/processes'):
+            results = self._processes(group, prefix)
+            return self._count('processes', {'results': results, 'totalCount': len(results)})
+        if path.endswith('/disks/data/measurements'):
+            return self._count('disk', {'measurements': [
+                {'name': each, 'units': 'SCALAR', 'dataPoints': self.series(query)} for each in DISK_MEASUREMENTS]})
+        if path.endswith('/measurements') and '/databases/' in path:
+            database = path.split('/databases/')[1].split('/')[0]
+            offset = 100.0 * int(database[2:]) if database[2:].isdigit() else 0.0
+            return self._count('db_measurements', {'measurements': [
+                {'name': each, 'units': 'SCALAR', 'dataPoints': self.series(query, offset)}
+                for each in query.get('m', NAMESPACE_MEASUREMENTS)]})
+        if path.endswith('/databases'):
+            results = [{'databaseName': each} for each in self.database_names]
+            return self._count('databases', {'results': results, 'totalCount': len(results)})
+        if path.endswith('/measurements'):
+            if self.failing_metrics.intersection(query.get('m', [])):
+                raise ErrAtlasServerErrors(500, {'detail': 'Internal server error'})
+            return self._count('host_measurements', {'measurements': [
+                {'name': each, 'units': 'SCALAR', 'dataPoints': self.series(query)} for each in query.get('m', [])]})
+        raise ErrAtlasNotFound(404, {'detail': f'Unknown resource {uri}'})
+
+    def get(self, uri: str) -> dict:
+        time.sleep(self.latency)
+        if self._throttle():
+            raise ErrAtlasServerErrors(TOO_MANY_REQUESTS, {'detail': 'Too many requests'})
+        return self.route(uri)
+
+    def get_big(self, uri: str, params: Optional[dict] = None) -> dict:
+        time.sleep(self.latency)
+        if self._throttle():
+            raise ErrAtlasServerErrors(TOO_MANY_REQUESTS, {'detail': 'Too many requests'})
+        return self.route(uri, params)
+
+    async def handle_async(self, request: httpx.Request) -> httpx.Response:
+        """httpx.MockTransport handler answering the requests of an AsyncAtlasClient."""
+        await asyncio.sleep(self.latency)
+        if self._throttle():
+            return httpx.Response(TOO_MANY_REQUESTS, json={'detail': 'Too many requests'}, headers={'Retry-After': '0'})
+        try:
+            return httpx.Response(200, json=self.route(str(request.url)))
+        except ErrAtlasNotFound as e:
+            return httpx.Response(404, json=e.details)
+
+
+def fake_atlas(**kwargs) -> Atlas:
+    """Returns an Atlas object for project g1 answered by a FakeAtlasNetwork created with the passed arguments."""
+    atlas = Atlas('user', 'key', kwargs.get('group', 'g1'))
+    atlas.network = FakeAtlasNetwork(**kwargs)
+    return atlas
+
+
+def fake_async_client(network: FakeAtlasNetwork, **kwargs) -> AsyncAtlasClient:
+    """Returns an AsyncAtlasClient whose requests are answered by the passed FakeAtlasNetwork."""
+    return AsyncAtlasClient('user', 'key', network.group, transport=httpx.MockTransport(network.handle_async),
+                            **kwargs)
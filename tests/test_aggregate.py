@@ -0,0 +1,50 @@
+from atlas_aggregate import Aggregator, parse_reducer
+from atlas_lib import CompactMeasurement, HostData
+from atlasapi.specs import AtlasPeriods, AtlasGranularities, AtlasMeasurementTypes
+import numpy as np
+import unittest
+
+UTIL = AtlasMeasurementTypes.Disk.Util.util
+
+
+def host_data(values: list) -> HostData:
+    timestamps = np.datetime64('2022-01-01T00:00:00') + np.arange(len(values)) * np.timedelta64(1, 'h')
+    data = HostData(None)
+    data.store_measurement(CompactMeasurement(UTIL, 'PERCENT', AtlasPeriods.WEEKS_1, AtlasGranularities.HOUR,
+                                              timestamps.astype('datetime64[s]'),
+                                              np.array(values, dtype=np.float64)))
+    return data
+
+
+class AggregatorTests(unittest.TestCase):
+    def test_00_parse_reducer(self):
+        self.assertEqual(parse_reducer('p95'), ('percentile', 95.0))
+        self.assertEqual(parse_reducer('above_80'), ('above', 80.0))
+        self.assertEqual(parse_reducer('max'), ('max', None))
+        for each in ('p101', 'above_x', 'median'):
+            with self.assertRaises(ValueError):
+                parse_reducer(each)
+
+    def test_01_reducers(self):
+        aggregator = Aggregator({UTIL: ['p50', 'max', 'stddev', 'trend', 'above_2']})
+        rows = aggregator.apply([host_data([1, 2, 3, 4, 5]), None, host_data([4, np.nan, 4])],
+                                AtlasGranularities.HOUR)
+        self.assertEqual(rows[0][f'{UTIL}_p50'], 3.0)
+        self.assertEqual(rows[0][f'{UTIL}_max'], 5.0)
+        self.assertAlmostEqual(rows[0][f'{UTIL}_stddev'], np.std([1, 2, 3, 4, 5]))
+        self.assertAlmostEqual(rows[0][f'{UTIL}_trend'], 1.0)
+        self.assertEqual(rows[0][f'{UTIL}_above_2'], 3 * 3600)
+        self.assertEqual(rows[1], {each: None for each in aggregator.columns})
+        self.assertEqual(rows[2][f'{UTIL}_p50'], 4.0)
+        self.assertAlmostEqual(rows[2][f'{UTIL}_trend'], 0.0)
+
+    def test_02_missing_metric(self):
+        aggregator = Aggregator({AtlasMeasurementTypes.Cache.used: ['p95']})
+        rows = aggregator.apply([host_data([1, 2])], AtlasGranularities.HOUR)
+        self.assertEqual(rows, [{f'{AtlasMeasurementTypes.Cache.used}_p95': None}])
+
+    def test_03_pooled_hosts(self):
+        aggregator = Aggregator({UTIL: ['p50', 'max', 'above_1']})
+        rows = aggregator.apply([[host_data([1, 2]), host_data([5])], []], AtlasGranularities.HOUR)
+        self.assertEqual(rows[0], {f'{UTIL}_p50': 2.0, f'{UTIL}_max': 5.0, f'{UTIL}_above_1': 2 * 3600})
+        self.assertEqual(rows[1], {each: None for each in aggregator.columns})
@@ -0,0 +1,20 @@
+from atlas_lib import Fleet
+from atlas_async import AsyncAtlasClient, AsyncFleet
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from pprint import pprint
+from tests import BaseTests
+import asyncio
+
+
+class AsyncFleetTests(BaseTests):
+
+    def test_00_async_fleet_report(self):
+        async def collect():
+            async with AsyncAtlasClient(self.USER, self.API_KEY, self.GROUP_ID) as client:
+                return [each async for each in AsyncFleet(client).report(granularity=AtlasGranularities.HOUR,
+                                                                         period=AtlasPeriods.WEEKS_1)]
+
+        rows = asyncio.run(collect())
+        pprint(rows[:1])
+        serial = list(Fleet(self.a).clusters_list)
+        self.assertEqual([each['name'] for each in rows], [each.name for each in serial])
@@ -52,7 +52,59 @@ class MeasurementTests(BaseTests):
             else:
                 print('------------------')
 
+    def test_02_host_inventory(self):
+        atlas: Atlas = self.a
+        current_fleet = Fleet(atlas)
+        current_fleet.inventory.refresh()
+
+        for each_cluster in current_fleet.clusters_list:
+            from_inventory = current_fleet.inventory.primary(each_cluster.name)
+            listed = [host for host in each_cluster.hosts(atlas) if host.type == ReplicaSetTypes.REPLICA_PRIMARY]
+            print(f'Cluster : {each_cluster.name}... Primary Host = {from_inventory}')
+            if listed:
+                self.assertEqual(from_inventory, listed[-1])
+            else:
+                self.assertIsNone(from_inventory)
+
+    def test_03_namespace_stats(self):
+        atlas: Atlas = self.a
+        current_fleet = Fleet(atlas)
 
+        for each_cluster in current_fleet.clusters_list:
+            stats = each_cluster.namespace_stats(atlas)
+            if stats is None:
+                print(f'Cluster : {each_cluster.name}... No primary')
+                continue
+            pprint(stats.__dict__)
+            self.assertEqual(stats.databases, each_cluster.db_count(atlas))
+            self.assertEqual(stats.collections, each_cluster.count_collections(atlas))
+            break
+
+    def test_04_fleet_report_parallel(self):
+        atlas: Atlas = self.a
+        current_fleet = Fleet(atlas)
+        serial = [each['name'] for each in current_fleet.get_full_report_primary_metrics(
+            granularity=AtlasGranularities.HOUR, period=AtlasPeriods.WEEKS_1)]
+        parallel = [each['name'] for each in current_fleet.get_full_report_primary_metrics(
+            granularity=AtlasGranularities.HOUR, period=AtlasPeriods.WEEKS_1, max_workers=4)]
+        self.assertEqual(serial, parallel)
 
+    def test_05_store_measurements_batched(self):
+        atlas: Atlas = self.a
+        current_fleet = Fleet(atlas)
 
+        for each_cluster in current_fleet.clusters_list:
+            host_data = each_cluster.primary_metrics(atlas, granularity=AtlasGranularities.HOUR,
+                                                     period=AtlasPeriods.WEEKS_1)
+            if host_data:
+                pprint(host_data.errors)
+                self.assertEqual(host_data.errors, {})
+                self.assertIsNotNone(host_data.cache_used)
+                break
 
+    def test_06_fleet_all_projects(self):
+        atlas: Atlas = self.a
+        current_fleet = Fleet(atlas, all_projects=True)
+        self.assertIn(atlas.group, current_fleet.projects)
+        project_ids = [each.project_id for each in current_fleet.clusters_list]
+        self.assertEqual(project_ids, sorted(project_ids, key=list(current_fleet.projects).index))
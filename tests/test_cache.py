@@ -0,0 +1,135 @@
+from atlas_cache import MeasurementCache, MeasurementCacheMiss, SeriesStore, ReportJournal
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+import unittest
+
+
+class MeasurementCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = MeasurementCache(':memory:')
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_00_round_trip(self):
+        payload = {'name': 'CACHE_DIRTY_BYTES', 'dataPoints': [{'timestamp': '2022-01-01T00:00:00Z', 'value': 1}]}
+        self.assertIsNone(self.cache.get('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR,
+                                         AtlasPeriods.WEEKS_1))
+        self.cache.put('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR, AtlasPeriods.WEEKS_1, payload)
+        self.assertEqual(self.cache.get('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR,
+                                        AtlasPeriods.WEEKS_1), payload)
+        self.assertIsNone(self.cache.get('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.MINUTE,
+                                         AtlasPeriods.WEEKS_1))
+
+    def test_01_cached_fetches_once(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return ['db1']
+
+        for _ in range(3):
+            self.assertEqual(self.cache.cached('host:27017', 'databases', None, None, fetch), ['db1'])
+        self.assertEqual(len(calls), 1)
+
+    def test_02_ttl(self):
+        self.cache.ttl = -1
+        self.cache.put('host:27017', 'databases', None, None, ['db1'])
+        self.assertIsNone(self.cache.get('host:27017', 'databases'))
+
+    def test_03_offline_replay(self):
+        self.cache.put('host:27017', 'databases', None, None, ['db1'])
+        self.cache.ttl = -1
+        self.cache.offline = True
+        self.assertEqual(self.cache.get('host:27017', 'databases'), ['db1'])
+        with self.assertRaises(MeasurementCacheMiss):
+            self.cache.get('host:27017', 'processes')
+
+    def test_04_size_bounded(self):
+        self.cache.max_bytes = 200
+        for n in range(50):
+            self.cache.put('host:27017', f'database:db{n}', None, None, list(range(n)))
+        total = self.cache._conn.execute('SELECT SUM(size) FROM entries').fetchone()[0]
+        self.assertLessEqual(total, 200)
+        self.assertIsNotNone(self.cache.get('host:27017', 'database:db49'))
+
+    def test_05_fine_granularity_hits(self):
+        # Two calls a few seconds apart fall into the same window, which spans the ttl.
+        self.assertEqual(self.cache.window(AtlasGranularities.TEN_SECOND, 7205.0),
+                         self.cache.window(AtlasGranularities.TEN_SECOND, 7212.0))
+        self.assertNotEqual(self.cache.window(AtlasGranularities.DAY, 86399.0),
+                            self.cache.window(AtlasGranularities.DAY, 86401.0))
+        payload = {'name': 'CACHE_DIRTY_BYTES', 'dataPoints': []}
+        self.cache.put('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.TEN_SECOND, AtlasPeriods.HOURS_1, payload)
+        self.cache._conn.execute('UPDATE entries SET stored_at = stored_at - 5')
+        self.assertEqual(self.cache.get('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.TEN_SECOND,
+                                        AtlasPeriods.HOURS_1), payload)
+
+
+class SeriesStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.store = SeriesStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    @staticmethod
+    def measurement(*points):
+        return {'name': 'CACHE_DIRTY_BYTES', 'units': 'BYTES',
+                'dataPoints': [{'timestamp': f'2022-01-01T0{hour}:00:00Z', 'value': value} for hour, value in points]}
+
+    def test_00_merge(self):
+        self.assertIsNone(self.store.last_timestamp('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR))
+        self.store.merge('host:27017', self.measurement((1, 1), (2, 2), (3, None)), AtlasGranularities.HOUR,
+                         since='2022-01-01T00:00:00Z')
+        self.assertEqual(self.store.last_timestamp('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR),
+                         '2022-01-01T03:00:00Z')
+        merged = self.store.merge('host:27017', self.measurement((3, 3), (4, 4)), AtlasGranularities.HOUR,
+                                  since='2022-01-01T02:00:00Z')
+        self.assertEqual([each['value'] for each in merged['dataPoints']], [2, 3, 4])
+        self.assertEqual(merged['units'], 'BYTES')
+
+    def test_01_coverage(self):
+        self.assertEqual(self.store.coverage('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR), (None, None))
+        self.store.merge('host:27017', self.measurement((1, 1), (2, 2)), AtlasGranularities.HOUR,
+                         since='2022-01-01T01:00:00Z')
+        # A shorter period keeps the stored points, the coverage still starts at the longer period.
+        merged = self.store.merge('host:27017', self.measurement((2, 2), (3, 3)), AtlasGranularities.HOUR,
+                                  since='2022-01-01T02:30:00Z', start='2022-01-01T02:00:00Z')
+        self.assertEqual([each['value'] for each in merged['dataPoints']], [3])
+        self.assertEqual(self.store.coverage('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR),
+                         ('2022-01-01T01:00:00Z', '2022-01-01T03:00:00Z'))
+        # Points after a gap do not extend the stored coverage.
+        self.store.merge('host:27017', self.measurement((6, 6)), AtlasGranularities.HOUR,
+                         since='2022-01-01T01:00:00Z', start='2022-01-01T05:00:00Z')
+        self.assertEqual(self.store.coverage('host:27017', 'CACHE_DIRTY_BYTES', AtlasGranularities.HOUR),
+                         ('2022-01-01T05:00:00Z', '2022-01-01T06:00:00Z'))
+
+
+class ReportJournalTests(unittest.TestCase):
+    def setUp(self):
+        self.journal = ReportJournal(':memory:', run_id='run1')
+
+    def tearDown(self):
+        self.journal.close()
+
+    def test_00_rows_and_failures(self):
+        self.journal.record_row('id0', 'cluster0', {'name': 'cluster0', 'tier': AtlasGranularities.HOUR})
+        self.journal.record_failure('id1', 'cluster1', ValueError('boom'))
+        self.assertEqual(self.journal.completed(), {'id0': {'name': 'cluster0', 'tier': AtlasGranularities.HOUR}})
+        self.assertEqual(self.journal.failures(), {'cluster1': 'ValueError: boom'})
+        self.journal.record_row('id1', 'cluster1', {'name': 'cluster1'})
+        self.assertEqual(list(self.journal.completed()), ['id0', 'id1'])
+        self.assertEqual(self.journal.failures(), {})
+
+    def test_01_reset(self):
+        self.journal.record_row('id0', 'cluster0', {'name': 'cluster0'})
+        self.journal.reset()
+        self.assertEqual(self.journal.completed(), {})
+
+    def test_02_start_checks_the_parameters(self):
+        params = {'granularity': AtlasGranularities.HOUR, 'columns': ['name']}
+        self.assertEqual(self.journal.start(params), {})
+        self.journal.record_row('id0', 'cluster0', {'name': 'cluster0'})
+        self.assertEqual(list(self.journal.start(dict(params), resume=True)), ['id0'])
+        self.assertEqual(self.journal.start(dict(params, columns=['name', 'disk']), resume=True), {})
+        self.assertEqual(self.journal.completed(), {})
@@ -0,0 +1,98 @@
+from atlas_daemon import FleetDaemon, serve
+from atlas_cache import LatestStateStore
+from atlas_lib import Fleet
+from atlas_ratelimit import TokenBucket
+from atlasapi.errors import ErrAtlasServerErrors
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from tests.fake_atlas import fake_atlas
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import json
+import threading
+import time
+import unittest
+
+
+def without_status(row: dict) -> dict:
+    return {key: value for key, value in row.items() if not key.endswith(('_updated_at', '_error'))}
+
+
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.now = time.time()
+        self.atlas = fake_atlas(clusters=2, sharded=1, now=self.now)
+        self.store = LatestStateStore(':memory:')
+        self.daemon = FleetDaemon(Fleet(self.atlas, rate_limiter=TokenBucket(rate=10000)), self.store,
+                                  granularity=AtlasGranularities.HOUR, period=AtlasPeriods.WEEKS_1)
+
+    def test_00_store_matches_report(self):
+        self.assertEqual(self.daemon.run_pending(), 7)
+        report = list(Fleet(fake_atlas(clusters=2, sharded=1, now=self.now)).get_full_report_primary_metrics(
+            AtlasGranularities.HOUR, AtlasPeriods.WEEKS_1))
+        rows = self.store.rows()
+        self.assertEqual([without_status(each) for each in rows], report)
+        self.assertIsNotNone(rows[0]['metrics_updated_at'])
+
+    def test_01_refreshes_follow_their_schedule(self):
+        self.daemon.run_pending()
+        network = self.atlas.network.network
+        network.reset()
+        self.assertEqual(self.daemon.run_pending(), 0)
+        self.assertEqual(network.requests, 0)
+        # A restarted daemon resumes the schedule of the store instead of refreshing everything.
+        restarted = FleetDaemon(Fleet(self.atlas, rate_limiter=TokenBucket(rate=10000)), self.store)
+        self.assertEqual(restarted.run_pending(), 1)
+        self.assertEqual(network.calls['host_measurements'], 0)
+
+    def test_02_failed_refresh_keeps_last_values(self):
+        self.daemon.run_pending()
+        network = self.atlas.network.network
+        network.throttle_rate = 1.0
+        self.daemon.fleet.atlas.network.max_retries = 0
+        cluster_id = next(iter(self.daemon._clusters))
+        self.assertFalse(self.daemon.refresh(cluster_id, 'namespaces'))
+        row = self.store.rows(cluster_name='c0')[0]
+        self.assertIn(ErrAtlasServerErrors.__name__, row['namespaces_error'])
+        self.assertEqual(row['databases'], 4)
+
+    def test_03_http_endpoint(self):
+        self.daemon.run_pending()
+        server = serve(self.store, port=0, instrumentation=self.daemon.instrumentation)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            report = json.loads(urlopen(f'{base}/report').read())
+            self.assertEqual([each['name'] for each in report], ['c0', 'c1', 's0'])
+            self.assertEqual(json.loads(urlopen(f'{base}/clusters/s0').read())['shards'], 3)
+            self.assertTrue(urlopen(f'{base}/report.csv').read().startswith(b'ro,analytics,'))
+            with urlopen(f'{base}/metrics') as response:
+                self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+                metrics = response.read()
+            self.assertIn(b'atlas_latest_age_seconds{', metrics)
+            self.assertNotIn(b'# EOF', metrics)
+            with self.assertRaises(HTTPError):
+                urlopen(f'{base}/clusters/missing')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_04_background_thread(self):
+        self.daemon.start()
+        deadline = time.time() + 10
+        while len(self.store.updated_at()) < 9 and time.time() < deadline:
+            time.sleep(0.05)
+        self.daemon.stop(timeout=10)
+        self.assertEqual(len(self.store.updated_at()), 9)
+
+    def test_05_removed_cluster_is_dropped(self):
+        self.daemon.run_pending()
+        cluster_id = next(iter(self.daemon._clusters))
+        queued = len(self.daemon._queue)
+        # A discovery removes the cluster between the scheduling and the refresh.
+        with self.daemon._condition:
+            del self.daemon._clusters[cluster_id]
+        self.assertIsNone(self.daemon.refresh(cluster_id, 'metrics'))
+        self.daemon._run(cluster_id, 'metrics')
+        self.assertNotIn((cluster_id, 'metrics'), self.daemon._active)
+        self.assertEqual(len(self.daemon._queue), queued)
@@ -0,0 +1,224 @@
+from atlas_lib import Fleet
+from atlas_async import AsyncFleet
+from atlas_cache import ReportJournal, SeriesStore
+from atlas_ratelimit import TokenBucket, throttle
+from atlasapi.errors import ErrAtlasServerErrors
+from atlasapi.measurements import AtlasMeasurementTypes
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from tests.fake_atlas import FakeAtlasNetwork, fake_atlas, fake_async_client
+import asyncio
+import time
+import unittest
+
+GRANULARITY = AtlasGranularities.HOUR
+PERIOD = AtlasPeriods.WEEKS_1
+
+
+class OfflineFleetTests(unittest.TestCase):
+    """End to end reports against the FakeAtlasNetwork, no credentials needed."""
+
+    def setUp(self):
+        self.now = time.time()
+
+    def report(self, **kwargs) -> list:
+        fleet_kwargs = {key: kwargs.pop(key) for key in ('rate_limiter', 'project_ids') if key in kwargs}
+        report_kwargs = {key: kwargs.pop(key) for key in ('columns', 'aggregations') if key in kwargs}
+        self.atlas = fake_atlas(now=self.now, **kwargs)
+        return list(Fleet(self.atlas, **fleet_kwargs).get_full_report_primary_metrics(GRANULARITY, PERIOD,
+                                                                                      **report_kwargs))
+
+    def test_00_report_rows(self):
+        rows = self.report(clusters=3, databases=2)
+        self.assertEqual([each['name'] for each in rows], ['c0', 'c1', 'c2'])
+        self.assertEqual(rows[0]['databases'], 2)
+        self.assertIsNotNone(rows[0]['CACHE_USED_BYTES'])
+        calls = self.atlas.network.calls
+        self.assertEqual(calls['host_measurements'], 3)
+        self.assertEqual(calls['db_measurements'], 6)
+
+    def test_01_parallel_report_matches_serial(self):
+        serial = self.report(clusters=4, sharded=1)
+        atlas = fake_atlas(now=self.now, clusters=4, sharded=1)
+        parallel = list(Fleet(atlas, rate_limiter=TokenBucket(rate=10000)).get_full_report_primary_metrics(
+            GRANULARITY, PERIOD, max_workers=4))
+        self.assertEqual(parallel, serial)
+        self.assertEqual(serial[-1]['shards'], 3)
+
+    def test_02_throttled_requests_are_retried(self):
+        atlas = fake_atlas(now=self.now, clusters=2, throttle_rate=0.3, seed=1)
+        throttle(atlas, TokenBucket(rate=10000), backoff=0.001)
+        rows = list(Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, PERIOD))
+        self.assertGreater(atlas.network.network.throttled, 0)
+        self.assertEqual(rows, self.report(clusters=2))
+
+    def test_03_throttled_request_raises(self):
+        network = FakeAtlasNetwork(throttle_rate=1.0)
+        with self.assertRaises(ErrAtlasServerErrors):
+            network.get('https://cloud.mongodb.com/api/atlas/v1.0/groups/g1/clusters')
+        self.assertEqual(network.throttled, 1)
+        self.assertEqual(network.requests, 0)
+
+    def test_04_async_report_matches(self):
+        network = FakeAtlasNetwork(clusters=2, sharded=1, now=self.now)
+
+        async def report() -> list:
+            async with fake_async_client(network) as client:
+                return [each async for each in AsyncFleet(client).report(GRANULARITY, PERIOD)]
+
+        rows = asyncio.run(report())
+        self.assertEqual(rows, self.report(clusters=2, sharded=1))
+        # The metrics of the sharded cluster roll up every shard.
+        self.assertEqual(network.calls['host_measurements'], 2 + 3)
+        self.assertIn('atlas-s0-shard-1:CACHE_USED_BYTES', rows[2])
+
+    def test_05_journal_resume_skips_completed(self):
+        journal = ReportJournal(':memory:')
+        atlas = fake_atlas(now=self.now, clusters=3)
+        first = Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, PERIOD, journal=journal)
+        next(first)
+        first.close()
+        atlas = fake_atlas(now=self.now, clusters=3)
+        rows = list(Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, PERIOD, journal=journal, resume=True))
+        self.assertEqual([each['name'] for each in rows], ['c0', 'c1', 'c2'])
+        self.assertEqual(atlas.network.calls['host_measurements'], 2)
+
+    def test_06_projects(self):
+        rows = self.report(clusters=1, projects=('g1', 'g2'), project_ids=['g1', 'g2'])
+        self.assertEqual([each['name'] for each in rows], ['c0', 'g2-c0'])
+
+    def test_07_columns_drive_the_requests(self):
+        full = self.report(clusters=2, databases=3)
+        columns = ['name', AtlasMeasurementTypes.Disk.Util.util, AtlasMeasurementTypes.Cache.used, 'collections']
+        rows = self.report(clusters=2, databases=3, columns=columns)
+        self.assertEqual([list(each) for each in rows], [columns] * 2)
+        self.assertEqual(rows, [{key: each[key] for key in columns} for each in full])
+        calls = self.atlas.network.calls
+        self.assertEqual((calls['host_measurements'], calls['disk'], calls['db_measurements']), (2, 2, 6))
+
+        rows = self.report(clusters=2, databases=3, columns=['name', 'disk'])
+        self.assertIn(AtlasMeasurementTypes.Disk.IOPS.read_max, rows[0])
+        self.assertEqual(self.atlas.network.calls['disk'], 2)
+        self.assertEqual(self.atlas.network.requests, self.atlas.network.calls['disk'] + 3)
+
+        self.report(clusters=2, columns=['name', 'databases'])
+        self.assertEqual(self.atlas.network.calls['db_measurements'], 0)
+
+    def test_08_columns_of_sharded_clusters_and_aggregates(self):
+        metric = AtlasMeasurementTypes.Network.bytes_in
+        rows = self.report(clusters=0, sharded=1, columns=['name', 'network'],
+                           aggregations={AtlasMeasurementTypes.Cache.dirty: ['max']})
+        self.assertIn(f'atlas-s0-shard-1:{metric}', rows[0])
+        self.assertNotIn(f'atlas-s0-shard-1:{AtlasMeasurementTypes.Cache.dirty}', rows[0])
+        self.assertIsNotNone(rows[0][f'{AtlasMeasurementTypes.Cache.dirty}_max'])
+        with self.assertRaises(ValueError):
+            self.report(columns=['name', 'cpu'])
+
+        # The points of every shard are reduced together, a cluster without a primary gets the columns too.
+        column = f'{AtlasMeasurementTypes.Cache.dirty}_above_-1'
+        replica_set, sharded = self.report(clusters=1, sharded=1,
+                                           aggregations={AtlasMeasurementTypes.Cache.dirty: ['above_-1']})
+        self.assertEqual(sharded[column], 3 * replica_set[column])
+        rows = self.report(clusters=1, hosts=0, aggregations={AtlasMeasurementTypes.Cache.dirty: ['above_-1']})
+        self.assertIsNone(rows[0][column])
+
+    def test_09_typed_dataframe(self):
+        self.atlas = fake_atlas(now=self.now, clusters=2, sharded=1)
+        frame = Fleet(self.atlas).get_full_report_primary_metrics_df(GRANULARITY, PERIOD, capacity=1)
+        rows = self.report(clusters=2, sharded=1)
+        self.assertEqual(len(frame), 3)
+        self.assertEqual(frame[AtlasMeasurementTypes.Cache.used].tolist(),
+                         [each[AtlasMeasurementTypes.Cache.used] for each in rows])
+        self.assertEqual(frame['tier'].dtype, 'category')
+        self.assertEqual(frame[AtlasMeasurementTypes.Disk.Util.util].dtype, 'float64')
+        self.assertIn(f'atlas-s0-shard-1:{AtlasMeasurementTypes.Cache.used}', frame.columns)
+
+        # Clusters without a primary keep the fixed schema, with missing metrics.
+        frame = Fleet(fake_atlas(now=self.now, clusters=2, hosts=0)).get_full_report_primary_metrics_df(
+            GRANULARITY, PERIOD, columns=['name', 'cache', 'databases'])
+        self.assertEqual(list(frame.columns)[:2], ['name', AtlasMeasurementTypes.Cache.used])
+        self.assertTrue(frame[AtlasMeasurementTypes.Cache.used].isna().all())
+        self.assertTrue(frame['databases'].isna().all())
+
+    def test_10_config_in_cluster_names(self):
+        rows = self.report(clusters=1, sharded=1, name_prefix='app-config-')
+        self.assertEqual([each['name'] for each in rows], ['app-config-c0', 'app-config-s0'])
+        for each in rows:
+            self.assertIsNotNone(each[AtlasMeasurementTypes.Cache.used])
+            self.assertEqual(each['databases'], 4)
+        self.assertIn(f'atlas-app-config-s0-shard-2:{AtlasMeasurementTypes.Cache.used}', rows[1])
+        self.assertNotIn(f'atlas-app-config-s0-config-0:{AtlasMeasurementTypes.Cache.used}', rows[1])
+
+    def test_11_member_roles_of_config_in_cluster_names(self):
+        atlas = fake_atlas(now=self.now, clusters=1, sharded=1, name_prefix='app-config-')
+        rows = list(Fleet(atlas).get_full_report_member_metrics(GRANULARITY, PERIOD))
+        self.assertEqual((rows[0]['primary_members'], rows[0]['secondary_members']), (1, 2))
+        self.assertNotIn('config_members', rows[0])
+        self.assertEqual((rows[1]['primary_members'], rows[1]['secondary_members'], rows[1]['config_members']),
+                         (3, 6, 3))
+        self.assertIsNotNone(rows[1][f'primary_max:{AtlasMeasurementTypes.Cache.used}'])
+
+    def test_12_all_projects_are_paged(self):
+        projects = [f'g{i}' for i in range(1, 6)]
+        atlas = fake_atlas(now=self.now, clusters=1, projects=projects, max_items_per_page=2)
+        fleet = Fleet(atlas, all_projects=True)
+        self.assertEqual(list(fleet.projects), projects)
+        self.assertEqual(atlas.network.calls['projects'], 3)
+
+    def test_13_journal_resume_keeps_fleet_order_and_parameters(self):
+        journal = ReportJournal(':memory:')
+        atlas = fake_atlas(now=self.now, clusters=3)
+        route = atlas.network.route
+
+        def route_failing_c0(uri: str, params=None) -> dict:
+            if '/processes/c0-' in uri:
+                raise ErrAtlasServerErrors(500, {'detail': 'Internal server error'})
+            return route(uri, params)
+
+        atlas.network.route = route_failing_c0
+        rows = list(Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, PERIOD, journal=journal))
+        self.assertEqual([each['name'] for each in rows], ['c1', 'c2'])
+        self.assertEqual(list(journal.failures()), ['c0'])
+
+        # The failed cluster is fetched again, and yielded before the finished ones.
+        atlas = fake_atlas(now=self.now, clusters=3)
+        rows = list(Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, PERIOD, journal=journal, resume=True))
+        self.assertEqual([each['name'] for each in rows], ['c0', 'c1', 'c2'])
+        self.assertEqual(atlas.network.calls['host_measurements'], 1)
+
+        # Rows built with other columns, or another period, are not replayed.
+        atlas = fake_atlas(now=self.now, clusters=3)
+        rows = list(Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, PERIOD, journal=journal, resume=True,
+                                                                 columns=['name', 'disk']))
+        self.assertEqual([each['name'] for each in rows], ['c0', 'c1', 'c2'])
+        self.assertNotIn('collections', rows[0])
+        self.assertEqual(atlas.network.calls['disk'], 3)
+        atlas = fake_atlas(now=self.now, clusters=3)
+        rows = list(Fleet(atlas).get_full_report_primary_metrics(GRANULARITY, AtlasPeriods.HOURS_24, journal=journal,
+                                                                 resume=True, columns=['name', 'disk']))
+        self.assertEqual(atlas.network.calls['disk'], 3)
+        self.assertEqual({each['Period'] for each in journal.completed().values()}, {AtlasPeriods.HOURS_24})
+
+    def test_14_series_store_alternating_periods(self):
+        store = SeriesStore(':memory:')
+
+        def report(period: AtlasPeriods, series_store=None) -> dict:
+            # The incremental requests use start/end from the current time, so the fake follows the clock too.
+            self.atlas = fake_atlas(clusters=1)
+            return list(Fleet(self.atlas, series_store=series_store).get_full_report_primary_metrics(
+                GRANULARITY, period))[0]
+
+        report(PERIOD, store)
+        week_points = self.atlas.network.points
+        report(AtlasPeriods.HOURS_1, store)
+        self.assertLess(self.atlas.network.points, week_points)
+        # The short period left the week of points in the store, so only the new points are requested.
+        row = report(PERIOD, store)
+        self.assertLess(self.atlas.network.points, week_points)
+        self.assertEqual(row, report(PERIOD))
+
+        # A store which only covers the short period is filled in over the whole period.
+        store = SeriesStore(':memory:')
+        report(AtlasPeriods.HOURS_1, store)
+        row = report(PERIOD, store)
+        self.assertEqual(self.atlas.network.points, week_points)
+        self.assertEqual(row, report(PERIOD))
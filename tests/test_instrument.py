@@ -0,0 +1,79 @@
+from atlas_instrument import Instrumentation, InstrumentedNetwork, endpoint_of, instrument
+from atlas_lib import Fleet
+from atlas_ratelimit import TokenBucket, ThrottledNetwork, throttle
+from atlas_sinks import CSVSink
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from tests.fake_atlas import fake_atlas
+import os
+import tempfile
+import unittest
+
+PROCESS_URI = 'https://cloud.mongodb.com/api/atlas/v1.0/groups/g1/processes/c0-shard-00-01.abc.mongodb.net:27017/' \
+              'databases/db1/measurements?granularity=PT1H'
+
+
+class InstrumentationTests(unittest.TestCase):
+    def test_00_endpoint_templates(self):
+        self.assertEqual(endpoint_of(PROCESS_URI),
+                         ('/groups/{group}/processes/{host}/databases/{database}/measurements', 'c0'))
+        self.assertEqual(endpoint_of('https://cloud.mongodb.com/api/atlas/v1.0/groups/g1/clusters'),
+                         ('/groups/{group}/clusters', ''))
+        self.assertEqual(endpoint_of('https://cloud.mongodb.com/api/atlas/v1.0/groups/g1/clusters/big'),
+                         ('/groups/{group}/clusters/{cluster}', 'big'))
+        # Cluster names holding -config- are not cut short, on the shards nor on the config servers.
+        for each_host in ('app-config-store-shard-01-02.abc.mongodb.net', 'app-config-store-config-00-00.abc.net'):
+            self.assertEqual(endpoint_of(f'https://cloud.mongodb.com/api/atlas/v1.0/groups/g1/processes/'
+                                         f'{each_host}:27017/measurements')[1], 'app-config-store')
+        self.assertEqual(endpoint_of('/api/atlas/v1.0/groups/g1/processes/app-config-00-01.abc.net:27017/disks')[1],
+                         'app')
+
+    def test_01_fleet_records_calls_and_stages(self):
+        instrumentation = Instrumentation()
+        atlas = fake_atlas(clusters=2, databases=3, throttle_rate=0.2, seed=2)
+        fleet = Fleet(atlas, instrumentation=instrumentation)
+        throttle(atlas, TokenBucket(rate=10000), backoff=0.001)
+        self.assertIsInstance(atlas.network, ThrottledNetwork)
+        self.assertIsInstance(atlas.network.network, InstrumentedNetwork)
+        with tempfile.TemporaryDirectory() as directory:
+            CSVSink(os.path.join(directory, 'report.csv')).write(
+                fleet.get_full_report_primary_metrics(AtlasGranularities.HOUR, AtlasPeriods.WEEKS_1),
+                instrumentation=instrumentation)
+
+        endpoints = instrumentation.endpoints()
+        network = atlas.network.network.network
+        self.assertEqual(sum(each.calls - each.retries for each in endpoints.values()), network.requests)
+        self.assertEqual(sum(each.retries for each in endpoints.values()), network.throttled)
+        self.assertEqual(endpoints['/groups/{group}/processes/{host}/databases/{database}/measurements'].calls -
+                         endpoints['/groups/{group}/processes/{host}/databases/{database}/measurements'].retries, 6)
+        self.assertGreater(endpoints['/groups/{group}/processes/{host}/measurements'].bytes, 0)
+        self.assertEqual(list(instrumentation.stages()),
+                         ['discovery', 'host_lookup', 'metrics', 'namespaces', 'export'])
+        self.assertEqual(instrumentation.stages()['metrics'].runs, 2)
+        self.assertEqual(sorted(instrumentation.clusters()), ['c0', 'c1'])
+        self.assertIn('Slowest 10 clusters', instrumentation.summary())
+
+    def test_02_instrument_twice_swaps(self):
+        atlas = fake_atlas()
+        first = instrument(atlas, Instrumentation())
+        second = Instrumentation()
+        self.assertIs(instrument(atlas, second), first)
+        self.assertIs(first.instrumentation, second)
+
+    def test_03_openmetrics(self):
+        instrumentation = Instrumentation()
+        instrumentation.record_call(PROCESS_URI, 0.07, 100)
+        instrumentation.record_call(PROCESS_URI, 60.0, code=429)
+        instrumentation.record_stage('metrics', 1.5, 'c0')
+        text = instrumentation.openmetrics()
+        self.assertIn('# TYPE atlas_api_requests counter', text)
+        self.assertIn('atlas_api_requests_total{endpoint="/groups/{group}/processes/{host}/databases/{database}/'
+                      'measurements",cluster="c0"} 2', text)
+        self.assertIn('atlas_api_retries_total{', text)
+        self.assertIn('le="0.05"} 0', text)
+        self.assertIn('le="0.1"} 1', text)
+        self.assertIn('le="+Inf"} 2', text)
+        self.assertIn('atlas_report_stage_seconds_total{stage="metrics",cluster="c0"} 1.5', text)
+        self.assertTrue(text.endswith('# EOF\n'))
+        prometheus = instrumentation.openmetrics(openmetrics=False)
+        self.assertIn('# TYPE atlas_api_requests_total counter', prometheus)
+        self.assertNotIn('# EOF', prometheus)
@@ -0,0 +1,100 @@
+from atlas_lib import CompactMeasurement, Fleet, HostData, HOST_METRIC_ATTRIBUTES, METRICS, DISK_METRICS, \
+    measurements_from_response, register_metric
+from atlasapi.specs import AtlasPeriods, AtlasGranularities, AtlasMeasurementTypes, Host
+from atlasapi.errors import ErrAtlasServerErrors
+from tests.fake_atlas import fake_atlas
+import numpy as np
+import unittest
+
+RESPONSE = {'measurements': [{'name': 'CONNECTIONS', 'units': 'SCALAR',
+                              'dataPoints': [{'timestamp': '2022-01-01T00:00:00Z', 'value': 4},
+                                             {'timestamp': '2022-01-01T01:00:00Z', 'value': None},
+                                             {'timestamp': '2022-01-01T02:00:00Z', 'value': 0},
+                                             {'timestamp': '2022-01-01T03:00:00Z', 'value': 8}]}]}
+
+
+class CompactMeasurementTests(unittest.TestCase):
+    def setUp(self):
+        self.measurement = next(measurements_from_response(RESPONSE, granularity=AtlasGranularities.HOUR,
+                                                           period=AtlasPeriods.WEEKS_1))
+
+    def test_00_buffers(self):
+        self.assertEqual(self.measurement.name, 'CONNECTIONS')
+        self.assertEqual(self.measurement.measurements_count, 4)
+        self.assertEqual(self.measurement.values.dtype, np.float64)
+        self.assertEqual(self.measurement.date_start, np.datetime64('2022-01-01T00:00:00'))
+        self.assertEqual(self.measurement.date_end, np.datetime64('2022-01-01T03:00:00'))
+
+    def test_01_stats_skip_missing_and_zero(self):
+        stats = self.measurement.measurement_stats
+        self.assertEqual(stats.samples, 2)
+        self.assertEqual(stats.mean, 6.0)
+        self.assertEqual(stats.min, 4.0)
+        self.assertEqual(stats.max, 8.0)
+
+    def test_02_drop_points_keeps_stats(self):
+        self.measurement.drop_points()
+        self.assertEqual(self.measurement.measurements_count, 0)
+        self.assertIsNone(self.measurement.values)
+        self.assertEqual(self.measurement.measurement_stats.max, 8.0)
+
+    def test_03_empty(self):
+        empty = CompactMeasurement.from_dict({'name': 'CONNECTIONS'}, AtlasGranularities.HOUR, AtlasPeriods.WEEKS_1)
+        self.assertEqual(empty.measurement_stats.max, 0.0)
+        self.assertIsNone(empty.date_start)
+
+
+class MetricRegistryTests(unittest.TestCase):
+    def measurement(self, name: str) -> CompactMeasurement:
+        return CompactMeasurement.from_dict({'name': name, 'dataPoints': RESPONSE['measurements'][0]['dataPoints']},
+                                            AtlasGranularities.HOUR, AtlasPeriods.WEEKS_1)
+
+    def test_00_every_metric_has_a_slot(self):
+        host_data = HostData(None)
+        for each_name in METRICS + DISK_METRICS:
+            self.assertTrue(host_data.store_measurement(self.measurement(each_name)))
+            self.assertEqual(host_data.metric(each_name).name, each_name)
+        self.assertEqual(host_data.disk_iops_write_max.name, AtlasMeasurementTypes.Disk.IOPS.write_max)
+        self.assertFalse(host_data.store_measurement(self.measurement('NOT_A_METRIC')))
+
+    def test_01_register_metric(self):
+        name = AtlasMeasurementTypes.connections
+        register_metric(name)
+        try:
+            self.assertIn(name, METRICS)
+            host_data = HostData(None, keep_points=False)
+            self.assertTrue(host_data.store_measurement(self.measurement(name)))
+            self.assertEqual(host_data.extra_metrics[name].measurement_stats.max, 8.0)
+            self.assertIsNone(host_data.extra_metrics[name].values)
+        finally:
+            METRICS.remove(name)
+            del HOST_METRIC_ATTRIBUTES[name]
+
+    def test_02_series_chunk(self):
+        host_data = HostData(Host(dict(hostname='host0', port=27017, groupId='g1', typeName='REPLICA_PRIMARY',
+                                       created='2020-01-01T00:00:00Z')))
+        for each_name in (AtlasMeasurementTypes.Cache.used, AtlasMeasurementTypes.Disk.IOPS.write_max):
+            host_data.store_measurement(self.measurement(each_name))
+        chunk = host_data.series_chunk('cluster0')
+        self.assertEqual(list(chunk), ['cluster', 'host', 'metric', 'timestamp', 'value'])
+        self.assertEqual(chunk['value'].tolist(), [4.0, 0.0, 8.0, 4.0, 0.0, 8.0])
+        self.assertEqual(chunk['metric'].tolist(), [AtlasMeasurementTypes.Cache.used] * 3 +
+                         [AtlasMeasurementTypes.Disk.IOPS.write_max] * 3)
+        self.assertEqual(set(chunk['host'].tolist()), {'host0:27017'})
+        self.assertEqual(chunk['timestamp'][1], np.datetime64('2022-01-01T02:00:00'))
+
+
+class StoreMeasurementsTests(unittest.TestCase):
+    def test_00_failed_metric_falls_back_to_single_requests(self):
+        failing = AtlasMeasurementTypes.Cache.dirty
+        atlas = fake_atlas(clusters=1, failing_metrics=[failing])
+        host_data = HostData(next(iter(Fleet(atlas).clusters_list)).primary(atlas), keep_points=False)
+        host_data.store_measurements(atlas, granularity=AtlasGranularities.HOUR, period=AtlasPeriods.WEEKS_1)
+        self.assertEqual(list(host_data.errors), [failing])
+        self.assertIsInstance(host_data.errors[failing], ErrAtlasServerErrors)
+        self.assertIsNone(host_data.metric(failing))
+        for each_name in METRICS + DISK_METRICS:
+            if each_name != failing:
+                self.assertIsNotNone(host_data.metric(each_name), each_name)
+        # The batched request failed, then every metric was requested on its own.
+        self.assertEqual(atlas.network.calls['host_measurements'], len(METRICS) - 1)
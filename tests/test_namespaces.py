@@ -0,0 +1,84 @@
+from atlas_async import AsyncFleet
+from atlas_lib import Fleet, NamespaceCounter
+from atlasapi.measurements import AtlasMeasurementTypes
+from atlasapi.specs import AtlasPeriods, AtlasGranularities
+from tests.fake_atlas import FakeAtlasNetwork, fake_atlas, fake_async_client
+import asyncio
+import time
+import unittest
+
+GRANULARITY = AtlasGranularities.HOUR
+PERIOD = AtlasPeriods.WEEKS_1
+
+
+class NamespaceCounterTests(unittest.TestCase):
+    def setUp(self):
+        self.now = time.time()
+
+    def report(self, counter: NamespaceCounter = None, **kwargs) -> list:
+        self.atlas = fake_atlas(now=self.now, clusters=1, **kwargs)
+        return list(Fleet(self.atlas, namespace_counter=counter).get_full_report_primary_metrics(GRANULARITY, PERIOD))
+
+    def test_00_exact_counts_latest_values(self):
+        row = self.report(databases=3)[0]
+        self.assertFalse(row['namespaces_estimated'])
+        self.assertEqual(row['namespaces_sampled'], 3)
+        self.assertIsNone(row['collections_margin'])
+        # Each database reports the latest daily value of the fake series, offset by 100 per database.
+        latest = float(int(self.now // 86400 * 86400) % 997)
+        self.assertEqual(row['collections'], 3 * latest + 300)
+        self.assertEqual(self.atlas.network.calls['db_measurements'], 3)
+
+    def test_01_only_requested_counters_are_fetched(self):
+        self.report(databases=3)
+        every_counter = self.atlas.network.points
+        row = self.report(NamespaceCounter([AtlasMeasurementTypes.Namespaces.collection_count]), databases=3)[0]
+        self.assertLess(self.atlas.network.points, every_counter)
+        self.assertIsNotNone(row['collections'])
+        self.assertIsNone(row['views'])
+
+    def test_02_sampled_counts_are_estimated(self):
+        exact = self.report(databases=20)[0]['collections']
+        row = self.report(NamespaceCounter(max_databases=8, seed=3), databases=20)[0]
+        self.assertEqual(self.atlas.network.calls['db_measurements'], 8)
+        self.assertTrue(row['namespaces_estimated'])
+        self.assertEqual(row['namespaces_sampled'], 8)
+        self.assertEqual(row['databases'], 20)
+        self.assertGreater(row['collections_margin'], 0)
+        self.assertLessEqual(abs(row['collections'] - exact), row['collections_margin'])
+        # The same seed draws the same sample.
+        self.assertEqual(self.report(NamespaceCounter(max_databases=8, seed=3), databases=20)[0], row)
+
+    def test_03_time_budget(self):
+        row = self.report(NamespaceCounter(max_seconds=0.0, max_workers=2), databases=10, latency=0.01)[0]
+        self.assertEqual(row['namespaces_sampled'], 2)
+        self.assertTrue(row['namespaces_estimated'])
+
+    def test_04_estimation_bounds(self):
+        stats = NamespaceCounter(confidence=0.95).stats(4, [{'collections': 1.0, 'indexes': 2.0, 'views': 0.0,
+                                                             'objects': 5.0},
+                                                            {'collections': 3.0, 'indexes': 2.0, 'views': 0.0,
+                                                             'objects': 5.0}])
+        self.assertEqual(stats.collections, 8.0)
+        # 1.96 * N * sd / sqrt(n) * sqrt((N - n) / (N - 1)), sd = sqrt(2)
+        self.assertAlmostEqual(stats.errors['collections'], 1.959964 * 4 * (2 / 3) ** 0.5, places=4)
+        self.assertEqual(stats.errors['indexes'], 0.0)
+        exact = NamespaceCounter().stats(2, [{'collections': 1.0}, {'collections': 3.0}])
+        self.assertFalse(exact.estimated)
+        self.assertEqual(exact.collections, 4.0)
+
+    def test_05_sharded_clusters_count_every_shard(self):
+        replica_set, sharded = self.report(sharded=1, databases=3)
+        self.assertEqual(self.atlas.network.calls['db_measurements'], 3 + 3 * 3)
+        self.assertEqual(sharded['databases'], 3)
+        self.assertEqual(sharded['objects'], 3 * replica_set['objects'])
+        self.assertEqual(sharded['indexes'], 3 * replica_set['indexes'])
+        self.assertEqual(sharded['collections'], replica_set['collections'])
+
+        network = FakeAtlasNetwork(clusters=1, sharded=1, databases=3, now=self.now)
+
+        async def report() -> list:
+            async with fake_async_client(network) as client:
+                return [each async for each in AsyncFleet(client).report(GRANULARITY, PERIOD)]
+
+        self.assertEqual(asyncio.run(report())[1]['objects'], sharded['objects'])
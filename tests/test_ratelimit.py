@@ -0,0 +1,49 @@
+from atlas_ratelimit import TokenBucket, ThrottledNetwork
+from atlasapi.errors import ErrAtlasServerErrors, ErrAtlasNotFound
+import time
+import unittest
+
+
+class FlakyNetwork:
+    def __init__(self, failures: int, code: int = 429):
+        self.failures = failures
+        self.code = code
+        self.calls = 0
+
+    def get(self, uri):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.code == 404:
+                raise ErrAtlasNotFound(self.code, {})
+            raise ErrAtlasServerErrors(self.code, {})
+        return {'uri': uri}
+
+
+class RateLimitTests(unittest.TestCase):
+
+    def test_00_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_01_retries_429(self):
+        network = FlakyNetwork(failures=2)
+        throttled = ThrottledNetwork(network, TokenBucket(rate=1000), backoff=0.01)
+        self.assertEqual(throttled.get('a'), {'uri': 'a'})
+        self.assertEqual(network.calls, 3)
+
+    def test_02_gives_up_after_max_retries(self):
+        network = FlakyNetwork(failures=10)
+        throttled = ThrottledNetwork(network, TokenBucket(rate=1000), max_retries=2, backoff=0.01)
+        with self.assertRaises(ErrAtlasServerErrors):
+            throttled.get('a')
+        self.assertEqual(network.calls, 3)
+
+    def test_03_other_errors_not_retried(self):
+        network = FlakyNetwork(failures=1, code=404)
+        throttled = ThrottledNetwork(network, TokenBucket(rate=1000), backoff=0.01)
+        with self.assertRaises(ErrAtlasNotFound):
+            throttled.get('a')
+        self.assertEqual(network.calls, 1)
@@ -0,0 +1,175 @@
+from atlas_sinks import GoogleSheetSink, CSVSink, ExcelSink, ParquetSink, SQLiteSeriesSink, ParquetSeriesSink, \
+    DataFrameSink, normalize_value, pyarrow
+from atlasapi.clusters import InstanceSizeName
+import numpy as np
+import csv
+import os
+import sqlite3
+import tempfile
+import unittest
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.bodies = []
+
+    def batch_update(self, body: dict) -> dict:
+        self.bodies.append(body)
+        return {}
+
+
+class FakeWorksheet:
+    id = 7
+    row_count = 2
+    col_count = 1
+
+    def __init__(self):
+        self.spreadsheet = FakeSpreadsheet()
+
+
+class GoogleSheetSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.worksheet = FakeWorksheet()
+        self.sink = GoogleSheetSink(self.worksheet, batch_rows=10, status_interval=3600)
+
+    def test_00_normalize(self):
+        self.assertEqual(normalize_value(InstanceSizeName.M10), 'M10')
+        self.assertEqual(self.sink.cell(InstanceSizeName.M10), {'userEnteredValue': {'stringValue': 'M10'}})
+        self.assertEqual(self.sink.cell(float('nan')), {})
+        self.assertEqual(self.sink.cell(True), {'userEnteredValue': {'boolValue': True}})
+
+    def test_01_batches(self):
+        rows = [{'name': f'cluster{each}', 'tier': InstanceSizeName.M10} for each in range(25)]
+        rows[-1]['CACHE_USED_BYTES'] = 1.5
+        self.assertEqual(self.sink.write(rows), 25)
+        # The first status, two full batches, and the last batch with the final status.
+        self.assertEqual(self.sink.api_calls, 4)
+        self.assertEqual(self.sink.header, ['name', 'tier', 'CACHE_USED_BYTES'])
+        last = self.worksheet.spreadsheet.bodies[-1]['requests']
+        self.assertEqual(last[0]['appendDimension'], {'sheetId': 7, 'dimension': 'ROWS', 'length': 5})
+        self.assertEqual(last[1]['appendDimension']['dimension'], 'COLUMNS')
+        self.assertEqual(last[2]['updateCells']['start']['rowIndex'], GoogleSheetSink.HEADER_ROW)
+        data = last[3]['updateCells']
+        self.assertEqual(data['start']['rowIndex'], 22)
+        self.assertEqual(data['rows'][-1]['values'][2], {'userEnteredValue': {'numberValue': 1.5}})
+        self.assertEqual(last[4]['updateCells']['rows'][0]['values'][0]['userEnteredValue'],
+                         {'stringValue': 'COMPLETE!'})
+
+    def test_02_name_key(self):
+        self.assertEqual(self.sink.write([{'name': 'cluster0', 'id': 'id0'}], 'id'), 1)
+        first = self.worksheet.spreadsheet.bodies[0]['requests']
+        self.assertEqual(first[0]['updateCells']['rows'][0]['values'][0]['userEnteredValue'],
+                         {'stringValue': 'Received data for id0'})
+
+
+class FileSinkTests(unittest.TestCase):
+    ROWS = [{'name': 'cluster0', 'tier': InstanceSizeName.M10},
+            {'name': 'cluster1', 'tier': InstanceSizeName.M30, 'CACHE_USED_BYTES': 1.5},
+            {'name': 'cluster2', 'tier': InstanceSizeName.M30, 'CACHE_USED_BYTES': 2.5, 'late': 1}]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def test_00_csv(self):
+        self.assertEqual(CSVSink(self.path('report.csv'), batch_rows=2).write(self.ROWS), 3)
+        with open(self.path('report.csv'), newline='') as csv_file:
+            self.assertEqual(list(csv.reader(csv_file)), [['name', 'tier', 'CACHE_USED_BYTES'],
+                                                          ['cluster0', 'M10', ''],
+                                                          ['cluster1', 'M30', '1.5'],
+                                                          ['cluster2', 'M30', '2.5']])
+
+    def test_01_excel(self):
+        self.assertEqual(ExcelSink(self.path('report.xlsx'), columns=['name', 'tier']).write(self.ROWS), 3)
+        self.assertTrue(os.path.getsize(self.path('report.xlsx')) > 0)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_02_parquet(self):
+        sink = ParquetSink(self.path('report.parquet'), batch_rows=1)
+        self.assertEqual(sink.write(self.ROWS), 3)
+        parquet_file = pyarrow.parquet.ParquetFile(self.path('report.parquet'))
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        table = parquet_file.read()
+        self.assertEqual(table.column_names, ['name', 'tier'])
+        self.assertEqual(table.column('tier').to_pylist(), ['M10', 'M30', 'M30'])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_03_arrow(self):
+        ParquetSink(self.path('report.arrow'), batch_rows=2, file_format='arrow').write(self.ROWS[1:])
+        table = pyarrow.ipc.open_file(self.path('report.arrow')).read_all()
+        self.assertEqual(table.column('CACHE_USED_BYTES').to_pylist(), [1.5, 2.5])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_04_parquet_types_across_batches(self):
+        rows = [{'x': 1, 'y': None}, {'x': 2.7, 'y': 'a'}, {'x': 'bad', 'y': 'b'}]
+        with self.assertLogs('atlas_sinks', 'WARNING'):
+            ParquetSink(self.path('report.parquet'), batch_rows=1).write(rows)
+        table = pyarrow.parquet.read_table(self.path('report.parquet'))
+        self.assertEqual(table.column('x').to_pylist(), [1.0, 2.7, None])
+        self.assertEqual(table.column('y').to_pylist(), [None, 'a', 'b'])
+        self.assertEqual(str(table.schema.field('y').type), 'string')
+
+        ParquetSink(self.path('typed.parquet'), batch_rows=1,
+                    schema={'name': 'string', 'shards': 'int', 'tier': 'category'}).write(self.ROWS)
+        table = pyarrow.parquet.read_table(self.path('typed.parquet'))
+        self.assertEqual(table.column_names, ['name', 'shards', 'tier'])
+        self.assertEqual(str(table.schema.field('shards').type), 'int64')
+        self.assertEqual(table.column('tier').to_pylist(), ['M10', 'M30', 'M30'])
+
+
+class DataFrameSinkTests(unittest.TestCase):
+    def test_00_typed_columns(self):
+        sink = DataFrameSink({'name': 'string', 'tier': 'category', 'shards': 'int', 'namespaces_estimated': 'bool',
+                              'CACHE_USED_BYTES': 'float'}, capacity=2)
+        self.assertEqual(sink.write(FileSinkTests.ROWS + [{'name': 'cluster3', 'shards': 3}]), 4)
+        frame = sink.frame
+        self.assertEqual(list(frame.columns), ['name', 'tier', 'shards', 'namespaces_estimated', 'CACHE_USED_BYTES',
+                                               'late'])
+        self.assertEqual(frame['CACHE_USED_BYTES'].dtype, np.float64)
+        self.assertTrue(np.isnan(frame['CACHE_USED_BYTES'][0]))
+        self.assertEqual(list(frame['tier'].cat.categories), ['M10', 'M30'])
+        self.assertEqual(str(frame['shards'].dtype), 'Int64')
+        self.assertEqual(frame['shards'].isna().tolist(), [True, True, True, False])
+        self.assertEqual(str(frame['namespaces_estimated'].dtype), 'boolean')
+        self.assertEqual(frame['late'].tolist()[2], 1.0)
+
+    def test_01_frame_after_close(self):
+        with self.assertRaises(RuntimeError):
+            DataFrameSink().frame
+        with self.assertRaises(ValueError):
+            DataFrameSink({'name': 'text'})
+
+
+class SeriesSinkTests(unittest.TestCase):
+    CHUNK = {'cluster': np.array(['cluster0', 'cluster0'], dtype=object),
+             'host': np.array(['host0:27017', 'host0:27017'], dtype=object),
+             'metric': np.array(['CACHE_USED_BYTES', 'CONNECTIONS'], dtype=object),
+             'timestamp': np.array(['2022-01-01T00:00:00', '2022-01-01T01:00:00'], dtype='datetime64[s]'),
+             'value': np.array([1.5, 3.0])}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_00_sqlite(self):
+        path = os.path.join(self.directory.name, 'series.sqlite')
+        self.assertEqual(SQLiteSeriesSink(path).write([self.CHUNK, self.CHUNK]), 4)
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute('SELECT * FROM series LIMIT 1').fetchone(),
+                         ('cluster0', 'host0:27017', 'CACHE_USED_BYTES', 1640995200, 1.5))
+        conn.close()
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_01_parquet(self):
+        path = os.path.join(self.directory.name, 'series.parquet')
+        self.assertEqual(ParquetSeriesSink(path).write([self.CHUNK, self.CHUNK]), 4)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column('value').to_pylist(), [1.5, 3.0, 1.5, 3.0])
+        self.assertEqual(table.column('metric').to_pylist()[1], 'CONNECTIONS')
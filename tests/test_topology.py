@@ -0,0 +1,78 @@
+from atlas_lib import CompactMeasurement, HostData, HostInventory, cluster_topology, member_role, role_aggregates
+from atlasapi.specs import AtlasGranularities, AtlasPeriods, Host
+import unittest
+
+SHARDED_CLUSTER = {'name': 'sharded', 'numShards': 2, 'replicationSpecs': [
+    {'numShards': 2, 'regionsConfig': {'EU_WEST_1': {'electableNodes': 2, 'analyticsNodes': 1, 'readOnlyNodes': 0},
+                                       'EU_CENTRAL_1': {'electableNodes': 1, 'readOnlyNodes': 1}}},
+    {'numShards': 1, 'regionsConfig': {'US_WEST_2': {'electableNodes': 3}}}]}
+
+
+def host(hostname: str, replica_set_name: str, type_name: str = 'REPLICA_PRIMARY') -> Host:
+    return Host(dict(hostname=hostname, port=27017, groupId='g1', typeName=type_name,
+                     replicaSetName=replica_set_name, created='2020-01-01T00:00:00Z'))
+
+
+def member(each_host: Host, cache_used: float) -> HostData:
+    host_data = HostData(each_host)
+    host_data.store_measurement(CompactMeasurement.from_dict(
+        {'name': 'CACHE_USED_BYTES', 'dataPoints': [{'timestamp': '2022-01-01T00:00:00Z', 'value': cache_used}]},
+        AtlasGranularities.HOUR, AtlasPeriods.WEEKS_1))
+    return host_data
+
+
+class TopologyTests(unittest.TestCase):
+    def test_00_topology_adds_up_regions_and_specs(self):
+        self.assertEqual(dict(cluster_topology(SHARDED_CLUSTER)),
+                         {'shards': 3, 'electable': 6, 'analytics': 1, 'ro': 1,
+                          'regions': 'EU_WEST_1,EU_CENTRAL_1,US_WEST_2'})
+
+    def test_01_topology_without_specs(self):
+        self.assertEqual(cluster_topology({'numShards': 1})['shards'], 1)
+
+    def test_02_shard_primaries(self):
+        inventory = HostInventory(None, ttl=None)
+        inventory.load([host('sharded-shard-01-00.abc.mongodb.net', 'atlas-abc-shard-1'),
+                        host('sharded-shard-01-01.abc.mongodb.net', 'atlas-abc-shard-1', 'REPLICA_SECONDARY'),
+                        host('sharded-shard-00-01.abc.mongodb.net', 'atlas-abc-shard-0', 'SHARD_PRIMARY'),
+                        host('sharded-config-00-00.abc.mongodb.net', 'atlas-abc-config-0')])
+        primaries = inventory.shard_primaries('sharded')
+        self.assertEqual(list(primaries), ['atlas-abc-shard-0', 'atlas-abc-shard-1'])
+        self.assertEqual(inventory.primary('sharded').hostname, 'sharded-shard-00-01.abc.mongodb.net')
+        self.assertEqual(inventory.shard_primaries('other'), {})
+
+    def test_03_member_roles(self):
+        self.assertEqual(member_role(host('c-shard-00-00.abc.mongodb.net', 'rs0', 'SHARD_SECONDARY')), 'secondary')
+        self.assertEqual(member_role(host('c-config-00-00.abc.mongodb.net', 'cfg', 'SHARD_CONFIG_PRIMARY')), 'config')
+        self.assertEqual(member_role(host('c-config-00-01.abc.mongodb.net', 'cfg', 'SHARD_CONFIG_SECONDARY')), 'config')
+        self.assertEqual(member_role(host('c-config-00-00.abc.mongodb.net', 'atlas-abc-config-0')), 'config')
+        # The role comes from the host type, not from a cluster name holding -config-.
+        self.assertEqual(member_role(host('app-config-store-shard-00-00.abc.mongodb.net', 'atlas-abc-shard-0')),
+                         'primary')
+        self.assertEqual(member_role(host('app-config-store-shard-00-01.abc.mongodb.net', 'atlas-abc-shard-0',
+                                          'REPLICA_SECONDARY')), 'secondary')
+        self.assertEqual(member_role(host('c-shard-00-00.abc.mongodb.net', 'rs0', 'SHARD_MONGOS')), 'mongos')
+
+    def test_04_role_aggregates(self):
+        members = {'a': member(host('c-shard-00-01.abc.mongodb.net', 'rs0', 'REPLICA_SECONDARY'), 5),
+                   'b': member(host('c-shard-00-00.abc.mongodb.net', 'rs0'), 7),
+                   'c': member(host('c-shard-00-02.abc.mongodb.net', 'rs0', 'REPLICA_SECONDARY'), 9)}
+        row = role_aggregates(members)
+        self.assertEqual(list(row)[0], 'primary_members')
+        self.assertEqual(row['secondary_members'], 2)
+        self.assertEqual(row['secondary_max:CACHE_USED_BYTES'], 9.0)
+        self.assertEqual(row['primary_max:CACHE_USED_BYTES'], 7.0)
+        self.assertIsNone(row['secondary_max:NETWORK_BYTES_IN'])
+
+    def test_05_config_in_cluster_name(self):
+        inventory = HostInventory(None, ttl=None)
+        inventory.load([host('app-config-store-shard-00-00.abc.mongodb.net', 'atlas-abc-shard-0'),
+                        host('app-config-store-shard-00-01.abc.mongodb.net', 'atlas-abc-shard-0', 'REPLICA_SECONDARY'),
+                        host('app-config-store-config-00-00.abc.mongodb.net', 'atlas-abc-config-0'),
+                        host('app-config-store-config-00-01.abc.mongodb.net', 'atlas-abc-config-0',
+                             'SHARD_CONFIG_SECONDARY')])
+        self.assertEqual(inventory.primary('app-config-store').hostname,
+                         'app-config-store-shard-00-00.abc.mongodb.net')
+        self.assertEqual(list(inventory.shard_primaries('app-config-store')), ['atlas-abc-shard-0'])
+        self.assertEqual(len(inventory.hosts('app-config-store')), 4)
+        self.assertEqual(inventory.hosts('app'), [])